@@ -0,0 +1,80 @@
+import unicodedata
+
+# Adresses des dossiers : chaque dossier référence ses adresses de chantier et
+# de facturation par id (adresse_chantier_id, adresse_facturation_id) ; les
+# colonnes texte restent une copie, mise à jour par trigger quand l'adresse
+# est renommée. Deux adresses ne diffèrent jamais que par les espaces, la
+# casse ou les accents : address_key, leur forme normalisée, est unique.
+# Ces fonctions reçoivent un curseur placé dans une transaction.
+
+ADDRESS_ROLES = {
+    'chantier': ('adresse_chantier', 'adresse_chantier_id'),
+    'facturation': ('adresse_facturation', 'adresse_facturation_id'),
+}
+
+def address_key(address):
+    """Forme normalisée d'une adresse : " 12 Rue des Lilas" -> "12 rue des lilas" """
+    text = unicodedata.normalize('NFKD', address or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.casefold().split())
+
+def key_prefix_range(prefix):
+    """Bornes [début, fin[ des clés commençant par prefix, pour une lecture d'index"""
+    start = address_key(prefix)
+    if not start:
+        return None
+    return start, start[:-1] + chr(ord(start[-1]) + 1)
+
+def resolve_address(cursor, address):
+    """Retourne (id, texte) de l'adresse équivalente, créée au besoin ; (None, '') si vide"""
+    address = (address or '').strip()
+    key = address_key(address)
+    if not key:
+        return None, ''
+    cursor.execute('INSERT OR IGNORE INTO addresses (address, address_key) VALUES (?, ?)', (address, key))
+    return tuple(cursor.execute('SELECT id, address FROM addresses WHERE address_key = ?', (key,)).fetchone())
+
+def dedupe_addresses(cursor):
+    """Calcule les clés manquantes et fusionne les adresses de même clé.
+
+    L'adresse de plus petit id est conservée ; les dossiers des doublons
+    sont reportés sur elle, avec son texte.
+    """
+    cursor.execute('SELECT id, address, address_key FROM addresses ORDER BY id')
+    kept = {}
+    merged = []
+    keys = []
+    for address_id, address, key in cursor.fetchall():
+        if key is None:
+            key = address_key(address)
+            keys.append((key, address_id))
+        if key in kept:
+            merged.append((kept[key], address_id))
+        else:
+            kept[key] = (address_id, address)
+
+    for (keep_id, keep_address), duplicate_id in merged:
+        for text_column, id_column in ADDRESS_ROLES.values():
+            cursor.execute(
+                f'UPDATE dossiers SET {id_column} = ?, {text_column} = ? WHERE {id_column} = ?',
+                (keep_id, keep_address, duplicate_id)
+            )
+    cursor.executemany('DELETE FROM addresses WHERE id = ?', [(duplicate_id,) for _, duplicate_id in merged])
+    cursor.executemany('UPDATE addresses SET address_key = ? WHERE id = ?', keys)
+    return len(merged)
+
+def link_dossier_addresses(cursor):
+    """Relie chaque dossier aux adresses équivalentes à ses textes, créées au besoin"""
+    cursor.execute('SELECT id, adresse_chantier, adresse_facturation FROM dossiers')
+    resolved = {}
+    rows = []
+    for dossier_id, *texts in cursor.fetchall():
+        ids = []
+        for text in texts:
+            key = address_key(text)
+            if key not in resolved:
+                resolved[key] = resolve_address(cursor, text)[0]
+            ids.append(resolved[key])
+        rows.append((*ids, dossier_id))
+    columns = ', '.join(f'{id_column} = ?' for _, id_column in ADDRESS_ROLES.values())
+    cursor.executemany(f'UPDATE dossiers SET {columns} WHERE id = ?', rows)
@@ -0,0 +1,22 @@
+import argparse
+from .database import archive_year
+
+# Archivage des années closes en ligne de commande :
+#   python -m src.database.archiver 2021 2022 --compress
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Déplace les dossiers d'années closes dans des archives annuelles")
+    parser.add_argument('annees', type=int, nargs='+', help="années à archiver")
+    parser.add_argument('--compress', action='store_true', help="compresser les archives (gzip)")
+    args = parser.parse_args(argv)
+    status = 0
+    for annee in args.annees:
+        try:
+            print(f"Année {annee} : {archive_year(annee, args.compress)} dossiers archivés")
+        except (ValueError, OSError) as e:
+            print(f"Année {annee} non archivée : {e}")
+            status = 1
+    return status
+
+if __name__ == '__main__':
+    raise SystemExit(main())
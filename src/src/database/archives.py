@@ -0,0 +1,176 @@
+import atexit
+import gzip
+import os
+import shutil
+import sqlite3
+import stat
+import tempfile
+import threading
+from pathlib import Path
+
+# Archives annuelles : les dossiers d'une année close (avec leurs produits,
+# options, pièces jointes et leur index plein texte) sont déplacés dans un
+# fichier SQLite autonome, en lecture seule et éventuellement compressé
+# (gzip), rangé à côté de la base dans le dossier "<base>_archives". La
+# table archives de la base principale en tient le registre,
+# archived_dossiers retrouve l'année d'un dossier archivé. Les ids
+# AUTOINCREMENT n'étant jamais réutilisés, un id désigne toujours un seul
+# dossier, archivé ou non. Une archive n'est attachée (ATTACH, schéma
+# "archive_AAAA") que sur la connexion qui la lit, au moment où une
+# requête en a besoin.
+
+ARCHIVED_TABLES = ('dossiers', 'produits', 'options', 'pieces_jointes', 'contenus')
+# Lignes recopiées de chaque table, une fois les dossiers de l'année copiés
+ARCHIVED_ROWS = {
+    'produits': 'dossier_id IN (SELECT id FROM main.dossiers)',
+    'options': 'dossier_id IN (SELECT id FROM main.dossiers)',
+    'pieces_jointes': 'dossier_id IN (SELECT id FROM main.dossiers)',
+    'contenus': 'id IN (SELECT contenu_id FROM main.pieces_jointes)',
+}
+FTS_TABLE = 'dossiers_fts'
+FTS_COLUMNS = 'numero_dossier, libelle_travaux, adresses, description, lignes'
+# SQLite limite à 10 le nombre de bases attachées par connexion
+MAX_ATTACHED_ARCHIVES = 8
+
+def archive_dir(db_path):
+    """Dossier des archives de la base db_path"""
+    return os.path.splitext(db_path)[0] + '_archives'
+
+def archive_filename(annee, compressed=False):
+    return f"facturation_{int(annee)}.db" + ('.gz' if compressed else '')
+
+def schema_name(annee):
+    """Nom sous lequel l'archive d'une année est attachée"""
+    return f"archive_{int(annee)}"
+
+def _copy_columns(conn, table):
+    # Colonnes à recopier : les colonnes générées (annee, numero...) sont recalculées
+    return ', '.join(row[1] for row in conn.execute(f'PRAGMA source.table_xinfo({table})') if row[6] == 0)
+
+def build_archive(source_database, annee, path):
+    """Écrit dans path une base autonome avec les dossiers de l'année ; retourne leur nombre.
+
+    Lit la base source depuis une connexion séparée : appelée pendant la
+    transaction d'écriture de l'archivage, elle voit l'état déjà validé.
+    """
+    out = sqlite3.connect(path, isolation_level=None, uri=True)
+    try:
+        out.execute('ATTACH DATABASE ? AS source', (source_database,))
+        out.execute('BEGIN')
+        # Même schéma que la base principale, sans les triggers (l'archive n'est plus modifiée)
+        names = ARCHIVED_TABLES + (FTS_TABLE,)
+        schema = out.execute(f'''
+            SELECT sql FROM source.sqlite_master
+            WHERE sql IS NOT NULL AND (
+                (type = 'table' AND name IN ({', '.join('?' * len(names))}))
+                OR (type = 'index' AND tbl_name IN ({', '.join('?' * len(ARCHIVED_TABLES))}))
+            )
+            ORDER BY type = 'index', rootpage
+        ''', names + ARCHIVED_TABLES).fetchall()
+        for (sql,) in schema:
+            out.execute(sql)
+
+        copied = _copy_columns(out, 'dossiers')
+        out.execute(
+            f'INSERT INTO dossiers ({copied}) SELECT {copied} FROM source.dossiers WHERE annee = ?', (annee,)
+        )
+        for table in ARCHIVED_TABLES[1:]:
+            copied = _copy_columns(out, table)
+            out.execute(f'''
+                INSERT INTO {table} ({copied}) SELECT {copied} FROM source.{table}
+                WHERE {ARCHIVED_ROWS[table]}
+            ''')
+        out.execute(f'''
+            INSERT INTO {FTS_TABLE} (rowid, {FTS_COLUMNS})
+            SELECT rowid, {FTS_COLUMNS} FROM source.{FTS_TABLE}
+            WHERE rowid IN (SELECT id FROM main.dossiers)
+        ''')
+        # Index plein texte fusionné en un seul segment : l'archive ne sera plus modifiée
+        out.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        count = out.execute('SELECT count(*) FROM dossiers').fetchone()[0]
+        out.execute('COMMIT')
+        out.execute('DETACH DATABASE source')
+        out.execute('ANALYZE')
+        out.execute('VACUUM')
+        return count
+    finally:
+        out.close()
+
+def write_archive(source_database, annee, directory, compress=False):
+    """Crée le fichier d'archive de l'année dans directory ; retourne (nom du fichier, nombre de dossiers)"""
+    os.makedirs(directory, exist_ok=True)
+    filename = archive_filename(annee, compress)
+    path = os.path.join(directory, filename)
+    if os.path.exists(path):
+        raise FileExistsError(f"L'archive {path} existe déjà")
+    fd, building = tempfile.mkstemp(prefix=f'.{filename}.', dir=directory)
+    os.close(fd)
+    os.remove(building)
+    try:
+        count = build_archive(source_database, annee, building)
+        if compress:
+            with open(building, 'rb') as src, gzip.open(building + '.gz', 'wb') as dest:
+                shutil.copyfileobj(src, dest)
+            os.remove(building)
+            building += '.gz'
+        os.chmod(building, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(building, path)
+    except BaseException:
+        for leftover in (building, building + '.gz', building + '-journal'):
+            if os.path.exists(leftover):
+                os.chmod(leftover, stat.S_IWRITE | stat.S_IREAD)
+                os.remove(leftover)
+        raise
+    return filename, count
+
+def remove_archive(path):
+    """Supprime un fichier d'archive (lecture seule) ; sans effet s'il n'existe pas"""
+    if os.path.exists(path):
+        os.chmod(path, stat.S_IWRITE | stat.S_IREAD)
+        os.remove(path)
+
+# Archives compressées : décompressées une fois par processus dans un fichier temporaire
+_decompressed = {}
+_decompressed_lock = threading.Lock()
+
+def _remove_decompressed():
+    for path in _decompressed.values():
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+atexit.register(_remove_decompressed)
+
+def _readable_path(path):
+    if not path.endswith('.gz'):
+        return path
+    with _decompressed_lock:
+        if path not in _decompressed:
+            fd, plain = tempfile.mkstemp(prefix='nmg_archive_', suffix='.db')
+            with os.fdopen(fd, 'wb') as dest, gzip.open(path, 'rb') as src:
+                shutil.copyfileobj(src, dest)
+            _decompressed[path] = plain
+        return _decompressed[path]
+
+def attached_archives(conn):
+    """Schémas d'archives attachés à la connexion"""
+    return [row[1] for row in conn.execute('PRAGMA database_list') if row[1].startswith('archive_')]
+
+def attach_archive(conn, annee, path, keep=()):
+    """Attache l'archive en lecture seule si ce n'est déjà fait ; retourne son schéma.
+
+    Hors transaction uniquement. Au-delà de MAX_ATTACHED_ARCHIVES, les
+    archives attachées qui ne figurent pas dans keep sont détachées.
+    """
+    schema = schema_name(annee)
+    attached = attached_archives(conn)
+    if schema in attached:
+        return schema
+    if len(attached) >= MAX_ATTACHED_ARCHIVES:
+        for name in attached:
+            if name not in keep:
+                conn.execute(f'DETACH DATABASE {name}')
+    uri = Path(_readable_path(path)).resolve().as_uri() + '?mode=ro'
+    conn.execute(f'ATTACH DATABASE ? AS {schema}', (uri,))
+    return schema
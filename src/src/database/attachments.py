@@ -0,0 +1,48 @@
+import hashlib
+
+# Pièces jointes des dossiers (devis signés, photos de chantier...) : le
+# contenu de chaque fichier est stocké une seule fois, dans contenus, sous
+# son empreinte SHA-256 ; pieces_jointes le rattache aux dossiers avec son
+# nom. Lectures et écritures passent par Connection.blobopen, par blocs de
+# CHUNK_SIZE octets : un fichier n'est jamais chargé entier en mémoire.
+
+CHUNK_SIZE = 64 * 1024
+
+def _chunks(read):
+    return iter(lambda: read(CHUNK_SIZE), b'')
+
+def file_digest(path):
+    """Empreinte SHA-256 (hexadécimale) et taille d'un fichier, lu par blocs"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in _chunks(f.read):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+def store_content(conn, path, sha256, size):
+    """Retourne l'id du contenu d'empreinte sha256, copié depuis path s'il n'est pas déjà stocké.
+
+    À appeler dans une transaction d'écriture, après file_digest(path).
+    """
+    row = conn.execute('SELECT id FROM contenus WHERE sha256 = ?', (sha256,)).fetchone()
+    if row:
+        return row[0]
+    content_id = conn.execute(
+        'INSERT INTO contenus (sha256, taille, data) VALUES (?, ?, zeroblob(?))', (sha256, size, size)
+    ).lastrowid
+    # zeroblob réserve la place : le contenu est ensuite écrit bloc par bloc
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f, conn.blobopen('contenus', 'data', content_id) as blob:
+        for chunk in _chunks(f.read):
+            digest.update(chunk)
+            blob.write(chunk)
+    if digest.hexdigest() != sha256:
+        raise ValueError(f"Le fichier {path} a été modifié pendant son enregistrement")
+    return content_id
+
+def iter_content(conn, content_id, schema='main'):
+    """Contenu stocké, par blocs de CHUNK_SIZE octets (schema : base ou archive attachée)"""
+    with conn.blobopen('contenus', 'data', content_id, readonly=True, name=schema) as blob:
+        yield from _chunks(blob.read)
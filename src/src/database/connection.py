@@ -0,0 +1,145 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Pragmas appliqués une seule fois, à l'ouverture de chaque connexion
+BASE_PRAGMAS = {
+    'busy_timeout': 5000,
+    # Désactivées par défaut dans SQLite : nécessaires aux ON DELETE CASCADE
+    'foreign_keys': 'ON',
+}
+
+# Profils de performance sélectionnables, enregistrés dans la table settings
+PRAGMA_PROFILES = {
+    # Journal classique, fsync complet à chaque commit
+    'safe': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -2000,       # 2 Mo
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+    },
+    # WAL : un seul fsync par checkpoint, lectures concurrentes des écritures
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,      # 16 Mo
+        'mmap_size': 67108864,     # 64 Mo
+        'temp_store': 'MEMORY',
+    },
+}
+DEFAULT_PRAGMA_PROFILE = 'fast'
+
+def read_pragma_profile(conn):
+    """Lit le profil de pragmas enregistré dans la base (profil par défaut sinon)"""
+    try:
+        row = conn.execute(
+            "SELECT value FROM settings WHERE key = 'pragma_profile'"
+        ).fetchone()
+    except sqlite3.OperationalError:
+        # Table settings absente (base pas encore initialisée)
+        return DEFAULT_PRAGMA_PROFILE
+    if row is None or row[0] not in PRAGMA_PROFILES:
+        return DEFAULT_PRAGMA_PROFILE
+    return row[0]
+
+def apply_pragma_profile(conn, profile):
+    """Applique les pragmas d'un profil sur une connexion"""
+    for name, value in PRAGMA_PROFILES[profile].items():
+        conn.execute(f'PRAGMA {name} = {value}')
+
+class ConnectionManager:
+    """Gère des connexions SQLite persistantes, une par thread.
+
+    Chaque thread réutilise la même connexion pendant toute la durée de vie
+    de l'application. Les connexions sont ouvertes en mode autocommit :
+    les transactions sont délimitées explicitement avec `transaction()`.
+    """
+
+    def __init__(self, target_resolver):
+        # target_resolver retourne une DatabaseTarget (voir location.py)
+        self._target_resolver = target_resolver
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._generation = 0
+        self.connections_opened = 0
+
+    def get(self):
+        """Retourne la connexion du thread courant, en l'ouvrant si besoin"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.generation != self._generation:
+            conn = self._open()
+            self._local.conn = conn
+            self._local.generation = self._generation
+            self._local.depth = 0
+        return conn
+
+    def _open(self):
+        target = self._target_resolver()
+        conn = sqlite3.connect(
+            target.database,
+            isolation_level=None,
+            check_same_thread=False,
+            # Toujours en mode URI : les archives sont attachées par URI en lecture seule
+            # (un chemin ordinaire reste accepté tel quel)
+            uri=True
+        )
+        self._configure(conn)
+        with self._lock:
+            self._connections.append(conn)
+            self.connections_opened += 1
+        return conn
+
+    def _configure(self, conn):
+        """Applique les pragmas de connexion"""
+        for name, value in BASE_PRAGMAS.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        apply_pragma_profile(conn, read_pragma_profile(conn))
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """Ouvre une transaction et fournit un curseur.
+
+        Valide à la sortie du bloc, annule en cas d'exception. Les blocs
+        imbriqués rejoignent la transaction la plus externe.
+        """
+        conn = self.get()
+        depth = self._local.depth
+        if depth == 0:
+            conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        self._local.depth = depth + 1
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        except BaseException:
+            self._local.depth = depth
+            if depth == 0 and conn.in_transaction:
+                conn.rollback()
+            raise
+        else:
+            self._local.depth = depth
+            if depth == 0:
+                conn.commit()
+        finally:
+            cursor.close()
+
+    def close_all(self):
+        """Ferme toutes les connexions ouvertes (tous threads confondus)"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"Erreur lors de la fermeture d'une connexion : {e}")
+        self._local.conn = None
+
+    def stats(self):
+        """Retourne les compteurs de connexions"""
+        with self._lock:
+            return {
+                'connections_opened': self.connections_opened,
+                'connections_open': len(self._connections),
+            }
@@ -1,223 +1,906 @@
+import atexit
+import datetime
+import mimetypes
 import os
 import sqlite3
 import sys
+from collections import namedtuple
 from .databaseinit import init_database
+from .writer import DatabaseWriter
+from .location import database_location
+from .connection import ConnectionManager, PRAGMA_PROFILES, read_pragma_profile
+from .addresses import ADDRESS_ROLES, address_key, key_prefix_range, resolve_address
+from .numbering import reserve_number, consume_number, release_number, rebuild_numbering, split_numero
+from .search_index import reindex_dossiers
+from .attachments import file_digest, store_content, iter_content
+from .archives import archive_dir, archive_filename, schema_name, attach_archive, write_archive, remove_archive
+from .models import Dossier, Ligne, Address, DossierTitre, DocumentResume, Change, PieceJointe, columns, row_factory, parse_quantite
+from ..utils.money import line_amount_cents
 
-def get_db_path():
-    """Retourne le chemin de la base de données dans AppData"""
-    appdata = os.path.join(os.environ['LOCALAPPDATA'], 'NMGFacturation')
-    data_dir = os.path.join(appdata, 'data')
-    os.makedirs(appdata, exist_ok=True)
-    return os.path.join(data_dir, 'facturation.db')
+# Connexions persistantes (une par thread) pour toute la durée de l'application ;
+# l'emplacement de la base n'est résolu qu'à la première connexion
+connection_manager = ConnectionManager(database_location.get)
+atexit.register(connection_manager.close_all)
+
+# Thread unique d'écriture : les écritures mises en file ne bloquent pas l'interface.
+# Enregistré après close_all, il est arrêté (file vidée) avant la fermeture des connexions.
+writer = DatabaseWriter()
+atexit.register(writer.stop)
+
+def configure_database(target=None):
+    """Change la base utilisée : chemin, ':memory:', 'memory:nom', ':temp:' ou URI 'file:...'.
 
-# Utiliser le chemin dans AppData
-DB_PATH = get_db_path()
+    Sans argument, revient à la variable d'environnement NMG_FACTURATION_DB
+    ou au dossier de données de l'utilisateur. Les écritures en file sont
+    terminées et les connexions ouvertes fermées avant le changement.
+    """
+    writer.flush()
+    connection_manager.close_all()
+    database_location.configure(target)
+
+def get_db_path():
+    """Retourne le fichier de la base (None pour une base en mémoire)"""
+    return database_location.get().path
 
 def get_connection():
-    return sqlite3.connect(DB_PATH)
+    """Retourne la connexion persistante du thread courant (ne pas la fermer)"""
+    return connection_manager.get()
+
+def transaction(immediate=False):
+    """Context manager fournissant un curseur dans une transaction"""
+    return connection_manager.transaction(immediate)
+
+def close_connections():
+    """Ferme toutes les connexions persistantes"""
+    connection_manager.close_all()
+
+def submit_write(func, *args, **kwargs):
+    """Exécute func(*args, **kwargs) sur le thread d'écriture ; retourne un Future"""
+    return writer.submit(func, *args, **kwargs)
+
+def flush_writes(timeout=None):
+    """Attend la fin des écritures en file"""
+    writer.flush(timeout)
+
+def get_connection_stats():
+    """Retourne le nombre de connexions ouvertes depuis le démarrage"""
+    return connection_manager.stats()
+
+def get_pragma_profile():
+    """Retourne le profil de pragmas actif ('safe' ou 'fast')"""
+    return read_pragma_profile(get_connection())
+
+def set_pragma_profile(profile):
+    """Enregistre le profil de pragmas et rouvre les connexions pour l'appliquer"""
+    if profile not in PRAGMA_PROFILES:
+        raise ValueError(f"Profil de pragmas inconnu : {profile}")
+    with transaction() as cursor:
+        cursor.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES ('pragma_profile', ?)",
+            (profile,)
+        )
+    # Le changement de journal_mode exige qu'aucune autre connexion ne soit ouverte
+    close_connections()
+    get_connection()
+
+def backup_database(dest_path):
+    """Copie la base (y compris le contenu du journal WAL) vers dest_path"""
+    # Les écritures encore en file doivent figurer dans la sauvegarde
+    writer.flush()
+    dest = sqlite3.connect(dest_path)
+    try:
+        get_connection().backup(dest)
+    finally:
+        dest.close()
 
 def create_tables():
     """Initialise la base de données"""
     init_database()
 
+def _check_year_open(cursor, numero_dossier):
+    """Refuse un numéro d'une année archivée (il pourrait déjà exister dans l'archive)"""
+    key = split_numero(numero_dossier)
+    if key and cursor.execute('SELECT 1 FROM archives WHERE annee = ?', (key[0],)).fetchone():
+        raise sqlite3.IntegrityError(f"L'année {key[0]} est archivée")
+
 def add_dossier(numero_dossier, adresse_chantier, libelle_travaux, adresse_facturation, moyen_paiement, garantie_decennale, description, devis_signe, facture_payee):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-    INSERT INTO dossiers (
-        numero_dossier, 
-        adresse_chantier, 
-        libelle_travaux, 
-        adresse_facturation, 
-        moyen_paiement, 
-        garantie_decennale, 
-        description, 
-        devis_signe, 
-        facture_payee,
-        devis_generated, 
-        facture_generated
-    )
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0)
-    ''', (numero_dossier, adresse_chantier, libelle_travaux, adresse_facturation, moyen_paiement, garantie_decennale, description, devis_signe, facture_payee))
-    dossier_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return dossier_id
+    with transaction() as cursor:
+        _check_year_open(cursor, numero_dossier)
+        # Adresses ramenées à celles du carnet (même adresse à la casse ou aux accents près)
+        chantier_id, adresse_chantier = resolve_address(cursor, adresse_chantier)
+        facturation_id, adresse_facturation = resolve_address(cursor, adresse_facturation)
+        cursor.execute('''
+        INSERT INTO dossiers (
+            numero_dossier,
+            adresse_chantier,
+            libelle_travaux,
+            adresse_facturation,
+            moyen_paiement,
+            garantie_decennale,
+            description,
+            devis_signe,
+            facture_payee,
+            devis_generated,
+            facture_generated,
+            adresse_chantier_id,
+            adresse_facturation_id
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0, ?, ?)
+        ''', (numero_dossier, adresse_chantier, libelle_travaux, adresse_facturation, moyen_paiement, garantie_decennale, description, devis_signe, facture_payee,
+              chantier_id, facturation_id))
+        consume_number(cursor, numero_dossier)
+        return cursor.lastrowid
 
 def update_dossier(dossier_id, numero_dossier, adresse_chantier, libelle_travaux, adresse_facturation, moyen_paiement, garantie_decennale, description, devis_signe, facture_payee, devis_generated, facture_generated):
     """Met à jour un dossier existant dans la base de données."""
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE dossiers 
-            SET numero_dossier = ?, 
-                adresse_chantier = ?, 
-                libelle_travaux = ?, 
-                adresse_facturation = ?,
-                moyen_paiement = ?, 
-                garantie_decennale = ?, 
-                description = ?, 
-                devis_signe = ?,  
-                facture_payee = ?,
-                devis_generated = ?, 
-                facture_generated = ?
-            WHERE id = ?
-        ''', (numero_dossier, adresse_chantier, libelle_travaux, adresse_facturation, moyen_paiement, garantie_decennale, description, devis_signe, facture_payee, devis_generated, facture_generated, dossier_id))
-
-        conn.commit()
-        conn.close()
+        with transaction() as cursor:
+            ancien = cursor.execute('SELECT numero_dossier FROM dossiers WHERE id = ?', (dossier_id,)).fetchone()
+            if ancien and ancien[0] != numero_dossier:
+                _check_year_open(cursor, numero_dossier)
+            chantier_id, adresse_chantier = resolve_address(cursor, adresse_chantier)
+            facturation_id, adresse_facturation = resolve_address(cursor, adresse_facturation)
+            cursor.execute('''
+                UPDATE dossiers
+                SET numero_dossier = ?,
+                    adresse_chantier = ?,
+                    libelle_travaux = ?,
+                    adresse_facturation = ?,
+                    moyen_paiement = ?,
+                    garantie_decennale = ?,
+                    description = ?,
+                    devis_signe = ?,
+                    facture_payee = ?,
+                    devis_generated = ?,
+                    facture_generated = ?,
+                    adresse_chantier_id = ?,
+                    adresse_facturation_id = ?
+                WHERE id = ?
+            ''', (numero_dossier, adresse_chantier, libelle_travaux, adresse_facturation, moyen_paiement, garantie_decennale, description, devis_signe, facture_payee, devis_generated, facture_generated,
+                  chantier_id, facturation_id, dossier_id))
+            if ancien and ancien[0] != numero_dossier:
+                release_number(cursor, ancien[0])
+                consume_number(cursor, numero_dossier)
         return True
+    except (sqlite3.IntegrityError, ValueError):
+        # Numéro de dossier déjà utilisé ou refusé par la numérotation :
+        # laisser l'appelant prévenir l'utilisateur
+        raise
     except Exception as e:
         print(f"Erreur lors de la mise à jour du dossier : {e}")
         return False
 
+def save_dossier_changes(dossier_id, fields, generated, produits_delta, options_delta):
+    """Crée (dossier_id None) ou met à jour un dossier et ses lignes modifiées en une transaction.
+
+    fields reprend les paramètres d'add_dossier, generated le couple
+    (devis_generated, facture_generated) conservé à la mise à jour.
+    Retourne l'id du dossier.
+    """
+    with transaction():
+        if dossier_id is None:
+            dossier_id = add_dossier(*fields)
+        elif not update_dossier(dossier_id, *fields, *generated):
+            raise sqlite3.DatabaseError(f"Mise à jour du dossier {dossier_id} impossible")
+        apply_lines_delta(dossier_id, produits_delta, options_delta)
+    return dossier_id
+
 def update_document_generated(dossier_id, doc_type, status):
     """Met à jour le statut de génération d'un document (devis ou facture)"""
-    conn = get_connection()
-    cursor = conn.cursor()
     field = 'devis_generated' if doc_type == 'devis' else 'facture_generated'
     try:
-        cursor.execute(f'''
-            UPDATE dossiers 
-            SET {field} = ?
-            WHERE id = ?
-        ''', (1 if status else 0, dossier_id))
-        conn.commit()
+        with transaction() as cursor:
+            cursor.execute(f'''
+                UPDATE dossiers
+                SET {field} = ?
+                WHERE id = ?
+            ''', (1 if status else 0, dossier_id))
         return True
     except Exception as e:
         print(f"Erreur lors de la mise à jour du statut de génération : {e}")
         return False
-    finally:
-        conn.close()
 
 def delete_produits(dossier_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-    DELETE FROM produits
-    WHERE dossier_id = ?
-    ''', (dossier_id,))
-    conn.commit()
-    conn.close()
-
-def add_produit(dossier_id, designation, quantite, prix, remise, unite):
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute('BEGIN TRANSACTION')
+    with transaction() as cursor:
         cursor.execute('''
-        INSERT INTO produits (dossier_id, designation, quantite, prix, remise, unite)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ''', (dossier_id, designation, quantite, prix, remise, unite))
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+        DELETE FROM produits
+        WHERE dossier_id = ?
+        ''', (dossier_id,))
+        reindex_dossiers(cursor, [dossier_id])
 
-def add_option(dossier_id, designation, quantite, prix, remise, unite):
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute('BEGIN TRANSACTION')
-        cursor.execute('''
-        INSERT INTO options (dossier_id, designation, quantite, prix, remise, unite)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ''', (dossier_id, designation, quantite, prix, remise, unite))
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+# Colonnes écrites pour une ligne : les valeurs saisies puis les valeurs calculées
+LINE_COLUMNS = (
+    'designation, quantite, prix_cents, remise_cents, unite, '
+    'quantite_num, quantite_kind, montant_brut_cents'
+)
+LINE_PLACEHOLDERS = ', '.join('?' * (len(LINE_COLUMNS.split(',')) + 1))  # + dossier_id
+
+def line_row(values):
+    """Complète des valeurs (designation, quantite, prix_cents, remise_cents, unite)
+    avec la quantité analysée et le montant avant remise en centimes"""
+    quantite_num, quantite_kind = parse_quantite(values[1])
+    return (*values, quantite_num, quantite_kind, line_amount_cents(values[2], quantite_num))
+
+def add_produit(dossier_id, designation, quantite, prix_cents, remise_cents, unite):
+    with transaction() as cursor:
+        cursor.execute(f'''
+        INSERT INTO produits (dossier_id, {LINE_COLUMNS})
+        VALUES ({LINE_PLACEHOLDERS})
+        ''', (dossier_id, *line_row((designation, quantite, prix_cents, remise_cents, unite))))
+        reindex_dossiers(cursor, [dossier_id])
+
+def add_option(dossier_id, designation, quantite, prix_cents, remise_cents, unite):
+    with transaction() as cursor:
+        cursor.execute(f'''
+        INSERT INTO options (dossier_id, {LINE_COLUMNS})
+        VALUES ({LINE_PLACEHOLDERS})
+        ''', (dossier_id, *line_row((designation, quantite, prix_cents, remise_cents, unite))))
+        reindex_dossiers(cursor, [dossier_id])
 
 def delete_options(dossier_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-    DELETE FROM options
-    WHERE dossier_id = ?
-    ''', (dossier_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute('''
+        DELETE FROM options
+        WHERE dossier_id = ?
+        ''', (dossier_id,))
+        reindex_dossiers(cursor, [dossier_id])
 
-def delete_dossier(dossier_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute('BEGIN TRANSACTION')
-        cursor.execute('DELETE FROM options WHERE dossier_id = ?', (dossier_id,))
+def replace_dossier_lines(dossier_id, produits, options):
+    """Remplace les produits et options d'un dossier en une seule transaction.
+
+    produits et options sont des listes de tuples
+    (designation, quantite, prix_cents, remise_cents, unite).
+    """
+    with transaction() as cursor:
         cursor.execute('DELETE FROM produits WHERE dossier_id = ?', (dossier_id,))
+        cursor.execute('DELETE FROM options WHERE dossier_id = ?', (dossier_id,))
+        cursor.executemany(f'''
+        INSERT INTO produits (dossier_id, {LINE_COLUMNS})
+        VALUES ({LINE_PLACEHOLDERS})
+        ''', [(dossier_id, *line_row(produit)) for produit in produits])
+        cursor.executemany(f'''
+        INSERT INTO options (dossier_id, {LINE_COLUMNS})
+        VALUES ({LINE_PLACEHOLDERS})
+        ''', [(dossier_id, *line_row(option)) for option in options])
+        reindex_dossiers(cursor, [dossier_id])
+
+# Modifications à appliquer aux lignes d'un dossier :
+# inserts = [valeurs], updates = [(id, valeurs)], deletes = [id]
+LinesDelta = namedtuple('LinesDelta', ['inserts', 'updates', 'deletes'])
+
+def lines_by_id(lignes):
+    """Indexe des Ligne lues en base sous la forme {id: valeurs} attendue par diff_lines"""
+    return {
+        ligne.id: (ligne.designation, ligne.quantite, ligne.prix_cents, ligne.remise_cents, ligne.unite)
+        for ligne in lignes
+    }
+
+def diff_lines(original, current):
+    """Calcule les modifications entre les lignes chargées et les lignes éditées.
+
+    original : dict {id: valeurs} des lignes lues en base
+    current : liste de (id, valeurs), id valant None pour une nouvelle ligne
+    valeurs = (designation, quantite, prix_cents, remise_cents, unite)
+    """
+    inserts = []
+    updates = []
+    kept = set()
+    for line_id, values in current:
+        if line_id is None or line_id not in original:
+            inserts.append(values)
+        else:
+            kept.add(line_id)
+            if tuple(original[line_id]) != tuple(values):
+                updates.append((line_id, values))
+    deletes = [line_id for line_id in original if line_id not in kept]
+    return LinesDelta(inserts, updates, deletes)
+
+def apply_lines_delta(dossier_id, produits_delta, options_delta):
+    """Applique uniquement les lignes ajoutées, modifiées ou supprimées, en une transaction"""
+    with transaction() as cursor:
+        for table, delta in (('produits', produits_delta), ('options', options_delta)):
+            cursor.executemany(
+                f'DELETE FROM {table} WHERE id = ? AND dossier_id = ?',
+                [(line_id, dossier_id) for line_id in delta.deletes]
+            )
+            cursor.executemany(f'''
+            UPDATE {table}
+            SET designation = ?, quantite = ?, prix_cents = ?, remise_cents = ?, unite = ?,
+                quantite_num = ?, quantite_kind = ?, montant_brut_cents = ?
+            WHERE id = ? AND dossier_id = ?
+            ''', [(*line_row(values), line_id, dossier_id) for line_id, values in delta.updates])
+            cursor.executemany(f'''
+            INSERT INTO {table} (dossier_id, {LINE_COLUMNS})
+            VALUES ({LINE_PLACEHOLDERS})
+            ''', [(dossier_id, *line_row(values)) for values in delta.inserts])
+        # Désignations réindexées une fois pour toutes les lignes écrites
+        if any(delta.inserts or delta.updates or delta.deletes for delta in (produits_delta, options_delta)):
+            reindex_dossiers(cursor, [dossier_id])
+
+def delete_dossier(dossier_id):
+    with transaction() as cursor:
+        numero = cursor.execute('SELECT numero_dossier FROM dossiers WHERE id = ?', (dossier_id,)).fetchone()
+        # Produits et options supprimés par ON DELETE CASCADE
         cursor.execute('DELETE FROM dossiers WHERE id = ?', (dossier_id,))
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+        if numero:
+            release_number(cursor, numero[0])
 
-def get_dossiers():
+def allocate_dossier_number(annee=None, reuse_gaps=True):
+    """Réserve le prochain numéro de dossier "AAAA/N" de l'année (courante par défaut).
+
+    Le plus petit numéro libre est réattribué en premier (reuse_gaps=False pour
+    toujours prendre dernier + 1). La réservation se fait sous BEGIN IMMEDIATE :
+    deux postes ne reçoivent jamais le même numéro.
+    """
+    with transaction(immediate=True) as cursor:
+        return reserve_number(cursor, annee, reuse_gaps)
+
+def release_dossier_number(numero_dossier):
+    """Rend un numéro réservé mais non utilisé (création de dossier abandonnée)"""
+    with transaction(immediate=True) as cursor:
+        release_number(cursor, numero_dossier)
+
+def refresh_numbering():
+    """Recalcule la numérotation (après une restauration par exemple)"""
+    with transaction(immediate=True) as cursor:
+        rebuild_numbering(cursor)
+
+def get_archived_years():
+    """Années archivées, de la plus récente à la plus ancienne"""
+    return [row[0] for row in get_connection().execute('SELECT annee FROM archives ORDER BY annee DESC')]
+
+def archive_year(annee, compress=False):
+    """Déplace les dossiers d'une année close dans son archive ; retourne le nombre de dossiers archivés.
+
+    L'archive est écrite pendant la transaction qui retire les dossiers de
+    la base : aucune écriture ne peut s'intercaler. Opération longue, à
+    lancer hors du thread de l'interface (submit_write ou ligne de
+    commande : python -m src.database.archiver AAAA).
+    """
+    annee = int(annee)
+    if annee >= datetime.date.today().year:
+        raise ValueError(f"L'année {annee} n'est pas close")
+    target = database_location.get()
+    if target.path is None:
+        raise ValueError("Les archives nécessitent une base enregistrée dans un fichier")
+    directory = archive_dir(target.path)
+    filename = None
+    try:
+        with transaction(immediate=True) as cursor:
+            if cursor.execute('SELECT 1 FROM archives WHERE annee = ?', (annee,)).fetchone():
+                raise ValueError(f"L'année {annee} est déjà archivée")
+            if not cursor.execute('SELECT 1 FROM dossiers WHERE annee = ? LIMIT 1', (annee,)).fetchone():
+                raise ValueError(f"Aucun dossier pour l'année {annee}")
+            # Fichier d'un archivage interrompu avant son enregistrement : les dossiers sont encore ici
+            remove_archive(os.path.join(directory, archive_filename(annee, compress)))
+            filename, count = write_archive(target.database, annee, directory, compress)
+            cursor.execute(
+                'INSERT INTO archives (annee, filename, compressed, dossiers, archived_at) VALUES (?, ?, ?, ?, ?)',
+                (annee, filename, int(compress), count, datetime.datetime.now().isoformat(timespec='seconds'))
+            )
+            cursor.execute('INSERT INTO archived_dossiers (id, annee) SELECT id, annee FROM dossiers WHERE annee = ?', (annee,))
+            # Produits, options et index plein texte suivent (ON DELETE CASCADE, triggers)
+            cursor.execute('DELETE FROM dossiers WHERE annee = ?', (annee,))
+            cursor.execute('DELETE FROM numeros_libres WHERE annee = ?', (annee,))
+    except BaseException:
+        if filename:
+            remove_archive(os.path.join(directory, filename))
+        raise
+    return count
+
+def _archive_years(archives):
+    """Années désignées par le paramètre archives des lectures : True (toutes), itérable ou rien"""
+    if not archives:
+        return []
+    years = get_archived_years()
+    return years if archives is True else [annee for annee in years if annee in set(archives)]
+
+def _attach_archives(years):
+    """Attache à la connexion du thread les archives des années données ; retourne leurs schémas"""
+    if not years:
+        return []
+    years = list(years)
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM dossiers')
-    dossiers = cursor.fetchall()
-    conn.close()
-    return dossiers
+    rows = conn.execute(
+        f"SELECT annee, filename FROM archives WHERE annee IN ({', '.join('?' * len(years))}) ORDER BY annee DESC",
+        years
+    ).fetchall()
+    directory = archive_dir(get_db_path())
+    keep = {schema_name(annee) for annee, _ in rows}
+    return [attach_archive(conn, annee, os.path.join(directory, filename), keep) for annee, filename in rows]
+
+def _union_all(select, params, archives):
+    """Répète select (table préfixée par {schema}) sur la base et les archives demandées"""
+    schemas = ['main'] + _attach_archives(_archive_years(archives))
+    return ' UNION ALL '.join(select.format(schema=schema) for schema in schemas), list(params) * len(schemas)
+
+def _dossier_schema(dossier_id):
+    """Schéma contenant le dossier : 'main', ou celui de son archive (attachée au besoin)"""
+    row = get_connection().execute('SELECT annee FROM archived_dossiers WHERE id = ?', (dossier_id,)).fetchone()
+    return _attach_archives([row[0]])[0] if row else 'main'
+
+def is_archived_dossier(dossier_id):
+    """Vrai si le dossier a été déplacé dans une archive (consultation seulement)"""
+    return get_connection().execute(
+        'SELECT 1 FROM archived_dossiers WHERE id = ?', (dossier_id,)
+    ).fetchone() is not None
+
+def get_dossiers():
+    cursor = get_connection().cursor()
+    cursor.row_factory = row_factory(Dossier)
+    return cursor.execute(f'SELECT {columns(Dossier)} FROM dossiers').fetchall()
+
+# Tri par année puis numéro (colonnes générées depuis numero_dossier "AAAA/N"),
+# du plus récent au plus ancien ; suit l'index idx_dossiers_annee_numero
+DOSSIER_ORDER_BY = 'annee DESC, numero DESC, id DESC'
+
+# Page de la liste des dossiers ; next_key vaut None sur la dernière page
+DossierPage = namedtuple('DossierPage', ['items', 'next_key'])
+
+# Filtres acceptés par list_dossiers_page, en plus de 'search' (recherche plein texte)
+DOSSIER_FILTERS = ('annee', 'devis_generated', 'facture_generated', 'devis_signe', 'facture_payee')
+
+def list_dossiers_page(after_key=None, limit=100, filters=None, archives=False):
+    """Retourne une page de DossierTitre triés par année et numéro décroissants.
+
+    Pagination par clé : after_key est le next_key de la page précédente
+    ((annee, numero, id) du dernier dossier affiché), None pour la première page.
+    Le coût d'une page ne dépend pas de sa position dans la liste.
+    archives=True poursuit la liste dans les années archivées : une archive
+    n'est attachée que lorsque la page atteint son année. Un filtre 'annee'
+    sur une année archivée lit directement son archive.
+    """
+    filters = filters or {}
+    conditions = ["instr(numero_dossier, '/') > 0"]
+    params = []
+    for name, value in filters.items():
+        if name == 'search':
+            match = _fts_query(value)
+            if match:
+                conditions.append('id IN (SELECT rowid FROM {schema}.dossiers_fts WHERE dossiers_fts MATCH ?)')
+                params.append(match)
+        elif name in DOSSIER_FILTERS:
+            conditions.append(f'{name} = ?')
+            params.append(value)
+        else:
+            raise ValueError(f"Filtre inconnu : {name}")
+    if after_key is not None:
+        conditions.append('(annee, numero, id) < (?, ?, ?)')
+        params.extend(after_key)
+    params.append(limit)
+    query = f'''
+        SELECT {columns(DossierTitre)}
+        FROM {{schema}}.dossiers
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {DOSSIER_ORDER_BY}
+        LIMIT ?
+    '''
+
+    def read_page(schema):
+        cursor = get_connection().cursor()
+        cursor.row_factory = row_factory(DossierTitre)
+        return cursor.execute(query.format(schema=schema), params).fetchall()
+
+    try:
+        items = read_page('main')
+        if archives or 'annee' in filters:
+            for annee in get_archived_years():
+                if 'annee' in filters and annee != filters['annee']:
+                    continue
+                if after_key is not None and annee > after_key[0]:
+                    continue
+                if len(items) == limit and annee < items[-1].annee:
+                    break  # Page complète : les archives restantes sont plus anciennes
+                items.extend(read_page(_attach_archives([annee])[0]))
+                items.sort(key=lambda d: (d.annee, d.numero, d.id), reverse=True)
+                del items[limit:]
+    except sqlite3.OperationalError as e:
+        print(f"Erreur lors du chargement des dossiers : {e}")
+        return DossierPage([], None)
+    next_key = None
+    if len(items) == limit:
+        last = items[-1]
+        next_key = (last.annee, last.numero, last.id)
+    return DossierPage(items, next_key)
+
+def _ids_condition(ids):
+    """Condition SQL "id IN (...)" et ses paramètres"""
+    ids = list(ids)
+    return f"id IN ({', '.join('?' * len(ids))})", ids
+
+def get_dossier_titles(ids=None):
+    """Retourne les DossierTitre des dossiers (ceux de ids seulement si fourni), triés par année et numéro"""
+    query = f'''
+        SELECT {columns(DossierTitre)}
+        FROM dossiers
+        WHERE instr(numero_dossier, '/') > 0
+    '''
+    params = []
+    if ids is not None:
+        condition, params = _ids_condition(ids)
+        query += f' AND {condition}'
+    cursor = get_connection().cursor()
+    cursor.row_factory = row_factory(DossierTitre)
+    return cursor.execute(query + f' ORDER BY {DOSSIER_ORDER_BY}', params).fetchall()
+
+# Tris proposés par get_document_list
+DOCUMENT_ORDERS = {
+    'numero': DOSSIER_ORDER_BY,
+    'montant': 'montant_cents DESC, ' + DOSSIER_ORDER_BY,
+}
+
+def get_document_list(doc_type, status=None, order='numero', ids=None, archives=False):
+    """Retourne les dossiers dont le devis ou la facture a été généré.
+
+    Lignes DocumentResume, statut valant devis_signe pour les devis et
+    facture_payee pour les factures. status (True/False) filtre sur ce statut.
+    montant_cents est le total des produits remises déduites (hors options),
+    lu dans les totaux stockés : aucune requête par dossier.
+    order : 'numero' ou 'montant' (voir DOCUMENT_ORDERS). ids limite la
+    liste à ces dossiers (rafraîchissement partiel d'une vue). archives
+    (True ou années) ajoute les dossiers archivés.
+    """
+    if doc_type == 'devis':
+        generated, status_field = 'devis_generated', 'devis_signe'
+    else:
+        generated, status_field = 'facture_generated', 'facture_payee'
+    # annee et numero ne servent qu'au tri
+    select = f'''
+        SELECT id, numero_dossier, adresse_chantier, adresse_facturation,
+               libelle_travaux, {status_field} AS statut,
+               total_ht_cents - total_remise_cents AS montant_cents, annee, numero
+        FROM {{schema}}.dossiers
+        WHERE {generated} = 1
+    '''
+    params = []
+    if status is not None:
+        select += f' AND {status_field} = ?'
+        params.append(1 if status else 0)
+    if ids is not None:
+        condition, id_params = _ids_condition(ids)
+        select += f' AND {condition}'
+        params.extend(id_params)
+    union, params = _union_all(select, params, archives)
+    query = f'SELECT {columns(DocumentResume)} FROM ({union}) ORDER BY {DOCUMENT_ORDERS[order]}'
+    cursor = get_connection().cursor()
+    cursor.row_factory = row_factory(DocumentResume)
+    return cursor.execute(query, params).fetchall()
+
+def get_dossier_id_by_numero(numero_dossier):
+    """Retourne l'id d'un dossier à partir de son numéro (index unique), ou None"""
+    row = get_connection().execute(
+        'SELECT id FROM dossiers WHERE numero_dossier = ?', (numero_dossier,)
+    ).fetchone()
+    return row[0] if row else None
 
 def get_dossier(dossier_id):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM dossiers WHERE id = ?
-        ''', (dossier_id,))
+        schema = _dossier_schema(dossier_id)
+        cursor = get_connection().cursor()
+        cursor.row_factory = row_factory(Dossier)
+        cursor.execute(f'SELECT {columns(Dossier)} FROM {schema}.dossiers WHERE id = ?', (dossier_id,))
         dossier = cursor.fetchone()
-        conn.close()
         if dossier is None:
             raise ValueError(f"Le dossier {dossier_id} n'existe pas")
-        return dossier  # Retourne un tuple ou None
+        return dossier
     except Exception as e:
         print(f"Erreur lors de la récupération du dossier : {e}")
         return None  # Au lieu d'un entier, retourner None en cas d'erreur
 
+def _fetch_lignes(cursor, table, dossier_id):
+    """Lignes (Ligne) d'un dossier dans la table produits ou options (éventuellement préfixée
+    par le schéma d'une archive), dans l'ordre de saisie"""
+    cursor.row_factory = row_factory(Ligne)
+    cursor.execute(f'SELECT {columns(Ligne)} FROM {table} WHERE dossier_id = ? ORDER BY id', (dossier_id,))
+    return cursor.fetchall()
+
 def get_produits(dossier_id):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM produits WHERE dossier_id = ?', (dossier_id,))
-        produits = cursor.fetchall()
-        conn.close()
-        return produits if produits else []
+        return _fetch_lignes(get_connection().cursor(), f'{_dossier_schema(dossier_id)}.produits', dossier_id)
     except Exception as e:
         print(f"Erreur lors de la récupération des produits : {e}")
         return []
 
 def get_options(dossier_id):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM options WHERE dossier_id = ?', (dossier_id,))
-        options = cursor.fetchall()
-        conn.close()
-        return options if options else []
+        return _fetch_lignes(get_connection().cursor(), f'{_dossier_schema(dossier_id)}.options', dossier_id)
     except Exception as e:
         print(f"Erreur lors de la récupération des options : {e}")
         return []
 
+# Instantané immuable d'un dossier : Dossier + tuples de Ligne (produits et options)
+DossierSnapshot = namedtuple('DossierSnapshot', ['dossier', 'produits', 'options'])
+
+def get_dossier_full(dossier_id):
+    """Charge un dossier, ses produits et ses options dans une seule transaction de lecture"""
+    try:
+        # Archive attachée avant la transaction (ATTACH y est interdit)
+        schema = _dossier_schema(dossier_id)
+        with transaction() as cursor:
+            cursor.row_factory = row_factory(Dossier)
+            cursor.execute(f'SELECT {columns(Dossier)} FROM {schema}.dossiers WHERE id = ?', (dossier_id,))
+            dossier = cursor.fetchone()
+            if dossier is None:
+                return None
+            produits = tuple(_fetch_lignes(cursor, f'{schema}.produits', dossier_id))
+            options = tuple(_fetch_lignes(cursor, f'{schema}.options', dossier_id))
+        return DossierSnapshot(dossier, produits, options)
+    except Exception as e:
+        print(f"Erreur lors de la récupération du dossier : {e}")
+        return None
+
+def add_attachment(dossier_id, path, nom=None):
+    """Joint le fichier path au dossier ; retourne l'id de la pièce jointe.
+
+    Le fichier est lu et écrit par blocs ; un contenu déjà stocké (même
+    empreinte, pour ce dossier ou un autre) n'est pas recopié.
+    """
+    nom = nom or os.path.basename(path)
+    # Empreinte calculée avant la transaction : le verrou d'écriture n'attend pas la lecture
+    sha256, taille = file_digest(path)
+    with transaction(immediate=True) as cursor:
+        contenu_id = store_content(cursor.connection, path, sha256, taille)
+        cursor.execute('''
+            INSERT INTO pieces_jointes (dossier_id, contenu_id, nom, type_mime, ajoute_le)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (dossier_id, contenu_id, nom, mimetypes.guess_type(nom)[0],
+              datetime.datetime.now().isoformat(timespec='seconds')))
+        return cursor.lastrowid
+
+def delete_attachment(attachment_id):
+    """Supprime une pièce jointe ; son contenu aussi s'il n'est plus joint à aucun dossier (trigger)"""
+    with transaction() as cursor:
+        cursor.execute('DELETE FROM pieces_jointes WHERE id = ?', (attachment_id,))
+
+def get_attachments(dossier_id):
+    """Pièces jointes (PieceJointe) d'un dossier, dans l'ordre d'ajout"""
+    try:
+        schema = _dossier_schema(dossier_id)
+        cursor = get_connection().cursor()
+        cursor.row_factory = row_factory(PieceJointe)
+        return cursor.execute(f'''
+            SELECT p.id, p.dossier_id, p.nom, p.type_mime, c.taille, c.sha256, p.ajoute_le
+            FROM {schema}.pieces_jointes p
+            JOIN {schema}.contenus c ON c.id = p.contenu_id
+            WHERE p.dossier_id = ?
+            ORDER BY p.id
+        ''', (dossier_id,)).fetchall()
+    except sqlite3.OperationalError as e:
+        print(f"Erreur lors de la récupération des pièces jointes : {e}")
+        return []
+
+def iter_attachment(piece):
+    """Contenu d'une pièce jointe (PieceJointe), par blocs ; lu dans son archive si besoin"""
+    schema = _dossier_schema(piece.dossier_id)
+    conn = get_connection()
+    row = conn.execute(f'SELECT id FROM {schema}.contenus WHERE sha256 = ?', (piece.sha256,)).fetchone()
+    if row is None:
+        raise ValueError(f"Le contenu de la pièce jointe {piece.nom} est introuvable")
+    return iter_content(conn, row[0], schema)
+
+def export_attachment(piece, dest_path):
+    """Écrit le contenu d'une pièce jointe dans dest_path, par blocs"""
+    with open(dest_path, 'wb') as f:
+        for chunk in iter_attachment(piece):
+            f.write(chunk)
+
+def get_thumbnail(sha256):
+    """Vignette en cache (PNG) d'un contenu, ou None"""
+    row = get_connection().execute('SELECT data FROM vignettes WHERE sha256 = ?', (sha256,)).fetchone()
+    return row[0] if row else None
+
+def save_thumbnail(sha256, data):
+    """Met en cache la vignette (PNG) d'un contenu"""
+    with transaction() as cursor:
+        cursor.execute('INSERT OR REPLACE INTO vignettes (sha256, data) VALUES (?, ?)', (sha256, data))
+
+def add_address(address):
+    """Ajoute une adresse ; lève sqlite3.IntegrityError si elle existe déjà"""
+    # Doublon détecté par l'index unique sur address_key (espaces, casse et accents ignorés)
+    with transaction() as cursor:
+        cursor.execute('INSERT INTO addresses (address, address_key) VALUES (?, ?)', (address, address_key(address)))
+        return cursor.lastrowid
+
+def update_address(address_id, address):
+    """Modifie une adresse ; lève sqlite3.IntegrityError si la nouvelle existe déjà"""
+    with transaction() as cursor:
+        cursor.execute(
+            'UPDATE addresses SET address = ?, address_key = ? WHERE id = ?',
+            (address, address_key(address), address_id)
+        )
+
+def delete_address(address_id):
+    with transaction() as cursor:
+        cursor.execute('DELETE FROM addresses WHERE id = ?', (address_id,))
+
+def find_address(address):
+    """Retourne l'adresse équivalente déjà enregistrée, ou None"""
+    cursor = get_connection().cursor()
+    cursor.row_factory = row_factory(Address)
+    return cursor.execute(
+        f'SELECT {columns(Address)} FROM addresses WHERE address_key = ?', (address_key(address),)
+    ).fetchone()
+
+def get_addresses_by_prefix(prefix, limit=20):
+    """Adresses commençant par prefix (espaces, casse et accents ignorés), par ordre alphabétique"""
+    bounds = key_prefix_range(prefix)
+    if bounds is None:
+        return []
+    cursor = get_connection().cursor()
+    cursor.row_factory = row_factory(Address)
+    # Intervalle sur l'index unique idx_addresses_key
+    return cursor.execute(f'''
+        SELECT {columns(Address)} FROM addresses
+        WHERE address_key >= ? AND address_key < ?
+        ORDER BY address_key
+        LIMIT ?
+    ''', (*bounds, limit)).fetchall()
+
+def get_dossiers_at_address(address_id, role=None):
+    """Dossiers situés ou facturés à une adresse, les plus récents d'abord.
+
+    role limite la recherche à 'chantier' ou 'facturation' (les deux par défaut).
+    """
+    roles = [role] if role else list(ADDRESS_ROLES)
+    # Une condition par colonne indexée : SQLite combine les deux index (OR)
+    where = ' OR '.join(f'{ADDRESS_ROLES[r][1]} = :address_id' for r in roles)
+    cursor = get_connection().cursor()
+    cursor.row_factory = row_factory(DossierTitre)
+    return cursor.execute(f'''
+        SELECT {columns(DossierTitre)} FROM dossiers
+        WHERE {where}
+        ORDER BY {DOSSIER_ORDER_BY}
+    ''', {'address_id': address_id}).fetchall()
+
 def get_addresses():
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, address FROM addresses')
-        addresses = cursor.fetchall()
-        conn.close()
-        return addresses
+        cursor = get_connection().cursor()
+        cursor.row_factory = row_factory(Address)
+        return cursor.execute(f'SELECT {columns(Address)} FROM addresses').fetchall()
     except Exception as e:
         print(f"Erreur lors de la récupération des adresses : {e}")
         return []
 
+def _fts_query(text):
+    """Transforme une saisie libre en requête FTS5 : chaque mot devient un préfixe, tous requis"""
+    return ' '.join('"' + term.replace('"', '""') + '"*' for term in text.split())
+
+# Poids bm25 des colonnes de dossiers_fts : numéro, libellé, adresses, description, lignes
+SEARCH_WEIGHTS = (10.0, 5.0, 3.0, 1.0, 2.0)
+
+def search(query, limit=50, archives=False):
+    """Recherche plein texte dans les dossiers (numéro, libellé, adresses, description,
+    désignations des produits et options), insensible aux accents et à la casse.
+
+    Retourne des DossierTitre, le numéro exact puis les plus pertinents en premier.
+    limit=None : pas de limite. archives (True ou années) cherche aussi dans
+    les dossiers archivés.
+    """
+    match = _fts_query(query)
+    if not match:
+        return []
+    try:
+        union, params = _union_all(f'''
+            SELECT {columns(DossierTitre, 'd.')}, d.numero_dossier = ? AS exact,
+                   bm25(dossiers_fts, {', '.join(map(str, SEARCH_WEIGHTS))}) AS score
+            FROM {{schema}}.dossiers_fts
+            JOIN {{schema}}.dossiers d ON d.id = dossiers_fts.rowid
+            WHERE dossiers_fts MATCH ?
+        ''', (query.strip(), match), archives)
+        cursor = get_connection().cursor()
+        cursor.row_factory = row_factory(DossierTitre)
+        cursor.execute(f'''
+            SELECT {columns(DossierTitre)} FROM ({union})
+            ORDER BY exact DESC, score
+            LIMIT ?
+        ''', params + [-1 if limit is None else limit])
+        return cursor.fetchall()
+    except sqlite3.OperationalError as e:
+        print(f"Erreur lors de la recherche : {e}")
+        return []
+
+def search_dossier_ids(query, archives=False):
+    """Ids de tous les dossiers correspondant à la recherche, sans classement (filtrage des listes)"""
+    match = _fts_query(query)
+    if not match:
+        return set()
+    try:
+        union, params = _union_all(
+            'SELECT rowid FROM {schema}.dossiers_fts WHERE dossiers_fts MATCH ?', (match,), archives
+        )
+        return {row[0] for row in get_connection().execute(union, params)}
+    except sqlite3.OperationalError as e:
+        print(f"Erreur lors de la recherche : {e}")
+        return set()
+
+def search_addresses(query, limit=50):
+    """Recherche plein texte dans le carnet d'adresses, les plus pertinentes en premier"""
+    match = _fts_query(query)
+    if not match:
+        return []
+    try:
+        cursor = get_connection().cursor()
+        cursor.row_factory = row_factory(Address)
+        cursor.execute(f'''
+            SELECT {columns(Address, 'a.')}
+            FROM addresses_fts
+            JOIN addresses a ON a.id = addresses_fts.rowid
+            WHERE addresses_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        ''', (match, -1 if limit is None else limit))
+        return cursor.fetchall()
+    except sqlite3.OperationalError as e:
+        print(f"Erreur lors de la recherche d'adresses : {e}")
+        return []
+
+# Journal des modifications : les vues mémorisent le dernier numéro de
+# séquence lu et n'appliquent ensuite que les changements plus récents
+ChangeFeed = namedtuple('ChangeFeed', ['last_seq', 'changes', 'reset'])
+
+def get_change_seq():
+    """Dernier numéro de séquence attribué dans change_log (0 si aucun)"""
+    row = get_connection().execute(
+        "SELECT seq FROM sqlite_sequence WHERE name = 'change_log'"
+    ).fetchone()
+    return row[0] if row else 0
+
+def changes_since(seq, tables=None):
+    """Changements postérieurs à seq, dans l'ordre (ChangeFeed).
+
+    Sans changement, une seule lecture de la clé primaire. reset vaut True si
+    le journal a été purgé au-delà de seq : la vue doit tout recharger.
+    tables limite les changements retournés (last_seq couvre toujours tout).
+    """
+    cursor = get_connection().cursor()
+    cursor.row_factory = row_factory(Change)
+    changes = cursor.execute(
+        f'SELECT {columns(Change)} FROM change_log WHERE seq > ? ORDER BY seq', (seq,)
+    ).fetchall()
+    if not changes:
+        return ChangeFeed(seq, [], False)
+    pruned = get_connection().execute(
+        "SELECT value FROM settings WHERE key = 'change_log_pruned'"
+    ).fetchone()
+    reset = pruned is not None and seq < int(pruned[0])
+    last_seq = changes[-1].seq
+    if tables is not None:
+        changes = [change for change in changes if change.table_name in tables]
+    return ChangeFeed(last_seq, changes, reset)
+
+def collapse_changes(changes, table):
+    """Résume les changements d'une table : {row_id: op}, une opération par ligne.
+
+    Une ligne créée puis modifiée reste 'insert' ; créée puis supprimée, elle
+    disparaît du résumé.
+    """
+    rows = {}
+    for change in changes:
+        if change.table_name != table:
+            continue
+        previous = rows.get(change.row_id)
+        if previous == 'insert':
+            if change.op == 'delete':
+                del rows[change.row_id]
+        elif previous == 'delete' and change.op == 'insert':
+            rows[change.row_id] = 'update'
+        else:
+            rows[change.row_id] = change.op
+    return rows
+
+def prune_change_log(keep=10000):
+    """Supprime les entrées du journal au-delà des keep plus récentes"""
+    with transaction() as cursor:
+        limit = get_change_seq() - keep
+        if limit <= 0:
+            return 0
+        cursor.execute('DELETE FROM change_log WHERE seq <= ?', (limit,))
+        deleted = cursor.rowcount
+        if deleted:
+            cursor.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES ('change_log_pruned', ?)", (str(limit),)
+            )
+        return deleted
+
 if __name__ == "__main__":
-    create_tables()
\ No newline at end of file
+    create_tables()
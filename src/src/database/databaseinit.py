@@ -6,6 +6,9 @@ import ctypes
 from ctypes import wintypes
 import getpass
 import subprocess
+from .connection import apply_pragma_profile, read_pragma_profile
+from .migrations import migrate, get_schema_version
+from .location import database_location
 
 def get_real_windows_user():
     """Récupère l'utilisateur qui a réellement exécuté le script"""
@@ -41,82 +44,43 @@ def get_real_appdata_path():
 
 def init_database():
     try:
-        # Créer le dossier dans AppData
-        appdata_dir = os.path.join(os.environ['LOCALAPPDATA'], 'NMGFacturation')
-        data_dir = os.path.join(appdata_dir, 'data')
-        os.makedirs(appdata_dir, exist_ok=True)
-        
-        print(f"Création de la base de données dans : {data_dir}")
-        
-        # Chemin de la base de données
-        db_path = os.path.join(data_dir, 'facturation.db')
-        print(f"Tentative de création de la base de données à : {db_path}")
+        # Emplacement résolu maintenant (configure_database, NMG_FACTURATION_DB ou AppData)
+        target = database_location.get()
+        db_path = target.path
 
-        # Test write permissions
-        try:
-            with open(db_path, 'a') as f:
-                pass
-        except Exception as e:
-            print(f"Erreur de permissions lors de l'accès au fichier : {e}")
-            raise e
-
-        # Create database
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Create tables
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS dossiers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            numero_dossier TEXT,
-            adresse_chantier TEXT,
-            libelle_travaux TEXT,
-            adresse_facturation TEXT,
-            moyen_paiement TEXT,
-            garantie_decennale INTEGER,  
-            description TEXT,
-            devis_signe INTEGER DEFAULT 0,
-            facture_payee INTEGER DEFAULT 0,
-            devis_generated INTEGER DEFAULT 0,  
-            facture_generated INTEGER DEFAULT 0
-        )''')
-        
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS produits (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            dossier_id INTEGER,
-            designation TEXT,
-            quantite TEXT,
-            prix REAL,
-            remise REAL,
-            unite TEXT,
-            FOREIGN KEY (dossier_id) REFERENCES dossiers (id)
-        )''')
+        if db_path:
+            # Créer le dossier data (et ses parents) s'il n'existe pas
+            data_dir = os.path.dirname(db_path)
+            os.makedirs(data_dir, exist_ok=True)
+            
+            print(f"Création de la base de données dans : {data_dir}")
+            print(f"Tentative de création de la base de données à : {db_path}")
 
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS options (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            dossier_id INTEGER,
-            designation TEXT,
-            quantite TEXT,
-            prix REAL,
-            remise REAL,
-            unite TEXT,
-            FOREIGN KEY (dossier_id) REFERENCES dossiers (id)
-        )''')
+            # Test write permissions
+            try:
+                with open(db_path, 'a') as f:
+                    pass
+            except Exception as e:
+                print(f"Erreur de permissions lors de l'accès au fichier : {e}")
+                raise e
 
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS addresses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            address TEXT UNIQUE
-        )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        # Create database and apply pending schema migrations
+        conn = sqlite3.connect(target.database, isolation_level=None, uri=target.uri)
+        try:
+            if get_schema_version(conn) == 0 and not conn.execute('SELECT 1 FROM sqlite_master').fetchone():
+                # Base neuve : auto_vacuum ne peut être fixé qu'avant la première table
+                # (les bases existantes sont converties par la première maintenance)
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            migrate(conn)
+            # Appliquer le profil de pragmas enregistré (le mode WAL est persistant)
+            apply_pragma_profile(conn, read_pragma_profile(conn))
+        finally:
+            conn.close()
         
         # Verify file exists and is accessible
-        if os.path.isfile(db_path):
+        if not db_path:
+            print(f"Base de données initialisée : {target.database}")
+        elif os.path.isfile(db_path):
             file_size = os.path.getsize(db_path)
             print(f"Base de données créée avec succès. Taille du fichier: {file_size} bytes")
         else:
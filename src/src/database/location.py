@@ -0,0 +1,112 @@
+import atexit
+import os
+import sqlite3
+import tempfile
+import threading
+from collections import namedtuple
+
+# Emplacement de la base, résolu à la première connexion et non à l'import.
+# Par ordre de priorité : configure_database(cible), la variable
+# d'environnement NMG_FACTURATION_DB, puis le dossier de données de
+# l'utilisateur (LOCALAPPDATA sous Windows, XDG_DATA_HOME ailleurs).
+# Cibles acceptées : un chemin de fichier, ':memory:' ou 'memory:nom' (base
+# jetable partagée par toutes les connexions du processus, repartant vide à
+# chaque configure_database), ':temp:' (fichier temporaire supprimé à la fin
+# du processus) ou une URI 'file:...'.
+
+DB_ENV_VAR = 'NMG_FACTURATION_DB'
+DB_FILENAME = 'facturation.db'
+
+# database et uri sont passés à sqlite3.connect ; path est le fichier (None en mémoire)
+DatabaseTarget = namedtuple('DatabaseTarget', ['database', 'uri', 'path'])
+
+def default_data_dir():
+    """Dossier de données de l'application pour l'utilisateur courant"""
+    base = os.environ.get('LOCALAPPDATA')
+    if not base:
+        base = os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share')
+    return os.path.join(base, 'NMGFacturation', 'data')
+
+def _remove_files(path):
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+
+# Fichiers des bases 'memory:nom' du processus, par nom
+_memory_files = {}
+
+def _memory_file(name):
+    if name not in _memory_files:
+        fd, path = tempfile.mkstemp(prefix=f'{name}_', suffix='.db')
+        os.close(fd)
+        atexit.register(_remove_files, path)
+        _memory_files[name] = path
+    return _memory_files[name]
+
+def _discard_memory_file(database):
+    """Vide une base 'memory:nom' (connexions déjà fermées) : la prochaine repart de zéro"""
+    for name, path in list(_memory_files.items()):
+        if path == database:
+            _remove_files(path)
+            del _memory_files[name]
+
+def resolve_target(target):
+    """Convertit une cible (chemin, ':memory:', 'memory:nom', ':temp:', URI) en DatabaseTarget"""
+    if target == ':memory:':
+        target = 'memory:nmg_facturation'
+    if target.startswith('memory:'):
+        # Fichier temporaire (WAL) plutôt que le cache partagé en mémoire de SQLite :
+        # avec le cache partagé, une lecture pendant une écriture d'un autre thread
+        # échoue aussitôt (SQLITE_LOCKED, sans busy_timeout) au lieu de lire la
+        # dernière version validée. path reste None : pas de sauvegarde ni d'archives.
+        name = target[len('memory:'):] or 'nmg_facturation'
+        return DatabaseTarget(_memory_file(name), False, None)
+    if target == ':temp:':
+        fd, path = tempfile.mkstemp(prefix='nmg_facturation_', suffix='.db')
+        os.close(fd)
+        atexit.register(_remove_files, path)
+        return DatabaseTarget(path, False, path)
+    if target.startswith('file:'):
+        return DatabaseTarget(target, True, None)
+    path = os.path.abspath(os.path.expanduser(target))
+    return DatabaseTarget(path, False, path)
+
+class DatabaseLocation:
+    """Cible de la base, résolue paresseusement et remplaçable (tests, mesures)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured = None
+        self._target = None
+        self._keepalive = None
+
+    def configure(self, target=None):
+        """Fixe la cible (None : revenir à la variable d'environnement ou au défaut)"""
+        with self._lock:
+            self._close_keepalive()
+            if self._target is not None and self._target.path is None:
+                _discard_memory_file(self._target.database)
+            self._configured = target
+            self._target = None
+
+    def get(self):
+        """Retourne la DatabaseTarget courante, résolue au premier appel"""
+        with self._lock:
+            if self._target is None:
+                target = self._configured or os.environ.get(DB_ENV_VAR) \
+                    or os.path.join(default_data_dir(), DB_FILENAME)
+                self._target = resolve_target(target)
+                if self._target.uri and 'mode=memory' in self._target.database:
+                    # Une base en mémoire disparaît avec sa dernière connexion
+                    self._keepalive = sqlite3.connect(self._target.database, uri=True, check_same_thread=False)
+            return self._target
+
+    def _close_keepalive(self):
+        if self._keepalive is not None:
+            self._keepalive.close()
+            self._keepalive = None
+
+# Emplacement partagé par l'initialisation et les connexions de l'application
+database_location = DatabaseLocation()
@@ -0,0 +1,121 @@
+import datetime
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from .database import get_connection, get_db_path, prune_change_log
+
+# Maintenance de la base, à lancer hors du thread de l'interface (thread
+# d'écriture, voir submit_write) quand l'application est inactive :
+# PRAGMA optimize à chaque passage, ANALYZE complet tous les
+# ANALYZE_INTERVAL_DAYS jours, puis récupération des pages libres par
+# incremental_vacuum. Les mesures avant et après chaque passage sont
+# enregistrées dans maintenance_log.
+
+MAINTENANCE_INTERVAL_HOURS = 24
+ANALYZE_INTERVAL_DAYS = 30
+# 2 = INCREMENTAL (PRAGMA auto_vacuum)
+AUTO_VACUUM_INCREMENTAL = 2
+
+# fragmentation : part des pages feuilles qui ne suivent pas la précédente
+# dans le fichier (None si la table virtuelle dbstat n'est pas disponible)
+DatabaseMetrics = namedtuple('DatabaseMetrics', [
+    'page_size', 'page_count', 'freelist_count', 'file_size', 'fragmentation'
+])
+
+MaintenanceRun = namedtuple('MaintenanceRun', [
+    'started_at', 'duration_ms', 'analyzed', 'vacuum', 'before', 'after'
+])
+
+def _pragma(conn, name):
+    return conn.execute(f'PRAGMA {name}').fetchone()[0]
+
+def _fragmentation(conn):
+    try:
+        row = conn.execute('''
+            SELECT count(*), sum(pageno != previous + 1) FROM (
+                SELECT pageno, lag(pageno) OVER (PARTITION BY name ORDER BY path) AS previous
+                FROM dbstat WHERE pagetype = 'leaf'
+            )
+        ''').fetchone()
+    except sqlite3.OperationalError:
+        # SQLite compilé sans SQLITE_ENABLE_DBSTAT_VTAB
+        return None
+    count, scattered = row
+    return round((scattered or 0) / count, 4) if count else 0.0
+
+def database_metrics(conn=None):
+    """Taille et fragmentation de la base (DatabaseMetrics)"""
+    conn = conn or get_connection()
+    page_size = _pragma(conn, 'page_size')
+    page_count = _pragma(conn, 'page_count')
+    path = get_db_path()
+    if path and os.path.isfile(path):
+        file_size = os.path.getsize(path)
+        if os.path.isfile(path + '-wal'):
+            file_size += os.path.getsize(path + '-wal')
+    else:
+        file_size = page_size * page_count
+    return DatabaseMetrics(page_size, page_count, _pragma(conn, 'freelist_count'), file_size, _fragmentation(conn))
+
+def _last_run(conn, analyzed_only=False):
+    condition = 'WHERE analyzed = 1' if analyzed_only else ''
+    row = conn.execute(f'SELECT max(started_at) FROM maintenance_log {condition}').fetchone()
+    return datetime.datetime.fromisoformat(row[0]) if row[0] else None
+
+def maintenance_due(hours=MAINTENANCE_INTERVAL_HOURS):
+    """Vrai si la dernière maintenance date de plus de hours heures"""
+    last = _last_run(get_connection())
+    return last is None or datetime.datetime.now() - last >= datetime.timedelta(hours=hours)
+
+def run_maintenance(analyze=None, vacuum_pages=None):
+    """Optimise la base et retourne le passage effectué (MaintenanceRun).
+
+    analyze=None lance ANALYZE seulement si le dernier date de plus de
+    ANALYZE_INTERVAL_DAYS jours. vacuum_pages limite le nombre de pages
+    libres rendues au système (toutes par défaut). À exécuter hors de toute
+    transaction, de préférence sur le thread d'écriture.
+    """
+    conn = get_connection()
+    started = datetime.datetime.now()
+    start = time.perf_counter()
+    before = database_metrics(conn)
+
+    if analyze is None:
+        last = _last_run(conn, analyzed_only=True)
+        analyze = last is None or started - last >= datetime.timedelta(days=ANALYZE_INTERVAL_DAYS)
+    if analyze:
+        conn.execute('ANALYZE')
+    conn.execute('PRAGMA optimize')
+
+    # Le journal des modifications ne sert qu'au rafraîchissement des vues
+    prune_change_log()
+
+    if _pragma(conn, 'auto_vacuum') != AUTO_VACUUM_INCREMENTAL:
+        # Bases créées avant l'auto_vacuum : le mode ne change qu'avec un VACUUM complet
+        conn.execute(f'PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}')
+        conn.execute('VACUUM')
+        vacuum = 'full'
+    else:
+        # Une page libérée par pas d'exécution, et execute() s'arrête au premier
+        # pas d'une instruction sans colonne : executescript va jusqu'au bout
+        conn.executescript(f'PRAGMA incremental_vacuum({int(vacuum_pages or 0)})')
+        vacuum = 'incremental'
+    if _pragma(conn, 'journal_mode') == 'wal':
+        # Reporte les pages du WAL dans le fichier pour qu'il soit réellement réduit
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    after = database_metrics(conn)
+    duration_ms = int((time.perf_counter() - start) * 1000)
+    conn.execute('''
+        INSERT INTO maintenance_log (
+            started_at, duration_ms, analyzed, vacuum, page_size,
+            page_count_before, freelist_count_before, file_size_before, fragmentation_before,
+            page_count_after, freelist_count_after, file_size_after, fragmentation_after
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        started.isoformat(timespec='seconds'), duration_ms, int(analyze), vacuum, after.page_size,
+        before.page_count, before.freelist_count, before.file_size, before.fragmentation,
+        after.page_count, after.freelist_count, after.file_size, after.fragmentation,
+    ))
+    return MaintenanceRun(started, duration_ms, bool(analyze), vacuum, before, after)
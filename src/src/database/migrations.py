@@ -0,0 +1,696 @@
+import sqlite3
+from .connection import DEFAULT_PRAGMA_PROFILE
+from .models import QUANTITE_KINDS, parse_quantite
+from .numbering import rebuild_numbering
+from .addresses import ADDRESS_ROLES, dedupe_addresses
+from ..utils.money import line_amount_cents, to_cents
+
+# Chaque migration reçoit un curseur déjà placé dans une transaction.
+# Ne jamais modifier une migration publiée : en ajouter une nouvelle à la fin.
+
+def _migration_1(cursor):
+    """Schéma de base (les bases existantes sans version le possèdent déjà)"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS dossiers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        numero_dossier TEXT,
+        adresse_chantier TEXT,
+        libelle_travaux TEXT,
+        adresse_facturation TEXT,
+        moyen_paiement TEXT,
+        garantie_decennale INTEGER,
+        description TEXT,
+        devis_signe INTEGER DEFAULT 0,
+        facture_payee INTEGER DEFAULT 0,
+        devis_generated INTEGER DEFAULT 0,
+        facture_generated INTEGER DEFAULT 0
+    )''')
+
+    # Les anciennes bases n'ont pas les colonnes de statut de génération
+    cursor.execute('PRAGMA table_info(dossiers)')
+    columns = [col[1] for col in cursor.fetchall()]
+    for column in ('devis_generated', 'facture_generated'):
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE dossiers ADD COLUMN {column} INTEGER DEFAULT 0')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS produits (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dossier_id INTEGER,
+        designation TEXT,
+        quantite TEXT,
+        prix REAL,
+        remise REAL,
+        unite TEXT,
+        FOREIGN KEY (dossier_id) REFERENCES dossiers (id)
+    )''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS options (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dossier_id INTEGER,
+        designation TEXT,
+        quantite TEXT,
+        prix REAL,
+        remise REAL,
+        unite TEXT,
+        FOREIGN KEY (dossier_id) REFERENCES dossiers (id)
+    )''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS addresses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        address TEXT UNIQUE
+    )''')
+
+def _migration_2(cursor):
+    """Table des paramètres (profil de pragmas)"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )''')
+    cursor.execute(
+        "INSERT OR IGNORE INTO settings (key, value) VALUES ('pragma_profile', ?)",
+        (DEFAULT_PRAGMA_PROFILE,)
+    )
+
+def _migration_3(cursor):
+    """Index secondaires sur les colonnes de recherche"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_produits_dossier_id ON produits (dossier_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_options_dossier_id ON options (dossier_id)')
+    try:
+        cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_dossiers_numero ON dossiers (numero_dossier)')
+    except sqlite3.IntegrityError:
+        # Des numéros en double existent déjà : on garde un index simple
+        # pour les recherches sans bloquer l'ouverture de la base
+        print("Attention : numéros de dossier en double, index d'unicité non créé")
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_dossiers_numero_dup ON dossiers (numero_dossier)')
+
+# Contenu indexé d'un dossier : ses champs texte et les désignations de ses lignes
+_DOSSIER_FTS_INSERT = '''
+        INSERT INTO dossiers_fts (rowid, numero_dossier, libelle_travaux, adresses, description, lignes)
+        SELECT d.id, d.numero_dossier, d.libelle_travaux,
+               coalesce(d.adresse_chantier, '') || ' ' || coalesce(d.adresse_facturation, ''),
+               d.description,
+               (SELECT group_concat(designation, ' ') FROM (
+                    SELECT designation FROM produits WHERE dossier_id = d.id
+                    UNION ALL
+                    SELECT designation FROM options WHERE dossier_id = d.id))
+        FROM dossiers d'''
+
+# Réindexe un dossier (corps de trigger), {id} étant NEW.x ou OLD.x
+_DOSSIER_FTS_REFRESH = '''
+        DELETE FROM dossiers_fts WHERE rowid = {id};
+        ''' + _DOSSIER_FTS_INSERT + ''' WHERE d.id = {id};'''
+
+def _migration_4(cursor):
+    """Index plein texte (FTS5) des dossiers, de leurs lignes et des adresses"""
+    # remove_diacritics 2 : "facade" trouve "façade" ; prefix accélère les recherches "mot*"
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS dossiers_fts USING fts5(
+        numero_dossier, libelle_travaux, adresses, description, lignes,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )''')
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS addresses_fts USING fts5(
+        address,
+        content = 'addresses', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )''')
+
+    # Synchronisation des dossiers : rowid de dossiers_fts = id du dossier
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS dossiers_fts_insert AFTER INSERT ON dossiers BEGIN
+        {_DOSSIER_FTS_REFRESH.format(id='NEW.id')}
+    END''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS dossiers_fts_update
+    AFTER UPDATE OF id, numero_dossier, libelle_travaux, adresse_chantier,
+                    adresse_facturation, description ON dossiers BEGIN
+        DELETE FROM dossiers_fts WHERE rowid = OLD.id;
+        {_DOSSIER_FTS_REFRESH.format(id='NEW.id')}
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS dossiers_fts_delete AFTER DELETE ON dossiers BEGIN
+        DELETE FROM dossiers_fts WHERE rowid = OLD.id;
+    END''')
+
+    # Les désignations des produits et options sont indexées avec leur dossier
+    for table in ('produits', 'options'):
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+            {_DOSSIER_FTS_REFRESH.format(id='NEW.dossier_id')}
+        END''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_update
+        AFTER UPDATE OF dossier_id, designation ON {table} BEGIN
+            {_DOSSIER_FTS_REFRESH.format(id='OLD.dossier_id')}
+            {_DOSSIER_FTS_REFRESH.format(id='NEW.dossier_id')}
+        END''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+            {_DOSSIER_FTS_REFRESH.format(id='OLD.dossier_id')}
+        END''')
+
+    # Table à contenu externe : les triggers transmettent les anciennes valeurs à FTS5
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS addresses_fts_insert AFTER INSERT ON addresses BEGIN
+        INSERT INTO addresses_fts (rowid, address) VALUES (NEW.id, NEW.address);
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS addresses_fts_update AFTER UPDATE ON addresses BEGIN
+        INSERT INTO addresses_fts (addresses_fts, rowid, address) VALUES ('delete', OLD.id, OLD.address);
+        INSERT INTO addresses_fts (rowid, address) VALUES (NEW.id, NEW.address);
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS addresses_fts_delete AFTER DELETE ON addresses BEGIN
+        INSERT INTO addresses_fts (addresses_fts, rowid, address) VALUES ('delete', OLD.id, OLD.address);
+    END''')
+
+    # Indexation des données existantes
+    cursor.execute('DELETE FROM dossiers_fts')
+    cursor.execute(_DOSSIER_FTS_INSERT)
+    cursor.execute("INSERT INTO addresses_fts (addresses_fts) VALUES ('rebuild')")
+
+def _migration_5(cursor):
+    """Année et numéro extraits de numero_dossier ("AAAA/N"), indexés pour la pagination"""
+    # Colonnes générées virtuelles : calculées à la lecture, seul l'index est stocké
+    cursor.execute('''
+    ALTER TABLE dossiers ADD COLUMN annee INTEGER
+    GENERATED ALWAYS AS (CAST(substr(numero_dossier, 1, instr(numero_dossier, '/') - 1) AS INTEGER)) VIRTUAL
+    ''')
+    cursor.execute('''
+    ALTER TABLE dossiers ADD COLUMN numero INTEGER
+    GENERATED ALWAYS AS (CAST(substr(numero_dossier, instr(numero_dossier, '/') + 1) AS INTEGER)) VIRTUAL
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_dossiers_annee_numero ON dossiers (annee, numero, id)')
+
+# Quantité numérique d'une ligne : "Forfait", "Ensemble", vide ou texte non numérique
+# comptent pour 1 (prix forfaitaire), la virgule décimale est acceptée
+_QUANTITE_SQL = '''
+    CASE WHEN quantite IS NULL OR trim(quantite) = ''
+              OR replace(trim(quantite), ',', '.') GLOB '*[^0-9.]*'
+         THEN 1
+         ELSE CAST(replace(trim(quantite), ',', '.') AS REAL)
+    END'''
+
+# Colonnes de totaux de dossiers alimentées par chaque table de lignes
+_TOTAL_COLUMNS = {
+    'produits': ('total_ht', 'total_remise'),
+    'options': ('total_options', 'total_remise_options'),
+}
+
+def _recompute_totals_sql(table, dossier_id, quantite=_QUANTITE_SQL):
+    """Recalcule les totaux (avant remise, remises) d'une table de lignes pour un dossier"""
+    total, remise = _TOTAL_COLUMNS[table]
+    return f'''
+        UPDATE dossiers SET
+            {total} = (SELECT coalesce(sum({quantite} * coalesce(prix, 0)), 0)
+                       FROM {table} WHERE dossier_id = {dossier_id}),
+            {remise} = (SELECT coalesce(sum(coalesce(remise, 0)), 0)
+                        FROM {table} WHERE dossier_id = {dossier_id})
+        WHERE id = {dossier_id};'''
+
+def _migration_6(cursor):
+    """Totaux des dossiers (produits et options, avant remise et remises) tenus à jour par triggers"""
+    for total, remise in _TOTAL_COLUMNS.values():
+        for column in (total, remise):
+            cursor.execute(f'ALTER TABLE dossiers ADD COLUMN {column} REAL NOT NULL DEFAULT 0')
+
+    # Recalcul complet du dossier concerné à chaque modification : pas de dérive
+    # due aux arrondis, et quelques lignes seulement grâce à l'index sur dossier_id
+    for table in _TOTAL_COLUMNS:
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_totals_insert AFTER INSERT ON {table} BEGIN
+            {_recompute_totals_sql(table, 'NEW.dossier_id')}
+        END''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_totals_update
+        AFTER UPDATE OF dossier_id, quantite, prix, remise ON {table} BEGIN
+            {_recompute_totals_sql(table, 'OLD.dossier_id')}
+            {_recompute_totals_sql(table, 'NEW.dossier_id')}
+        END''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_totals_delete AFTER DELETE ON {table} BEGIN
+            {_recompute_totals_sql(table, 'OLD.dossier_id')}
+        END''')
+        # Calcul initial pour tous les dossiers existants (sous-requêtes corrélées)
+        cursor.execute(_recompute_totals_sql(table, 'dossiers.id'))
+
+def _migration_7(cursor):
+    """Quantité analysée (quantite_num, quantite_kind) stockée à côté du texte affiché"""
+    kinds = ', '.join(f"'{kind}'" for kind in QUANTITE_KINDS)
+    for table in _TOTAL_COLUMNS:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN quantite_num REAL')
+        cursor.execute(f'''
+        ALTER TABLE {table} ADD COLUMN quantite_kind TEXT NOT NULL DEFAULT 'vide'
+        CHECK (quantite_kind IN ({kinds}))''')
+
+        # Analyse en Python, comme à l'enregistrement des lignes
+        cursor.execute(f'SELECT id, quantite FROM {table}')
+        cursor.executemany(
+            f'UPDATE {table} SET quantite_num = ?, quantite_kind = ? WHERE id = ?',
+            [(*parse_quantite(quantite), line_id) for line_id, quantite in cursor.fetchall()]
+        )
+
+        # Les totaux utilisent désormais la quantité numérique (1 si non numérique)
+        for trigger in ('insert', 'update', 'delete'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {table}_totals_{trigger}')
+        quantite = 'coalesce(quantite_num, 1)'
+        cursor.execute(f'''
+        CREATE TRIGGER {table}_totals_insert AFTER INSERT ON {table} BEGIN
+            {_recompute_totals_sql(table, 'NEW.dossier_id', quantite)}
+        END''')
+        cursor.execute(f'''
+        CREATE TRIGGER {table}_totals_update
+        AFTER UPDATE OF dossier_id, quantite_num, prix, remise ON {table} BEGIN
+            {_recompute_totals_sql(table, 'OLD.dossier_id', quantite)}
+            {_recompute_totals_sql(table, 'NEW.dossier_id', quantite)}
+        END''')
+        cursor.execute(f'''
+        CREATE TRIGGER {table}_totals_delete AFTER DELETE ON {table} BEGIN
+            {_recompute_totals_sql(table, 'OLD.dossier_id', quantite)}
+        END''')
+        cursor.execute(_recompute_totals_sql(table, 'dossiers.id', quantite))
+
+# Colonnes de totaux en centimes (remplacent _TOTAL_COLUMNS à partir de la version 8)
+_CENTS_TOTAL_COLUMNS = {
+    'produits': ('total_ht_cents', 'total_remise_cents'),
+    'options': ('total_options_cents', 'total_remise_options_cents'),
+}
+
+def _recompute_cents_totals_sql(table, dossier_id):
+    """Recalcule les totaux en centimes d'une table de lignes pour un dossier (sommes entières exactes)"""
+    total, remise = _CENTS_TOTAL_COLUMNS[table]
+    return f'''
+        UPDATE dossiers SET
+            {total} = (SELECT coalesce(sum(montant_brut_cents), 0)
+                       FROM {table} WHERE dossier_id = {dossier_id}),
+            {remise} = (SELECT coalesce(sum(remise_cents), 0)
+                        FROM {table} WHERE dossier_id = {dossier_id})
+        WHERE id = {dossier_id};'''
+
+def _migration_8(cursor):
+    """Montants en centimes entiers : prix, remise et montant de chaque ligne, totaux des dossiers"""
+    # Les anciens triggers lisent prix et remise, ils doivent disparaître avant ces colonnes
+    for table in _TOTAL_COLUMNS:
+        for trigger in ('insert', 'update', 'delete'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {table}_totals_{trigger}')
+
+    # DROP COLUMN n'existe qu'à partir de SQLite 3.35 : sinon les anciennes
+    # colonnes restent en place, inutilisées
+    drop_columns = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+    for table in _TOTAL_COLUMNS:
+        for column in ('prix_cents', 'remise_cents', 'montant_brut_cents'):
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0')
+
+        # Conversion en Python, avec les mêmes arrondis qu'à l'enregistrement
+        cursor.execute(f'SELECT id, prix, remise, quantite_num FROM {table}')
+        rows = []
+        for line_id, prix, remise, quantite_num in cursor.fetchall():
+            prix_cents = to_cents(prix)
+            rows.append((prix_cents, to_cents(remise), line_amount_cents(prix_cents, quantite_num), line_id))
+        cursor.executemany(
+            f'UPDATE {table} SET prix_cents = ?, remise_cents = ?, montant_brut_cents = ? WHERE id = ?',
+            rows
+        )
+        if drop_columns:
+            cursor.execute(f'ALTER TABLE {table} DROP COLUMN prix')
+            cursor.execute(f'ALTER TABLE {table} DROP COLUMN remise')
+
+    for table in _CENTS_TOTAL_COLUMNS:
+        for column in _CENTS_TOTAL_COLUMNS[table]:
+            cursor.execute(f'ALTER TABLE dossiers ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0')
+        if drop_columns:
+            for column in _TOTAL_COLUMNS[table]:
+                cursor.execute(f'ALTER TABLE dossiers DROP COLUMN {column}')
+
+        cursor.execute(f'''
+        CREATE TRIGGER {table}_totals_insert AFTER INSERT ON {table} BEGIN
+            {_recompute_cents_totals_sql(table, 'NEW.dossier_id')}
+        END''')
+        cursor.execute(f'''
+        CREATE TRIGGER {table}_totals_update
+        AFTER UPDATE OF dossier_id, montant_brut_cents, remise_cents ON {table} BEGIN
+            {_recompute_cents_totals_sql(table, 'OLD.dossier_id')}
+            {_recompute_cents_totals_sql(table, 'NEW.dossier_id')}
+        END''')
+        cursor.execute(f'''
+        CREATE TRIGGER {table}_totals_delete AFTER DELETE ON {table} BEGIN
+            {_recompute_cents_totals_sql(table, 'OLD.dossier_id')}
+        END''')
+        cursor.execute(_recompute_cents_totals_sql(table, 'dossiers.id'))
+
+def _migration_9(cursor):
+    """Numérotation par année et type de document, avec la liste des numéros libres"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS numbering (
+        annee INTEGER NOT NULL,
+        type_document TEXT NOT NULL,
+        dernier INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (annee, type_document)
+    ) WITHOUT ROWID''')
+    # La clé primaire sert d'index : le plus petit numéro libre est lu directement
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS numeros_libres (
+        annee INTEGER NOT NULL,
+        type_document TEXT NOT NULL,
+        numero INTEGER NOT NULL,
+        PRIMARY KEY (annee, type_document, numero)
+    ) WITHOUT ROWID''')
+    rebuild_numbering(cursor)
+
+# Colonnes des lignes après reconstruction (les anciennes colonnes prix et
+# remise, encore présentes sur SQLite < 3.35, disparaissent)
+_LIGNE_TABLE_COLUMNS = (
+    'id', 'dossier_id', 'designation', 'quantite', 'unite', 'quantite_num', 'quantite_kind',
+    'prix_cents', 'remise_cents', 'montant_brut_cents'
+)
+
+def _migration_10(cursor):
+    """Lignes reconstruites avec ON DELETE CASCADE, lignes orphelines purgées"""
+    for table in ('produits', 'options'):
+        # Index et triggers de la table, recréés à l'identique après la reconstruction
+        cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+            (table,)
+        )
+        dependents = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,))
+        sequence = cursor.fetchone()
+
+        cursor.execute(f'''
+        CREATE TABLE {table}_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dossier_id INTEGER NOT NULL REFERENCES dossiers (id) ON DELETE CASCADE,
+            designation TEXT,
+            quantite TEXT,
+            unite TEXT,
+            quantite_num REAL,
+            quantite_kind TEXT NOT NULL DEFAULT 'vide'
+                CHECK (quantite_kind IN ({', '.join(f"'{kind}'" for kind in QUANTITE_KINDS)})),
+            prix_cents INTEGER NOT NULL DEFAULT 0,
+            remise_cents INTEGER NOT NULL DEFAULT 0,
+            montant_brut_cents INTEGER NOT NULL DEFAULT 0
+        )''')
+        # Copie en une requête, sans les lignes dont le dossier n'existe plus
+        column_list = ', '.join(_LIGNE_TABLE_COLUMNS)
+        cursor.execute(f'''
+        INSERT INTO {table}_new ({column_list})
+        SELECT {column_list} FROM {table}
+        WHERE dossier_id IN (SELECT id FROM dossiers)
+        ''')
+        purged = cursor.execute(f'SELECT (SELECT count(*) FROM {table}) - (SELECT count(*) FROM {table}_new)').fetchone()[0]
+        if purged:
+            print(f"{purged} ligne(s) orpheline(s) supprimée(s) de {table}")
+
+        cursor.execute(f'DROP TABLE {table}')
+        # Les triggers de dossiers lisent cette table : sans le mode historique,
+        # RENAME refuse de valider un schéma où elle n'existe plus
+        cursor.execute('PRAGMA legacy_alter_table = ON')
+        cursor.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+        cursor.execute('PRAGMA legacy_alter_table = OFF')
+        if sequence:
+            # Ne pas réattribuer les id des lignes supprimées
+            cursor.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = ?", (sequence[0], table))
+        for sql in dependents:
+            cursor.execute(sql)
+
+    cursor.execute('PRAGMA foreign_key_check')
+    if cursor.fetchone():
+        raise sqlite3.IntegrityError("Clés étrangères invalides après la reconstruction des lignes")
+
+def _migration_11(cursor):
+    """Adresses des dossiers référencées par id, renommage propagé aux dossiers"""
+    for text_column, id_column in ADDRESS_ROLES.values():
+        cursor.execute(f'''
+        ALTER TABLE dossiers ADD COLUMN {id_column} INTEGER
+        REFERENCES addresses (id) ON DELETE SET NULL
+        ''')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_dossiers_{id_column} ON dossiers ({id_column})')
+
+    # Un texte distinct = une adresse ; chaque dossier est relié à la sienne
+    for text_column, id_column in ADDRESS_ROLES.values():
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO addresses (address)
+            SELECT DISTINCT trim({text_column}) FROM dossiers
+            WHERE trim(coalesce({text_column}, '')) != ''
+        ''')
+        # Recherche par l'index d'unicité sur addresses.address
+        cursor.execute(f'''
+            UPDATE dossiers SET {id_column} = (
+                SELECT id FROM addresses WHERE address = trim(dossiers.{text_column})
+            )
+        ''')
+        # Copie texte du dossier identique à l'adresse du carnet (affichage, address_key)
+        cursor.execute(f'''
+            UPDATE dossiers SET {text_column} = trim({text_column})
+            WHERE {text_column} != trim({text_column})
+        ''')
+
+    updates = '\n'.join(
+        f'UPDATE dossiers SET {text_column} = NEW.address WHERE {id_column} = NEW.id;'
+        for text_column, id_column in ADDRESS_ROLES.values()
+    )
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS addresses_dossiers_update AFTER UPDATE OF address ON addresses BEGIN
+        {updates}
+    END''')
+
+def _migration_12(cursor):
+    """Clé d'adresse normalisée (espaces, casse, accents) unique, doublons fusionnés"""
+    cursor.execute('ALTER TABLE addresses ADD COLUMN address_key TEXT')
+    merged = dedupe_addresses(cursor)
+    if merged:
+        print(f"{merged} adresse(s) en double fusionnée(s)")
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_addresses_key ON addresses (address_key)')
+
+# Tables suivies par change_log (lignes de produits et d'options : leurs
+# modifications remontent via la mise à jour des totaux du dossier)
+CHANGE_LOG_TABLES = ('dossiers', 'addresses')
+
+def _migration_13(cursor):
+    """Journal des modifications, alimenté par triggers, pour le rafraîchissement des vues"""
+    # AUTOINCREMENT : les numéros de séquence ne sont jamais réutilisés, même après purge
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete'))
+    )''')
+    for table in CHANGE_LOG_TABLES:
+        for op, row in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_change_{op} AFTER {op.upper()} ON {table} BEGIN
+                INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', {row}.id, '{op}');
+            END''')
+
+def _migration_14(cursor):
+    """Journal de maintenance (ANALYZE, incremental_vacuum) avec mesures avant et après"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS maintenance_log (
+        id INTEGER PRIMARY KEY,
+        started_at TEXT NOT NULL,
+        duration_ms INTEGER,
+        analyzed INTEGER NOT NULL DEFAULT 0,
+        vacuum TEXT,
+        page_size INTEGER,
+        page_count_before INTEGER,
+        freelist_count_before INTEGER,
+        file_size_before INTEGER,
+        fragmentation_before REAL,
+        page_count_after INTEGER,
+        freelist_count_after INTEGER,
+        file_size_after INTEGER,
+        fragmentation_after REAL
+    )''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_maintenance_log_started ON maintenance_log (started_at)')
+
+def _migration_15(cursor):
+    """Registre des archives annuelles et année de chaque dossier archivé"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archives (
+        annee INTEGER PRIMARY KEY,
+        filename TEXT NOT NULL,
+        compressed INTEGER NOT NULL DEFAULT 0,
+        dossiers INTEGER NOT NULL,
+        archived_at TEXT NOT NULL
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archived_dossiers (
+        id INTEGER PRIMARY KEY,
+        annee INTEGER NOT NULL REFERENCES archives (annee)
+    )''')
+
+def _migration_16(cursor):
+    """Pièces jointes des dossiers : contenus dédupliqués par empreinte, vignettes en cache"""
+    # data en dernière colonne : lire l'empreinte ou la taille ne parcourt pas le contenu
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS contenus (
+        id INTEGER PRIMARY KEY,
+        sha256 TEXT NOT NULL UNIQUE,
+        taille INTEGER NOT NULL,
+        data BLOB NOT NULL
+    )''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS pieces_jointes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dossier_id INTEGER NOT NULL REFERENCES dossiers (id) ON DELETE CASCADE,
+        contenu_id INTEGER NOT NULL REFERENCES contenus (id),
+        nom TEXT NOT NULL,
+        type_mime TEXT,
+        ajoute_le TEXT NOT NULL
+    )''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pieces_jointes_dossier_id ON pieces_jointes (dossier_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pieces_jointes_contenu_id ON pieces_jointes (contenu_id)')
+    # Vignettes par empreinte : valables pour les contenus des archives aussi
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS vignettes (
+        sha256 TEXT PRIMARY KEY,
+        data BLOB NOT NULL
+    )''')
+    # Un contenu qui n'est plus joint à aucun dossier est supprimé, avec sa vignette
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS pieces_jointes_contenu_delete AFTER DELETE ON pieces_jointes
+    WHEN NOT EXISTS (SELECT 1 FROM pieces_jointes WHERE contenu_id = OLD.contenu_id) BEGIN
+        DELETE FROM contenus WHERE id = OLD.contenu_id;
+    END''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS contenus_vignette_delete AFTER DELETE ON contenus BEGIN
+        DELETE FROM vignettes WHERE sha256 = OLD.sha256;
+    END''')
+
+def _migration_17(cursor):
+    """Désignations des lignes réindexées une fois par écriture, plus par trigger à chaque ligne"""
+    # Chaque ligne reconstruisait l'entrée plein texte de tout son dossier : un
+    # enregistrement de N lignes coûtait O(N²). Voir search_index.reindex_dossiers.
+    for table in ('produits', 'options'):
+        for trigger in ('insert', 'update', 'delete'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{trigger}')
+
+def _add_cents_totals_sql(table, row, sign):
+    """Ajoute (sign '+') ou retire (sign '-') les montants d'une ligne aux totaux de son dossier"""
+    total, remise = _CENTS_TOTAL_COLUMNS[table]
+    return f'''
+        UPDATE dossiers SET
+            {total} = {total} {sign} {row}.montant_brut_cents,
+            {remise} = {remise} {sign} {row}.remise_cents
+        WHERE id = {row}.dossier_id;'''
+
+def _migration_18(cursor):
+    """Totaux en centimes tenus à jour par différence, sans relire toutes les lignes du dossier"""
+    # Sommes entières exactes : ajouter et retirer chaque ligne ne peut pas dériver,
+    # alors qu'un recalcul complet par ligne coûtait O(N²) pour N lignes enregistrées
+    for table in _CENTS_TOTAL_COLUMNS:
+        for trigger in ('insert', 'update', 'delete'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {table}_totals_{trigger}')
+        cursor.execute(f'''
+        CREATE TRIGGER {table}_totals_insert AFTER INSERT ON {table} BEGIN
+            {_add_cents_totals_sql(table, 'NEW', '+')}
+        END''')
+        cursor.execute(f'''
+        CREATE TRIGGER {table}_totals_update
+        AFTER UPDATE OF dossier_id, montant_brut_cents, remise_cents ON {table} BEGIN
+            {_add_cents_totals_sql(table, 'OLD', '-')}
+            {_add_cents_totals_sql(table, 'NEW', '+')}
+        END''')
+        cursor.execute(f'''
+        CREATE TRIGGER {table}_totals_delete AFTER DELETE ON {table} BEGIN
+            {_add_cents_totals_sql(table, 'OLD', '-')}
+        END''')
+        # Point de départ exact pour les différences
+        cursor.execute(_recompute_cents_totals_sql(table, 'dossiers.id'))
+
+# Colonnes de dossiers affichées par les vues : seules leurs modifications sont journalisées
+_LOGGED_DOSSIER_COLUMNS = (
+    'numero_dossier', 'adresse_chantier', 'libelle_travaux', 'adresse_facturation',
+    'moyen_paiement', 'garantie_decennale', 'description', 'devis_signe', 'facture_payee',
+    'devis_generated', 'facture_generated',
+    'total_ht_cents', 'total_remise_cents', 'total_options_cents', 'total_remise_options_cents'
+)
+
+def _migration_19(cursor):
+    """Une seule entrée de journal pour des mises à jour successives d'un même dossier"""
+    # Chaque ligne enregistrée met à jour les totaux du dossier : sans cela, un
+    # enregistrement de N lignes écrivait N entrées 'update'. L'entrée la plus
+    # récente est remplacée plutôt que conservée : son nouveau numéro de séquence
+    # signale la modification aux vues qui avaient déjà lu l'ancienne.
+    cursor.execute('DROP TRIGGER IF EXISTS dossiers_change_update')
+    cursor.execute(f'''
+    CREATE TRIGGER dossiers_change_update
+    AFTER UPDATE OF {', '.join(_LOGGED_DOSSIER_COLUMNS)} ON dossiers BEGIN
+        DELETE FROM change_log
+        WHERE seq = (SELECT max(seq) FROM change_log)
+          AND table_name = 'dossiers' AND row_id = NEW.id AND op = 'update';
+        INSERT INTO change_log (table_name, row_id, op) VALUES ('dossiers', NEW.id, 'update');
+    END''')
+
+# Registre ordonné : (version atteinte après la migration, fonction)
+MIGRATIONS = [
+    (1, _migration_1),
+    (2, _migration_2),
+    (3, _migration_3),
+    (4, _migration_4),
+    (5, _migration_5),
+    (6, _migration_6),
+    (7, _migration_7),
+    (8, _migration_8),
+    (9, _migration_9),
+    (10, _migration_10),
+    (11, _migration_11),
+    (12, _migration_12),
+    (13, _migration_13),
+    (14, _migration_14),
+    (15, _migration_15),
+    (16, _migration_16),
+    (17, _migration_17),
+    (18, _migration_18),
+    (19, _migration_19),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+class SchemaVersionError(Exception):
+    """La base a été créée par une version plus récente de l'application"""
+
+def get_schema_version(conn):
+    """Retourne la version du schéma (PRAGMA user_version)"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn):
+    """Applique les migrations manquantes, chacune dans sa propre transaction.
+
+    La connexion doit être en mode autocommit (isolation_level=None).
+    Retourne la liste des versions appliquées.
+    """
+    version = get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise SchemaVersionError(
+            f"Version du schéma ({version}) plus récente que celle de l'application ({SCHEMA_VERSION})"
+        )
+
+    applied = []
+    for target, migration in MIGRATIONS:
+        if target <= version:
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            migration(cursor)
+            # user_version est écrit dans la même transaction que la migration
+            cursor.execute(f'PRAGMA user_version = {target}')
+            cursor.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                cursor.execute('ROLLBACK')
+            raise
+        finally:
+            cursor.close()
+        print(f"Migration du schéma appliquée : version {target}")
+        applied.append(target)
+    return applied
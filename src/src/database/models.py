@@ -0,0 +1,70 @@
+import math
+from collections import namedtuple
+
+# Types de lignes renvoyés par la base. Ce sont des tuples nommés : pas de
+# __dict__ par instance (même empreinte mémoire qu'un tuple), accès par nom
+# (dossier.devis_generated) et toujours par position pour l'ancien code.
+
+Dossier = namedtuple('Dossier', [
+    'id', 'numero_dossier', 'adresse_chantier', 'libelle_travaux',
+    'adresse_facturation', 'moyen_paiement', 'garantie_decennale',
+    'description', 'devis_signe', 'facture_payee',
+    'devis_generated', 'facture_generated',
+    # Totaux en centimes tenus à jour par triggers : avant remise et remises, produits puis options
+    'total_ht_cents', 'total_remise_cents', 'total_options_cents', 'total_remise_options_cents'
+])
+
+# Ligne de produit ou d'option ; quantite est le texte affiché,
+# quantite_num / quantite_kind sa valeur analysée (voir parse_quantite).
+# Montants en centimes : montant_brut_cents = prix x quantité, avant remise.
+Ligne = namedtuple('Ligne', [
+    'id', 'dossier_id', 'designation', 'quantite', 'prix_cents', 'remise_cents', 'unite',
+    'quantite_num', 'quantite_kind', 'montant_brut_cents'
+])
+
+# Natures de quantité : seules les quantités 'nombre' ont une valeur numérique,
+# les autres lignes sont facturées au prix unitaire (quantité 1)
+QUANTITE_KINDS = ('nombre', 'forfait', 'ensemble', 'vide', 'texte')
+
+def parse_quantite(quantite):
+    """Analyse une quantité saisie ("2,5", "3", "Forfait"...) et retourne (quantite_num, quantite_kind)"""
+    text = str(quantite).strip() if quantite is not None else ''
+    if not text:
+        return None, 'vide'
+    if text.casefold() in ('forfait', 'ensemble'):
+        return None, text.casefold()
+    try:
+        value = float(text.replace(',', '.'))
+    except ValueError:
+        return None, 'texte'
+    if not math.isfinite(value):
+        return None, 'texte'
+    return value, 'nombre'
+
+Address = namedtuple('Address', ['id', 'address'])
+
+# Projections utilisées par les listes
+# annee et numero forment, avec id, la clé de pagination de la liste des dossiers
+DossierTitre = namedtuple('DossierTitre', ['id', 'numero_dossier', 'libelle_travaux', 'annee', 'numero'])
+
+DocumentResume = namedtuple('DocumentResume', [
+    'id', 'numero_dossier', 'adresse_chantier', 'adresse_facturation',
+    'libelle_travaux', 'statut', 'montant_cents'
+])
+
+# Pièce jointe d'un dossier ; taille et sha256 sont ceux de son contenu (table contenus)
+PieceJointe = namedtuple('PieceJointe', [
+    'id', 'dossier_id', 'nom', 'type_mime', 'taille', 'sha256', 'ajoute_le'
+])
+
+# Entrée du journal des modifications (op : 'insert', 'update' ou 'delete')
+Change = namedtuple('Change', ['seq', 'table_name', 'row_id', 'op'])
+
+def columns(row_type, prefix=''):
+    """Liste SQL des colonnes d'un type de ligne, dans l'ordre de ses champs"""
+    return ', '.join(f'{prefix}{field}' for field in row_type._fields)
+
+def row_factory(row_type):
+    """Retourne une row_factory sqlite3 qui construit des instances de row_type"""
+    make = row_type._make
+    return lambda cursor, row: make(row)
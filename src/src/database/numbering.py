@@ -0,0 +1,132 @@
+import datetime
+
+# Numérotation des dossiers "AAAA/N" : la table numbering garde, par année et
+# type de document, le dernier numéro attribué ; numeros_libres liste les
+# numéros inférieurs restés libres (dossier supprimé, numéro modifié ou sauté
+# à la saisie). Politique : le plus petit numéro libre de l'année est
+# réattribué en premier, sinon dernier + 1. Ces fonctions reçoivent un
+# curseur déjà placé dans la transaction de l'écriture du dossier.
+
+TYPE_DOSSIER = 'dossier'
+# Écart maximal accepté au-dessus du dernier numéro : chaque numéro sauté est
+# inscrit dans numeros_libres, une faute de frappe ("2024/50000") en créerait des milliers
+MAX_NUMBER_GAP = 1000
+
+def split_numero(numero_dossier):
+    """Retourne (annee, numero) d'un numéro "AAAA/N", ou None s'il n'est pas de cette forme"""
+    annee, sep, numero = str(numero_dossier or '').partition('/')
+    try:
+        annee, numero = int(annee), int(numero)
+    except ValueError:
+        return None
+    if not sep or annee <= 0 or numero <= 0:
+        return None
+    return annee, numero
+
+def reserve_number(cursor, annee=None, reuse_gaps=True, type_document=TYPE_DOSSIER):
+    """Réserve le prochain numéro de l'année ; à appeler sous BEGIN IMMEDIATE"""
+    annee = annee or datetime.datetime.now().year
+    cursor.execute(
+        'INSERT OR IGNORE INTO numbering (annee, type_document, dernier) VALUES (?, ?, 0)',
+        (annee, type_document)
+    )
+    if reuse_gaps:
+        # Clé primaire (annee, type_document, numero) : lecture directe du plus petit
+        libre = cursor.execute('''
+            SELECT numero FROM numeros_libres
+            WHERE annee = ? AND type_document = ?
+            ORDER BY numero LIMIT 1
+        ''', (annee, type_document)).fetchone()
+        if libre:
+            cursor.execute(
+                'DELETE FROM numeros_libres WHERE annee = ? AND type_document = ? AND numero = ?',
+                (annee, type_document, libre[0])
+            )
+            return f"{annee}/{libre[0]}"
+    cursor.execute(
+        'UPDATE numbering SET dernier = dernier + 1 WHERE annee = ? AND type_document = ?',
+        (annee, type_document)
+    )
+    dernier = cursor.execute(
+        'SELECT dernier FROM numbering WHERE annee = ? AND type_document = ?',
+        (annee, type_document)
+    ).fetchone()[0]
+    return f"{annee}/{dernier}"
+
+def consume_number(cursor, numero_dossier, type_document=TYPE_DOSSIER):
+    """Marque un numéro comme utilisé ; les numéros sautés deviennent libres.
+
+    Lève ValueError si le numéro dépasse le dernier de plus de MAX_NUMBER_GAP.
+    """
+    key = split_numero(numero_dossier)
+    if key is None:
+        return
+    annee, numero = key
+    cursor.execute(
+        'INSERT OR IGNORE INTO numbering (annee, type_document, dernier) VALUES (?, ?, 0)',
+        (annee, type_document)
+    )
+    dernier = cursor.execute(
+        'SELECT dernier FROM numbering WHERE annee = ? AND type_document = ?',
+        (annee, type_document)
+    ).fetchone()[0]
+    if numero - dernier > MAX_NUMBER_GAP:
+        raise ValueError(
+            f"Le numéro {numero_dossier} dépasse de plus de {MAX_NUMBER_GAP} le dernier numéro "
+            f"de l'année ({annee}/{dernier}) : vérifiez la saisie"
+        )
+    if numero > dernier:
+        cursor.executemany(
+            'INSERT OR IGNORE INTO numeros_libres (annee, type_document, numero) VALUES (?, ?, ?)',
+            ((annee, type_document, n) for n in range(dernier + 1, numero))
+        )
+        cursor.execute(
+            'UPDATE numbering SET dernier = ? WHERE annee = ? AND type_document = ?',
+            (numero, annee, type_document)
+        )
+    else:
+        cursor.execute(
+            'DELETE FROM numeros_libres WHERE annee = ? AND type_document = ? AND numero = ?',
+            (annee, type_document, numero)
+        )
+
+def release_number(cursor, numero_dossier, type_document=TYPE_DOSSIER):
+    """Remet un numéro dans la liste des libres s'il n'est plus porté par aucun dossier"""
+    key = split_numero(numero_dossier)
+    if key is None:
+        return
+    annee, numero = key
+    # Lecture par l'index (annee, numero, id)
+    if cursor.execute(
+        'SELECT 1 FROM dossiers WHERE annee = ? AND numero = ? LIMIT 1', (annee, numero)
+    ).fetchone():
+        return
+    cursor.execute('''
+        INSERT OR IGNORE INTO numeros_libres (annee, type_document, numero)
+        SELECT annee, type_document, ? FROM numbering
+        WHERE annee = ? AND type_document = ? AND dernier >= ?
+    ''', (numero, annee, type_document, numero))
+
+def rebuild_numbering(cursor):
+    """Recalcule la numérotation à partir des dossiers existants"""
+    cursor.execute('DELETE FROM numeros_libres')
+    cursor.execute('DELETE FROM numbering')
+    cursor.execute('''
+        INSERT INTO numbering (annee, type_document, dernier)
+        SELECT annee, ?, max(numero) FROM dossiers
+        WHERE annee > 0 AND numero > 0
+        GROUP BY annee
+    ''', (TYPE_DOSSIER,))
+    # Trous de 1 à dernier non portés par un dossier, année par année
+    cursor.execute('''
+        WITH RECURSIVE sequence (annee, numero, dernier) AS (
+            SELECT annee, 1, dernier FROM numbering WHERE type_document = ?1
+            UNION ALL
+            SELECT annee, numero + 1, dernier FROM sequence WHERE numero < dernier
+        )
+        INSERT INTO numeros_libres (annee, type_document, numero)
+        SELECT annee, ?1, numero FROM sequence
+        WHERE NOT EXISTS (
+            SELECT 1 FROM dossiers d WHERE d.annee = sequence.annee AND d.numero = sequence.numero
+        )
+    ''', (TYPE_DOSSIER,))
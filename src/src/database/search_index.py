@@ -0,0 +1,28 @@
+# Index plein texte des dossiers (dossiers_fts) : une entrée par dossier
+# (rowid = id du dossier) avec ses champs texte et les désignations de ses
+# produits et options. Les triggers de dossiers réindexent un dossier quand
+# ses champs changent ; les écritures de lignes ne déclenchent rien et
+# réindexent leur dossier une seule fois, à la fin de l'écriture (un trigger
+# par ligne reconstruirait toutes les désignations du dossier à chaque
+# ligne). Ces fonctions reçoivent un curseur placé dans une transaction.
+
+_DOSSIER_FTS_INSERT = '''
+    INSERT INTO dossiers_fts (rowid, numero_dossier, libelle_travaux, adresses, description, lignes)
+    SELECT d.id, d.numero_dossier, d.libelle_travaux,
+           coalesce(d.adresse_chantier, '') || ' ' || coalesce(d.adresse_facturation, ''),
+           d.description,
+           (SELECT group_concat(designation, ' ') FROM (
+                SELECT designation FROM produits WHERE dossier_id = d.id
+                UNION ALL
+                SELECT designation FROM options WHERE dossier_id = d.id))
+    FROM dossiers d'''
+
+def reindex_dossiers(cursor, dossier_ids=None):
+    """Réindexe les dossiers dossier_ids après une écriture de lignes (tous si None)"""
+    if dossier_ids is None:
+        cursor.execute('DELETE FROM dossiers_fts')
+        cursor.execute(_DOSSIER_FTS_INSERT)
+        return
+    ids = [(dossier_id,) for dossier_id in set(dossier_ids)]
+    cursor.executemany('DELETE FROM dossiers_fts WHERE rowid = ?', ids)
+    cursor.executemany(_DOSSIER_FTS_INSERT + ' WHERE d.id = ?', ids)
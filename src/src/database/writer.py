@@ -0,0 +1,67 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+class DatabaseWriter:
+    """Thread unique d'écriture en base.
+
+    Les écritures sont des appels de fonctions (update_dossier, add_address...)
+    mis en file et exécutés dans l'ordre par un seul thread, qui possède sa
+    propre connexion (une connexion par thread, voir ConnectionManager). Le
+    thread appelant n'attend ni les verrous ni le fsync du commit : il reçoit
+    un Future. Les lectures restent sur la connexion de leur thread.
+    """
+
+    def __init__(self, name='database-writer'):
+        self._name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Démarre le thread d'écriture s'il ne tourne pas déjà"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        """Met une écriture en file et retourne son Future (résultat ou exception de func)"""
+        future = Future()
+        self.start()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def flush(self, timeout=None):
+        """Attend que toutes les écritures déjà en file soient terminées"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self.submit(lambda: None).result(timeout)
+
+    def pending(self):
+        """Nombre approximatif d'écritures en attente"""
+        return self._queue.qsize()
+
+    def stop(self, timeout=None):
+        """Termine les écritures en file puis arrête le thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, func, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
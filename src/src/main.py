@@ -1,6 +1,7 @@
 import os
 import datetime
 import sys
+import time
 import requests
 import sqlite3
 from pathlib import Path
@@ -14,35 +15,64 @@ if (project_root not in sys.path):
     sys.path.append(project_root)
 
 from PyQt5.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QListWidget,
+    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QListWidget, QListWidgetItem,
     QFormLayout, QLineEdit, QPushButton, QMessageBox, QTableWidget,
     QTableWidgetItem, QLabel, QStackedLayout, QHeaderView, QSplitter,
     QComboBox, QCheckBox, QScrollArea, QTextEdit, QMenu, QDialog,
-    QDialogButtonBox, QSizePolicy, QAbstractItemView, QFileDialog
+    QDialogButtonBox, QSizePolicy, QAbstractItemView, QFileDialog, QStyle
 )
-from PyQt5.QtCore import Qt, pyqtSlot, QSize
-from PyQt5.QtGui import QFont, QIcon, QPalette, QColor
+from PyQt5.QtCore import Qt, pyqtSlot, QSize, QTimer, QEvent, QUrl
+from PyQt5.QtGui import QFont, QIcon, QPalette, QColor, QPixmap, QDesktopServices
 
 from src.database.database import (
-    get_dossiers,
-    get_produits, 
-    get_options,
-    update_dossier,
-    add_dossier,
-    add_produit,
-    add_option,
+    allocate_dossier_number,
+    release_dossier_number,
+    list_dossiers_page,
+    get_dossier_titles,
+    get_change_seq,
+    changes_since,
+    collapse_changes,
+    get_dossier_full,
+    is_archived_dossier,
+    add_attachment,
+    delete_attachment,
+    get_attachments,
+    get_thumbnail,
+    export_attachment,
+    save_dossier_changes,
+    flush_writes,
+    diff_lines,
+    lines_by_id,
+    line_row,
+    LINE_COLUMNS,
+    LINE_PLACEHOLDERS,
     delete_dossier,
-    delete_produits as delete_produits,
-    delete_options as delete_options,
     create_tables,
     get_addresses,
-    update_document_generated
+    update_document_generated,
+    backup_database,
+    get_connection,
+    get_db_path
 )
 from src.database.databaseinit import init_database
+from src.database.migrations import SCHEMA_VERSION, SchemaVersionError, get_schema_version
+from src.database.models import Dossier, columns
+from src.database.addresses import dedupe_addresses, link_dossier_addresses
+from src.database.numbering import rebuild_numbering
+from src.database.search_index import reindex_dossiers
+from src.database.archives import archive_dir
+from src.database.maintenance import maintenance_due, run_maintenance
+from src.utils.money import cents_to_text, to_cents
+from src.utils.write_bridge import get_write_bridge
+from src.utils.attachments import THUMBNAIL_SIZE, attachment_file, make_thumbnail
 from src.views.liste_facture import ListeFacture
 from src.views.liste_devis import ListeDevis
 from src.views.manage_addresses import ManageAddressesDialog
 
+# Vérification de la maintenance toutes les 10 minutes, après 5 minutes sans action
+MAINTENANCE_CHECK_MS = 10 * 60 * 1000
+MAINTENANCE_IDLE_SECONDS = 5 * 60
+
 def load_stylesheet():
     try:
         if getattr(sys, 'frozen', False):
@@ -181,73 +211,62 @@ class DatabaseWarningDialog(QDialog):
         self.setLayout(layout)
 
 def verify_database():
-    """Vérifie si la base de données existe et est valide"""
+    """Vérifie si la base de données existe et peut être ouverte.
+
+    Une seule lecture de PRAGMA user_version suffit : les migrations
+    manquantes sont appliquées ensuite par init_database(), sans perte
+    de données.
+    """
     try:
-        db_path = os.path.join(os.environ['LOCALAPPDATA'], 'NMGFacturation', 'data', 'facturation.db')
-        
-        # Vérifier si le fichier existe
-        if not os.path.exists(db_path):
-            return False
-            
-        # Tenter d'ouvrir la base de données
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        db_path = get_db_path()
         
-        # Définir le schéma attendu pour chaque table
-        expected_schema = {
-            'dossiers': [
-                'id', 'numero_dossier', 'adresse_chantier', 'libelle_travaux',
-                'adresse_facturation', 'moyen_paiement', 'garantie_decennale',
-                'description', 'devis_signe', 'facture_payee',
-                'devis_generated', 'facture_generated'
-            ],
-            'produits': [
-                'id', 'dossier_id', 'designation', 'quantite',
-                'prix', 'remise', 'unite'
-            ],
-            'options': [
-                'id', 'dossier_id', 'designation', 'quantite',
-                'prix', 'remise', 'unite'
-            ],
-            'addresses': [
-                'id', 'address'
-            ]
-        }
-        
-        # Vérifier chaque table
-        for table_name, expected_columns in expected_schema.items():
-            # Vérifier si la table existe
-            cursor.execute(f"""
-                SELECT name FROM sqlite_master 
-                WHERE type='table' AND name='{table_name}'
-            """)
-            if not cursor.fetchone():
-                print(f"Table manquante: {table_name}")
-                return False
-                
-            # Vérifier les colonnes
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            existing_columns = [col[1] for col in cursor.fetchall()]
-            
-            # Vérifier si toutes les colonnes attendues sont présentes
-            missing_columns = set(expected_columns) - set(existing_columns)
-            if missing_columns:
-                print(f"Colonnes manquantes dans {table_name}: {missing_columns}")
+        if db_path is None:
+            # Base en mémoire ou temporaire : pas de fichier, seule la connexion de l'application la voit
+            version = get_schema_version(get_connection())
+        else:
+            # Vérifier si le fichier existe
+            if not os.path.exists(db_path):
                 return False
-        
-        conn.close()
-        return True
-        
+
+            conn = sqlite3.connect(db_path)
+            try:
+                version = get_schema_version(conn)
+            finally:
+                conn.close()
     except Exception as e:
         print(f"Erreur lors de la vérification de la base de données : {e}")
         return False
 
+    if version > SCHEMA_VERSION:
+        raise SchemaVersionError(
+            f"Version du schéma ({version}) plus récente que celle de l'application ({SCHEMA_VERSION})"
+        )
+    if version < SCHEMA_VERSION:
+        print(f"Schéma en version {version}, migration vers la version {SCHEMA_VERSION}")
+    return True
+
 def initialize_database():
     """Initialise ou vérifie la base de données"""
-    db_path = os.path.join(os.environ['LOCALAPPDATA'], 'NMGFacturation', 'data', 'facturation.db')
+    db_path = get_db_path()
+    if db_path is None:
+        # Base en mémoire ou temporaire : aucun fichier à vérifier ni à recréer,
+        # create_tables() applique ensuite le schéma
+        return True
     db_dir = os.path.dirname(db_path)
     
-    if not os.path.exists(db_path) or not verify_database():
+    try:
+        database_ok = os.path.exists(db_path) and verify_database()
+    except SchemaVersionError as e:
+        # Ne jamais proposer de supprimer une base créée par une version plus récente
+        QMessageBox.critical(
+            None,
+            "Erreur",
+            f"La base de données a été créée par une version plus récente de l'application. "
+            f"Veuillez mettre à jour l'application.\n\n{e}"
+        )
+        return False
+
+    if not database_ok:
         dialog = DatabaseWarningDialog()
         if dialog.exec_() == QDialog.Accepted:
             try:
@@ -349,7 +368,7 @@ class BackupDialog(QDialog):
     def backup(self):
         try:
             # Obtenir le chemin de la base de données source
-            db_path = os.path.join(os.environ['LOCALAPPDATA'], 'NMGFacturation', 'data', 'facturation.db')
+            db_path = get_db_path()
             if not os.path.exists(db_path):
                 QMessageBox.warning(self, "Erreur", "Base de données introuvable")
                 return
@@ -368,9 +387,8 @@ class BackupDialog(QDialog):
             )
             
             if file_path:
-                # Copier le fichier
-                import shutil
-                shutil.copy2(db_path, file_path)
+                # Copie cohérente via l'API de sauvegarde SQLite (inclut le journal WAL)
+                backup_database(file_path)
                 QMessageBox.information(self, "Succès", "Sauvegarde effectuée avec succès")
                 self.accept()
 
@@ -398,7 +416,7 @@ class BackupDialog(QDialog):
                 
                 if reply == QMessageBox.Yes:
                     # Get paths
-                    db_path = os.path.join(os.environ['LOCALAPPDATA'], 'NMGFacturation', 'data', 'facturation.db')
+                    db_path = get_db_path()
                     db_dir = os.path.dirname(db_path)
                     os.makedirs(db_dir, exist_ok=True)
                     
@@ -413,54 +431,135 @@ class BackupDialog(QDialog):
                     try:
                         old_cursor = old_conn.cursor()
                         new_cursor = new_conn.cursor()
+                        # Sauvegarde attachée (hors transaction) pour copier les pièces jointes
+                        new_cursor.execute("ATTACH DATABASE ? AS backup", (file_path,))
+
+                        # Années archivées : leurs dossiers sont dans des fichiers à côté de la
+                        # base, que la sauvegarde ne contient pas
+                        new_cursor.execute("SELECT annee FROM archives ORDER BY annee")
+                        current_archives = [str(row[0]) for row in new_cursor.fetchall()]
+                        if current_archives:
+                            QMessageBox.warning(
+                                self,
+                                "Restauration impossible",
+                                "La base actuelle contient des années archivées "
+                                f"({', '.join(current_archives)}) : une sauvegarde ne peut pas "
+                                "être restaurée par-dessus. Restaurez-la dans une base sans archives."
+                            )
+                            return
+                        backup_archives = []
+                        old_cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='archives'")
+                        if old_cursor.fetchone():
+                            old_cursor.execute("SELECT annee, filename, compressed, dossiers, archived_at FROM archives")
+                            backup_archives = old_cursor.fetchall()
+                        missing = [
+                            filename for _, filename, *_ in backup_archives
+                            if not os.path.isfile(os.path.join(archive_dir(db_path), filename))
+                        ]
+                        if missing:
+                            QMessageBox.warning(
+                                self,
+                                "Restauration impossible",
+                                "Archives de la sauvegarde introuvables : "
+                                f"{', '.join(missing)}. Copiez-les dans {archive_dir(db_path)} "
+                                "puis relancez la restauration."
+                            )
+                            return
     
-                        # Transfer dossiers data
-                        old_cursor.execute("SELECT * FROM dossiers")
+                        # Transfer dossiers data (explicit columns: the backup may be
+                        # older, without the generated flags, or have extra columns)
+                        old_cursor.execute("PRAGMA table_info(dossiers)")
+                        old_columns = {col[1] for col in old_cursor.fetchall()}
+                        select = ', '.join(f if f in old_columns else '0' for f in Dossier._fields)
+                        old_cursor.execute(f"SELECT {select} FROM dossiers")
                         dossiers = old_cursor.fetchall()
                         
-                        for dossier in dossiers:
-                            # Add missing columns with default values
-                            dossier_data = list(dossier)
-                            if len(dossier_data) < 12:  # If old schema
-                                dossier_data.extend([0, 0])  # Add devis_generated and facture_generated
-                            
-                            new_cursor.execute('''
-                                INSERT INTO dossiers (
-                                    id, numero_dossier, adresse_chantier, libelle_travaux,
-                                    adresse_facturation, moyen_paiement, garantie_decennale,
-                                    description, devis_signe, facture_payee,
-                                    devis_generated, facture_generated
-                                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        for dossier_data in dossiers:
+                            new_cursor.execute(f'''
+                                INSERT INTO dossiers ({columns(Dossier)})
+                                VALUES ({', '.join('?' * len(Dossier._fields))})
                             ''', dossier_data)
     
-                        # Transfer produits data
-                        old_cursor.execute("SELECT * FROM produits")
-                        produits = old_cursor.fetchall()
-                        for produit in produits:
-                            new_cursor.execute('''
-                                INSERT INTO produits (
-                                    id, dossier_id, designation, quantite,
-                                    prix, remise, unite
-                                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                            ''', produit)
-    
-                        # Transfer options data
-                        old_cursor.execute("SELECT * FROM options")
-                        options = old_cursor.fetchall()
-                        for option in options:
+                        # Registre des archives : les dossiers archivés restent dans leurs fichiers
+                        if backup_archives:
+                            new_cursor.executemany('''
+                                INSERT INTO archives (annee, filename, compressed, dossiers, archived_at)
+                                VALUES (?, ?, ?, ?, ?)
+                            ''', backup_archives)
+                            old_cursor.execute("SELECT id, annee FROM archived_dossiers")
+                            new_cursor.executemany(
+                                'INSERT INTO archived_dossiers (id, annee) VALUES (?, ?)', old_cursor.fetchall()
+                            )
+                            # Un id désigne un seul dossier : la séquence couvre aussi les dossiers archivés
+                            new_cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'dossiers'")
                             new_cursor.execute('''
-                                INSERT INTO options (
-                                    id, dossier_id, designation, quantite,
-                                    prix, remise, unite
-                                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                            ''', option)
+                                INSERT INTO sqlite_sequence (name, seq)
+                                SELECT 'dossiers', max(id) FROM (
+                                    SELECT id FROM dossiers UNION ALL SELECT id FROM archived_dossiers
+                                )
+                            ''')
+
+                        # Transfer produits and options data; the parsed quantity and
+                        # the line amount are recomputed rather than read from the backup
+                        for table in ('produits', 'options'):
+                            old_cursor.execute(f"PRAGMA table_info({table})")
+                            in_cents = 'prix_cents' in {col[1] for col in old_cursor.fetchall()}
+                            money = 'prix_cents, remise_cents' if in_cents else 'prix, remise'
+                            old_cursor.execute(f"""
+                                SELECT id, dossier_id, designation, quantite, {money}, unite
+                                FROM {table}
+                            """)
+                            lines = []
+                            for line_id, dossier_id, designation, quantite, prix, remise, unite in old_cursor.fetchall():
+                                if not in_cents:  # Backup from before integer cents
+                                    prix, remise = to_cents(prix), to_cents(remise)
+                                lines.append((line_id, dossier_id, *line_row((designation, quantite, prix, remise, unite))))
+                            new_cursor.executemany(f'''
+                                INSERT INTO {table} (id, dossier_id, {LINE_COLUMNS})
+                                VALUES (?, {LINE_PLACEHOLDERS})
+                            ''', lines)
     
                         # Transfer addresses data
-                        old_cursor.execute("SELECT * FROM addresses")
+                        old_cursor.execute("SELECT id, address FROM addresses")
                         addresses = old_cursor.fetchall()
                         for address in addresses:
                             new_cursor.execute('INSERT INTO addresses (id, address) VALUES (?, ?)', address)
-    
+
+                        # Transfer settings (pragma profile...) if the backup has them
+                        old_cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='settings'")
+                        if old_cursor.fetchone():
+                            old_cursor.execute("SELECT key, value FROM settings")
+                            for setting in old_cursor.fetchall():
+                                new_cursor.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', setting)
+
+                        # Pièces jointes : les contenus passent d'une base à l'autre dans SQLite,
+                        # sans être chargés par Python ; rattachés par empreinte (contenu_id)
+                        new_cursor.execute("SELECT name FROM backup.sqlite_master WHERE type='table' AND name='contenus'")
+                        if new_cursor.fetchone():
+                            new_cursor.execute('''
+                                INSERT INTO contenus (sha256, taille, data)
+                                SELECT sha256, taille, data FROM backup.contenus
+                                WHERE sha256 NOT IN (SELECT sha256 FROM main.contenus)
+                            ''')
+                            new_cursor.execute('''
+                                INSERT INTO pieces_jointes (id, dossier_id, contenu_id, nom, type_mime, ajoute_le)
+                                SELECT p.id, p.dossier_id, c.id, p.nom, p.type_mime, p.ajoute_le
+                                FROM backup.pieces_jointes p
+                                JOIN backup.contenus b ON b.id = p.contenu_id
+                                JOIN main.contenus c ON c.sha256 = b.sha256
+                            ''')
+                            new_cursor.execute('''
+                                INSERT OR IGNORE INTO vignettes (sha256, data)
+                                SELECT sha256, data FROM backup.vignettes
+                            ''')
+
+                        # Adresses et numérotation recalculées d'après les dossiers restaurés
+                        # (clés normalisées calculées et doublons fusionnés d'abord)
+                        dedupe_addresses(new_cursor)
+                        link_dossier_addresses(new_cursor)
+                        rebuild_numbering(new_cursor)
+                        # Lignes copiées après leurs dossiers : désignations indexées en une fois
+                        reindex_dossiers(new_cursor)
                         new_conn.commit()
                         msg = QMessageBox.information(
                             self, 
@@ -611,6 +710,14 @@ class MainWindow(QWidget):
         self.dossier_list.setContentsMargins(0, 0, 0, 0)  # Remove margins
         self.dossier_list.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)  # Disable horizontal scrolling
         self.dossier_list.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)  # Enable smooth vertical scrolling
+        # Chargement par pages : la page suivante est demandée en approchant du bas de la liste
+        self.dossier_filters = {}
+        self.dossier_page_key = None
+        # Numéro réservé pour le nouveau dossier en cours de saisie
+        self.reserved_numero = None
+        # Écritures en base faites par le thread d'écriture, fin signalée ici
+        self.write_bridge = get_write_bridge()
+        self.dossier_list.verticalScrollBar().valueChanged.connect(self.on_dossier_list_scrolled)
         self.dossier_list.setStyleSheet("""
             QListWidget {
                 padding: 0px;
@@ -669,14 +776,14 @@ class MainWindow(QWidget):
         addresses = get_addresses()
         self.adresse_chantier_input.addItem("")
         for addr in addresses:
-            self.adresse_chantier_input.addItem(addr[1])
+            self.adresse_chantier_input.addItem(addr.address)
         self.libelle_travaux_input = QLineEdit()
         self.adresse_facturation_input = NoScrollComboBox()  # Change this line
         self.adresse_facturation_input.setEditable(True)     # Add this line
         addresses = get_addresses()
         self.adresse_facturation_input.addItem("")
         for addr in addresses:
-            self.adresse_facturation_input.addItem(addr[1])  # Add addresses to combobox
+            self.adresse_facturation_input.addItem(addr.address)  # Add addresses to combobox
         self.moyen_paiement_combo = NoScrollComboBox()
         self.moyen_paiement_combo.addItems(["Virement", "Espèces", "Chèque"])
         self.garantie_decennale_check = QCheckBox()
@@ -863,6 +970,26 @@ class MainWindow(QWidget):
         form_layout.addLayout(checkboxes_layout)
         form_layout.addSpacing(20)
 
+        # Pièces jointes du dossier (devis signés, photos de chantier...)
+        form_layout.addWidget(QLabel("Pièces jointes :"))
+        self.attachments = {}  # {id: PieceJointe} des pièces affichées
+        self.attachments_list = QListWidget()
+        self.attachments_list.setViewMode(QListWidget.IconMode)
+        self.attachments_list.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.attachments_list.setGridSize(QSize(THUMBNAIL_SIZE + 40, THUMBNAIL_SIZE + 40))
+        self.attachments_list.setResizeMode(QListWidget.Adjust)
+        self.attachments_list.setMovement(QListWidget.Static)
+        self.attachments_list.setWordWrap(True)
+        self.attachments_list.setMinimumHeight(THUMBNAIL_SIZE + 60)
+        self.attachments_list.itemDoubleClicked.connect(self.open_attachment)
+        self.attachments_list.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.attachments_list.customContextMenuRequested.connect(self.show_attachment_menu)
+        form_layout.addWidget(self.attachments_list)
+        self.add_attachment_button = QPushButton("Ajouter une pièce jointe")
+        self.add_attachment_button.clicked.connect(self.add_attachments)
+        form_layout.addWidget(self.add_attachment_button)
+        form_layout.addSpacing(20)
+
         # Ajouter les boutons de génération et d'édition
         action_buttons_layout = QHBoxLayout()
         action_buttons_layout.addWidget(self.generate_quote_button)
@@ -956,6 +1083,8 @@ class MainWindow(QWidget):
             }
         """
         self.is_editing = False  # Track if the user is in edit mode
+        self.original_produits = {}  # Lignes chargées {id: valeurs}, pour l'enregistrement différentiel
+        self.original_options = {}
         self.quantity_options = ["", "Forfait", "Ensemble"]
 
         self.check_for_updates()
@@ -965,6 +1094,51 @@ class MainWindow(QWidget):
         self._server.listen("NMGFacturation")
         self._server.newConnection.connect(self._activate_window)
 
+        # Maintenance de la base pendant les périodes d'inactivité
+        self.last_activity = time.monotonic()
+        QApplication.instance().installEventFilter(self)
+        self.maintenance_timer = QTimer(self)
+        self.maintenance_timer.timeout.connect(self.run_idle_maintenance)
+        self.maintenance_timer.start(MAINTENANCE_CHECK_MS)
+
+    def eventFilter(self, obj, event):
+        """Mémorise la dernière action de l'utilisateur (clavier, souris)"""
+        if event.type() in (QEvent.KeyPress, QEvent.MouseButtonPress, QEvent.Wheel):
+            self.last_activity = time.monotonic()
+        return super().eventFilter(obj, event)
+
+    def run_idle_maintenance(self):
+        """Lance la maintenance sur le thread d'écriture si l'application est inactive"""
+        if self.is_editing or self.write_bridge.pending():
+            return
+        if time.monotonic() - self.last_activity < MAINTENANCE_IDLE_SECONDS:
+            return
+        try:
+            if not maintenance_due():
+                return
+        except sqlite3.Error as e:
+            print(f"Erreur lors de la lecture du journal de maintenance : {e}")
+            return
+        self.maintenance_timer.stop()
+        self.write_bridge.submit(
+            run_maintenance,
+            on_done=self.on_maintenance_done,
+            on_error=self.on_maintenance_failed
+        )
+
+    def on_maintenance_done(self, run):
+        before, after = run.before, run.after
+        print(
+            f"Maintenance de la base ({run.vacuum}, analyse : {'oui' if run.analyzed else 'non'}) "
+            f"en {run.duration_ms} ms : {before.file_size} -> {after.file_size} octets, "
+            f"pages libres {before.freelist_count} -> {after.freelist_count}"
+        )
+        self.maintenance_timer.start(MAINTENANCE_CHECK_MS)
+
+    def on_maintenance_failed(self, error):
+        print(f"Erreur lors de la maintenance de la base : {error}")
+        self.maintenance_timer.start(MAINTENANCE_CHECK_MS)
+
     def _activate_window(self):
         """Active la fenêtre quand une autre instance essaie de démarrer"""
         self.setWindowState(self.windowState() & ~Qt.WindowMinimized | Qt.WindowActive)
@@ -1034,33 +1208,67 @@ class MainWindow(QWidget):
         except Exception as e:
             QMessageBox.critical(self, "Erreur", f"Erreur lors du lancement de la mise à jour: {e}")
 
-    def sanitize_input(self, text):
-        return text.replace(',', '.')
-
-    def format_decimal(self, value):
-        return str(value).replace('.', ',')
+    DOSSIER_PAGE_SIZE = 100
 
     def load_dossiers(self):
         self.dossier_list.clear()
-        dossiers = get_dossiers()
-        
-        # Convert dossiers to a list of tuples with parsed year and number
-        sorted_dossiers = []
-        for dossier in dossiers:
-            numero = dossier[1]
-            if '/' in numero:
-                year, num = numero.split('/')
-                sorted_dossiers.append((int(year), int(num), dossier))
-        
-        # Sort by year (descending) then by number (descending)
-        sorted_dossiers.sort(key=lambda x: (-x[0], -x[1]))
-        
-        # Add sorted items to list
-        for _, _, dossier in sorted_dossiers:
-            self.dossier_list.addItem(f"{dossier[1]} - {dossier[3]}")
+        self.dossier_page_key = None
+        self.load_next_dossier_page(first=True)
         
         self.show_select_message()
 
+    def load_next_dossier_page(self, first=False):
+        """Ajoute à la liste la page de dossiers suivante (triés par année puis numéro décroissants)"""
+        if not first and self.dossier_page_key is None:
+            return  # Dernière page déjà chargée
+        if first:
+            # Point de départ des rafraîchissements partiels (refresh_dossier_list)
+            self.dossier_change_seq = get_change_seq()
+        # Les années archivées suivent, leur archive n'étant ouverte qu'en y arrivant
+        page = list_dossiers_page(self.dossier_page_key, self.DOSSIER_PAGE_SIZE, self.dossier_filters, archives=True)
+        self.dossier_page_key = page.next_key
+        
+        for dossier in page.items:
+            item = QListWidgetItem(f"{dossier.numero_dossier} - {dossier.libelle_travaux}")
+            item.setData(Qt.UserRole, dossier.id)  # L'item porte l'id du dossier
+            self.dossier_list.addItem(item)
+
+    def refresh_dossier_list(self):
+        """Applique à la liste des dossiers et aux adresses les changements survenus depuis leur chargement"""
+        feed = changes_since(self.dossier_change_seq)
+        if feed.reset or collapse_changes(feed.changes, 'addresses'):
+            self.refresh_addresses()
+        dossiers = collapse_changes(feed.changes, 'dossiers')
+        # Ajout (rang à déterminer) ou recherche active (résultats à recalculer) : tout recharger
+        if feed.reset or (dossiers and self.dossier_filters) or 'insert' in dossiers.values():
+            self.load_dossiers()
+            return
+        if dossiers:
+            items = {}
+            for i in range(self.dossier_list.count()):
+                item = self.dossier_list.item(i)
+                items[item.data(Qt.UserRole)] = item
+            titles = {titre.id: titre for titre in get_dossier_titles(dossiers)}
+            for dossier_id in dossiers:
+                item = items.get(dossier_id)
+                if item is None:
+                    continue  # Pas encore chargé : la page suivante sera lue à jour
+                titre = titles.get(dossier_id)
+                if titre is None:
+                    self.dossier_list.takeItem(self.dossier_list.row(item))
+                elif not item.text().startswith(f"{titre.numero_dossier} - "):
+                    # Numéro modifié : la position dans la liste change
+                    self.load_dossiers()
+                    return
+                else:
+                    item.setText(f"{titre.numero_dossier} - {titre.libelle_travaux}")
+        self.dossier_change_seq = feed.last_seq
+
+    def on_dossier_list_scrolled(self, value):
+        scroll_bar = self.dossier_list.verticalScrollBar()
+        if value >= scroll_bar.maximum() - scroll_bar.pageStep():
+            self.load_next_dossier_page()
+
     def show_error_message(self, title, message):
         QMessageBox.critical(self, title, message)
 
@@ -1082,89 +1290,26 @@ class MainWindow(QWidget):
                 self.show_error_message("Erreur", "Veuillez remplir tous les champs obligatoires")
                 return False
 
-            if hasattr(self, 'current_dossier_id'):
-                update_dossier(
-                    self.current_dossier_id,
-                    numero_dossier,
-                    adresse_chantier,
-                    libelle_travaux,
-                    adresse_facturation,
-                    moyen_paiement,
-                    garantie_decennale,
-                    description,
-                    devis_signe,
-                    facture_payee,
-                    devis_generated,
-                    facture_generated
-                )
-                dossier_id = self.current_dossier_id
-            else:
-                dossier_id = add_dossier(
-                    numero_dossier,
-                    adresse_chantier,
-                    libelle_travaux,
-                    adresse_facturation,
-                    moyen_paiement,
-                    garantie_decennale,
-                    description,
-                    devis_signe,
-                    facture_payee
-                )
-                self.current_dossier_id = dossier_id
-                self.devis_generated = 0 
-                self.facture_generated = 0
-
-            if not self.save_produits(dossier_id):
-                return False
-                
-            if not self.save_options(dossier_id):
-                return False
-
-            self.disable_editing()  # Désactiver le mode édition
-            
-            # Mettre à jour la liste des dossiers
-            self.load_dossiers()
-            
-            # Trouver et sélectionner le dossier dans la liste
-            for i in range(self.dossier_list.count()):
-                item = self.dossier_list.item(i)
-                if item.text().startswith(f"{numero_dossier} -"):
-                    self.dossier_list.setCurrentItem(item)
-                    # Déclencher manuellement l'événement de clic pour charger le dossier
-                    self.load_dossier(item)
-                    break
-
-            QMessageBox.information(self, "Succès", "Dossier sauvegardé avec succès")
+            # Lire les lignes avant toute écriture (une saisie invalide lève ValueError)
+            produits = self.collect_lines(self.produits_table)
+            options = self.collect_lines(self.options_table)
+
+            # Écriture confiée au thread d'écriture : l'interface n'attend pas le commit
+            fields = (numero_dossier, adresse_chantier, libelle_travaux, adresse_facturation,
+                      moyen_paiement, garantie_decennale, description, devis_signe, facture_payee)
+            self.set_saving(True)
+            self.write_bridge.submit(
+                save_dossier_changes,
+                getattr(self, 'current_dossier_id', None),
+                fields,
+                (devis_generated, facture_generated),
+                diff_lines(self.original_produits, produits),
+                diff_lines(self.original_options, options),
+                on_done=lambda dossier_id: self.on_dossier_saved(dossier_id, numero_dossier),
+                on_error=lambda error: self.on_dossier_save_failed(error, numero_dossier)
+            )
             return True
-            
-        except ValueError:
-            self.show_error_message("Erreur de saisie", "Veuillez entrer des valeurs numériques valides pour les champs numériques.")
-            return False
-        except Exception as e:
-            self.show_error_message("Erreur", f"Une erreur s'est produite lors de la sauvegarde des produits : {e}")
-            return False
 
-    def save_produits(self, dossier_id):
-        try:
-            new_produits = []
-            for row in range(self.produits_table.rowCount()):
-                designation = self.produits_table.item(row, 0).text()
-                # Capitalize first letter of designation
-                designation = designation[0].upper() + designation[1:] if designation else ""
-                
-                quantite = self.produits_table.cellWidget(row, 2).currentText()
-                unite = self.produits_table.cellWidget(row, 3).currentText()
-                unite = None if unite == "aucune" else unite
-                prix = float(self.sanitize_input(self.produits_table.item(row, 1).text()))
-                remise = float(self.sanitize_input(self.produits_table.item(row, 4).text()))
-                if designation or quantite or prix != 0.0:
-                    new_produits.append((designation, quantite, prix, remise, unite))
-
-            delete_produits(dossier_id)
-            for produit in new_produits:
-                add_produit(dossier_id, *produit)
-            return True
-            
         except ValueError:
             self.show_error_message("Erreur de saisie", "Veuillez entrer des valeurs numériques valides pour les champs numériques.")
             return False
@@ -1172,38 +1317,87 @@ class MainWindow(QWidget):
             self.show_error_message("Erreur", f"Une erreur s'est produite lors de la sauvegarde des produits : {e}")
             return False
 
-    def save_options(self, dossier_id):
-        try:
-            new_options = []
-            for row in range(self.options_table.rowCount()):
-                designation = self.options_table.item(row, 0).text()
-                # Capitalize first letter of designation
-                designation = designation[0].upper() + designation[1:] if designation else ""
-                
-                quantite = self.options_table.cellWidget(row, 2).currentText()
-                unite = self.options_table.cellWidget(row, 3).currentText()
-                unite = None if unite == "aucune" else unite
-                prix = float(self.sanitize_input(self.options_table.item(row, 1).text()))
-                remise = float(self.sanitize_input(self.options_table.item(row, 4).text()))
-                if designation or quantite or prix != 0.0:
-                    new_options.append((designation, quantite, prix, remise, unite))
-
-            delete_options(dossier_id)
-            for option in new_options:
-                add_option(dossier_id, *option)
-            return True
-        except Exception as e:
-            self.show_error_message("Erreur", f"Une erreur s'est produite lors de la sauvegarde des options : {e}")
-            return False
+    def set_saving(self, saving):
+        """Fige le formulaire et la liste des dossiers pendant un enregistrement en arrière-plan.
+
+        Jusqu'à on_dossier_saved ou on_dossier_save_failed : les lignes ajoutées
+        n'ont pas encore d'id (un second enregistrement les dupliquerait) et un
+        devis ou une facture lirait des données pas encore validées.
+        """
+        self.form_widget.setEnabled(not saving)
+        self.dossier_list.setEnabled(not saving)
+
+    def on_dossier_saved(self, dossier_id, numero_dossier):
+        """Fin de l'enregistrement d'un dossier (thread de l'interface)"""
+        self.set_saving(False)
+        if not hasattr(self, 'current_dossier_id'):
+            self.current_dossier_id = dossier_id
+            # Numéro réservé remplacé par une saisie manuelle : le rendre
+            if self.reserved_numero and self.reserved_numero != numero_dossier:
+                self.write_bridge.submit(release_dossier_number, self.reserved_numero)
+            self.reserved_numero = None
+            self.devis_generated = 0 
+            self.facture_generated = 0
+
+        # Une adresse saisie librement a pu être ajoutée au carnet
+        self.refresh_addresses()
+
+        # Mettre à jour la liste des dossiers
+        self.load_dossiers()
+
+        # Recharger le formulaire depuis la base, même si le dossier n'est pas dans la
+        # page chargée : les lignes ajoutées reçoivent leur id et original_produits /
+        # original_options reflètent ce qui vient d'être enregistré
+        self.load_dossier_by_id(dossier_id)
+        self.disable_editing()
+        self.edit_button.setEnabled(not is_archived_dossier(dossier_id))
+        self.load_attachments(dossier_id)
+
+        # Sélectionner le dossier dans la liste s'il y figure
+        item = self.find_dossier_item(dossier_id)
+        if item is not None:
+            self.dossier_list.setCurrentItem(item)
+
+        QMessageBox.information(self, "Succès", "Dossier sauvegardé avec succès")
+
+    def on_dossier_save_failed(self, error, numero_dossier):
+        """Échec de l'enregistrement : la saisie est conservée et redevient modifiable"""
+        self.set_saving(False)
+        self.enable_editing()
+        if isinstance(error, sqlite3.IntegrityError):
+            self.show_error_message("Erreur", f"Le numéro de dossier {numero_dossier} existe déjà.")
+        elif isinstance(error, ValueError):
+            # Numéro refusé par la numérotation (trop loin du dernier attribué)
+            self.show_error_message("Numéro de dossier invalide", str(error))
+        else:
+            self.show_error_message("Erreur", f"Une erreur s'est produite lors de la sauvegarde des produits : {error}")
+
+    def collect_lines(self, table):
+        """Lit les lignes (produits ou options) saisies dans un tableau.
+
+        Retourne une liste de (id, valeurs) ; l'id de la ligne en base est
+        porté par la cellule désignation (None pour une nouvelle ligne).
+        """
+        lines = []
+        for row in range(table.rowCount()):
+            line_id = table.item(row, 0).data(Qt.UserRole)
+            designation = table.item(row, 0).text()
+            # Capitalize first letter of designation
+            designation = designation[0].upper() + designation[1:] if designation else ""
+            
+            quantite = table.cellWidget(row, 2).currentText()
+            unite = table.cellWidget(row, 3).currentText()
+            unite = None if unite == "aucune" else unite
+            prix_cents = to_cents(table.item(row, 1).text())
+            remise_cents = to_cents(table.item(row, 4).text())
+            if designation or quantite or prix_cents != 0:
+                lines.append((line_id, (designation, quantite, prix_cents, remise_cents, unite)))
+        return lines
 
     def load_dossier(self, item):
         if self.is_editing:
-            previous_item = None
             # Trouver l'item précédemment sélectionné
-            for i in range(self.dossier_list.count()):
-                if self.dossier_list.item(i).text().startswith(f"{self.numero_dossier_input.text()} -"):
-                    previous_item = self.dossier_list.item(i)
-                    break
+            previous_item = self.find_dossier_item(getattr(self, 'current_dossier_id', None))
                     
             if not self.show_unsaved_changes_warning():
                 # Si l'utilisateur ne veut pas perdre ses modifications,
@@ -1213,69 +1407,65 @@ class MainWindow(QWidget):
 
         try:
             self.hide_select_message()
-            dossier_text = item.text().split(" - ")
-            numero_dossier = dossier_text[0]
-            libelle_travaux = dossier_text[1]
-            self.numero_dossier_input.setText(numero_dossier)
-            self.libelle_travaux_input.setText(libelle_travaux)
-            dossier_id = self.get_dossier_id(numero_dossier)
+            dossier_id = item.data(Qt.UserRole)
             self.current_dossier_id = dossier_id
             self.load_dossier_by_id(dossier_id)
             self.disable_editing()
+            # Dossier d'une année archivée : consultation seulement
+            self.edit_button.setEnabled(not is_archived_dossier(dossier_id))
+            self.load_attachments(dossier_id)
         except Exception as e:
             self.show_error_message("Erreur", f"Une erreur s'est produite lors du chargement du dossier : {e}")
 
     def load_dossier_by_id(self, dossier_id):
         try:
-            dossier = self.get_dossier(dossier_id)
-            self.numero_dossier_input.setText(dossier[1])
-            self.adresse_chantier_input.setCurrentText(dossier[2])
-            self.libelle_travaux_input.setText(dossier[3])
-            self.moyen_paiement_combo.setCurrentText(dossier[5])
-            self.garantie_decennale_check.setChecked(dossier[6] == 1)  
-            self.description_input.setText(dossier[7])
-            self.devis_signe_check.setChecked(dossier[8] == 1)  
-            self.facture_payee_check.setChecked(dossier[9] == 1) 
+            # Dossier, produits et options lus en un seul aller-retour
+            snapshot = get_dossier_full(dossier_id)
+            if snapshot is None:
+                self.show_error_message("Erreur", f"Le dossier {dossier_id} est introuvable")
+                return
+            dossier = snapshot.dossier
+            self.numero_dossier_input.setText(dossier.numero_dossier)
+            self.adresse_chantier_input.setCurrentText(dossier.adresse_chantier)
+            self.libelle_travaux_input.setText(dossier.libelle_travaux)
+            self.moyen_paiement_combo.setCurrentText(dossier.moyen_paiement)
+            self.garantie_decennale_check.setChecked(dossier.garantie_decennale == 1)  
+            self.description_input.setText(dossier.description)
+            self.devis_signe_check.setChecked(dossier.devis_signe == 1)  
+            self.facture_payee_check.setChecked(dossier.facture_payee == 1) 
             
-            self.adresse_facturation_input.setCurrentText(dossier[4])
+            self.adresse_facturation_input.setCurrentText(dossier.adresse_facturation)
             
             # Modifier l'ordre des colonnes dans le tableau des produits
-            produits = get_produits(dossier_id)
+            produits = snapshot.produits
+            # Valeurs lues en base, pour n'enregistrer ensuite que les différences
+            self.original_produits = lines_by_id(produits)
             self.produits_table.setRowCount(len(produits))
             for row, produit in enumerate(produits):
-                designation_item = QTableWidgetItem(produit[2])
-                prix_item = QTableWidgetItem(self.format_decimal(produit[4]))
+                designation_item = QTableWidgetItem(produit.designation)
+                designation_item.setData(Qt.UserRole, produit.id)
+                prix_item = QTableWidgetItem(cents_to_text(produit.prix_cents))
                 
                 # Nouvelle combobox pour la quantité
                 quantity_combo = self.create_quantity_combo()
-                quantity_value = str(produit[3]) if produit[3] is not None else ""
+                quantity_value = str(produit.quantite) if produit.quantite is not None else ""
                 if quantity_value in self.quantity_options:
                     quantity_combo.setCurrentText(quantity_value)
                 else:
                     quantity_combo.setCurrentText(quantity_value)
                 
                 # Configuration de l'unité
-                unite = produit[6] if produit[6] is not None else "aucune"
+                unite = produit.unite if produit.unite is not None else "aucune"
                 unite_combo = NoScrollComboBox()
                 unite_combo.addItems(["aucune", "ml", "m²", "m³"])
                 unite_combo.setCurrentText(unite)
                 unite_combo.setFocusPolicy(Qt.NoFocus)
                 unite_combo.setStyleSheet(self.table_combo_style)
                 
-                remise_item = QTableWidgetItem(self.format_decimal(produit[5]))
-                prix_unitaire = produit[4]
-                remise = produit[5]
+                remise_item = QTableWidgetItem(cents_to_text(produit.remise_cents))
                 
-                try:
-                    if quantity_value and quantity_value not in ["Forfait", "Ensemble"]:
-                        quantite_num = float(quantity_value.replace(',', '.'))
-                        prix_total = (quantite_num * prix_unitaire) - remise
-                    else:
-                        prix_total = prix_unitaire - remise
-                except (ValueError, TypeError):
-                    prix_total = prix_unitaire - remise
-                
-                total_item = QTableWidgetItem(self.format_decimal(round(prix_total, 2)))
+                # Montant avant remise calculé à l'enregistrement, en centimes
+                total_item = QTableWidgetItem(cents_to_text(produit.montant_brut_cents - produit.remise_cents))
                 total_item.setFlags(total_item.flags() & ~Qt.ItemIsEditable)
                 
                 # Mise à jour de l'ordre des colonnes
@@ -1292,48 +1482,39 @@ class MainWindow(QWidget):
                 self.produits_table.setCellWidget(row, 6, delete_button)
             
             # Même logique pour les options
-            options = get_options(dossier_id)
+            options = snapshot.options
+            self.original_options = lines_by_id(options)
             
             # Afficher ou cacher le container des options selon s'il y en a ou non
             self.options_container.setVisible(bool(options))
             
+            self.options_table.setRowCount(len(options))
             if options:
-                self.options_table.setRowCount(len(options))
                 for row, option in enumerate(options):
                     # Même logique que pour les produits
-                    designation_item = QTableWidgetItem(option[2])
-                    prix_item = QTableWidgetItem(self.format_decimal(option[4]))
+                    designation_item = QTableWidgetItem(option.designation)
+                    designation_item.setData(Qt.UserRole, option.id)
+                    prix_item = QTableWidgetItem(cents_to_text(option.prix_cents))
                     
                     quantity_combo = self.create_quantity_combo()
                     quantity_combo.setEditMode(self.is_editing)
-                    quantity_value = str(option[3]) if option[3] is not None else ""
+                    quantity_value = str(option.quantite) if option.quantite is not None else ""
                     if quantity_value in self.quantity_options:
                         quantity_combo.setCurrentText(quantity_value)
                     else:
                         quantity_combo.setCurrentText(quantity_value)
                     
-                    unite = option[6] if option[6] is not None else "aucune"
+                    unite = option.unite if option.unite is not None else "aucune"
                     unite_combo = NoScrollComboBox()
                     unite_combo.addItems(["aucune", "ml", "m²", "m³"])
                     unite_combo.setCurrentText(unite)
                     unite_combo.setFocusPolicy(Qt.NoFocus)
                     unite_combo.setStyleSheet(self.table_combo_style)
                     
-                    remise_item = QTableWidgetItem(self.format_decimal(option[5]))
-                    prix_unitaire = option[4]
-                    remise = option[5]
+                    remise_item = QTableWidgetItem(cents_to_text(option.remise_cents))
                     
-                    # Nouveau calcul du prix total pour les options
-                    try:
-                        if quantity_value and quantity_value not in ["Forfait", "Ensemble"]:
-                            quantite_num = float(quantity_value.replace(',', '.'))
-                            prix_total = (quantite_num * prix_unitaire) - remise
-                        else:
-                            prix_total = prix_unitaire - remise
-                    except (ValueError, TypeError):
-                        prix_total = prix_unitaire - remise
-                    
-                    total_item = QTableWidgetItem(self.format_decimal(round(prix_total, 2)))
+                    # Montant avant remise calculé à l'enregistrement, en centimes
+                    total_item = QTableWidgetItem(cents_to_text(option.montant_brut_cents - option.remise_cents))
                     total_item.setFlags(total_item.flags() & ~Qt.ItemIsEditable)
                     
                     # Mise à jour de l'ordre des colonnes
@@ -1352,18 +1533,14 @@ class MainWindow(QWidget):
         except Exception as e:
             self.show_error_message("Erreur", f"Une erreur s'est produite lors du chargement des détails du dossier : {e}")
 
-    def get_dossier_id(self, numero_dossier):
-        dossiers = get_dossiers()
-        for dossier in dossiers:
-            if dossier[1] == numero_dossier:
-                return dossier[0]
-        return None
-
-    def get_dossier(self, dossier_id):
-        dossiers = get_dossiers()
-        for dossier in dossiers:
-            if dossier[0] == dossier_id:
-                return dossier
+    def find_dossier_item(self, dossier_id):
+        """Retourne l'item de la liste correspondant à un id de dossier"""
+        if dossier_id is None:
+            return None
+        for i in range(self.dossier_list.count()):
+            item = self.dossier_list.item(i)
+            if item.data(Qt.UserRole) == dossier_id:
+                return item
         return None
 
     @pyqtSlot()
@@ -1371,8 +1548,10 @@ class MainWindow(QWidget):
         if self.is_editing and not self.show_unsaved_changes_warning():
             return
         self.hide_select_message()
-        # Effacer tous les champs
-        self.numero_dossier_input.setText(generate_next_dossier_number())  # Modifier cette ligne
+        self.release_reserved_number()
+        # Effacer tous les champs ; le numéro est réservé en base jusqu'à l'enregistrement
+        self.reserved_numero = allocate_dossier_number()
+        self.numero_dossier_input.setText(self.reserved_numero)
         self.adresse_chantier_input.setCurrentIndex(0)
         self.libelle_travaux_input.clear()
         self.adresse_facturation_input.setCurrentIndex(0)
@@ -1385,6 +1564,10 @@ class MainWindow(QWidget):
         
         if hasattr(self, 'current_dossier_id'):
             del self.current_dossier_id
+        # Les pièces jointes s'ajoutent une fois le dossier enregistré
+        self.load_attachments(None)
+        self.original_produits = {}
+        self.original_options = {}
 
         # Désélectionner l'élément sélectionné dans la liste des dossiers
         self.dossier_list.clearSelection()
@@ -1526,7 +1709,7 @@ class MainWindow(QWidget):
                 from src.utils.generate_devis import generate_devis
                 if generate_devis(self.current_dossier_id):
                     QMessageBox.information(self, "Devis", "Devis généré avec succès")
-                    update_document_generated(self.current_dossier_id, 'devis', True)
+                    self.write_bridge.submit(update_document_generated, self.current_dossier_id, 'devis', True)
                     self.devis_generated = 1
                 else:
                     # Ne rien faire si l'utilisateur a annulé
@@ -1567,7 +1750,7 @@ class MainWindow(QWidget):
                 from src.utils.generate_facture import generate_facture
                 if generate_facture(self.current_dossier_id, invoice_type):
                     QMessageBox.information(self, "Facture", f"{invoice_type} générée avec succès")
-                    update_document_generated(self.current_dossier_id, 'facture', True)
+                    self.write_bridge.submit(update_document_generated, self.current_dossier_id, 'facture', True)
                     self.facture_generated = 1
             else:
                 # Ne rien faire si l'utilisateur a annulé
@@ -1671,6 +1854,105 @@ class MainWindow(QWidget):
             if quantity_combo:
                 quantity_combo.setEditMode(False)
 
+    def load_attachments(self, dossier_id):
+        """Affiche les pièces jointes du dossier ; les vignettes manquantes sont générées hors de l'interface"""
+        self.attachments_list.clear()
+        self.attachments = {}
+        self.add_attachment_button.setEnabled(dossier_id is not None and not is_archived_dossier(dossier_id))
+        if dossier_id is None:
+            return
+        file_icon = self.style().standardIcon(QStyle.SP_FileIcon)
+        for piece in get_attachments(dossier_id):
+            self.attachments[piece.id] = piece
+            item = QListWidgetItem(file_icon, piece.nom)
+            item.setData(Qt.UserRole, piece.id)
+            item.setToolTip(f"{piece.nom} ({max(1, piece.taille // 1024)} Ko, ajouté le {piece.ajoute_le[:10]})")
+            self.attachments_list.addItem(item)
+            thumbnail = get_thumbnail(piece.sha256)
+            if thumbnail is not None:
+                self.set_attachment_thumbnail(piece, thumbnail)
+            elif (piece.type_mime or '').startswith('image/'):
+                self.write_bridge.submit(
+                    make_thumbnail, piece,
+                    on_done=lambda data, p=piece: self.set_attachment_thumbnail(p, data)
+                )
+
+    def set_attachment_thumbnail(self, piece, data):
+        if not data or piece.id not in self.attachments:
+            return  # Pas d'image, ou liste rechargée entre-temps
+        pixmap = QPixmap()
+        pixmap.loadFromData(data, 'PNG')
+        for row in range(self.attachments_list.count()):
+            item = self.attachments_list.item(row)
+            if item.data(Qt.UserRole) == piece.id:
+                item.setIcon(QIcon(pixmap))
+
+    def add_attachments(self):
+        dossier_id = getattr(self, 'current_dossier_id', None)
+        if dossier_id is None:
+            return
+        paths, _ = QFileDialog.getOpenFileNames(self, "Ajouter des pièces jointes", "", "Tous les fichiers (*)")
+        for path in paths:
+            # Fichier copié par blocs sur le thread d'écriture
+            self.write_bridge.submit(
+                add_attachment, dossier_id, path,
+                on_done=lambda _, d=dossier_id: self.on_attachments_changed(d),
+                on_error=lambda e, p=path: self.show_error_message(
+                    "Erreur", f"Impossible d'ajouter la pièce jointe {os.path.basename(p)} : {e}"
+                )
+            )
+
+    def on_attachments_changed(self, dossier_id):
+        if getattr(self, 'current_dossier_id', None) == dossier_id:
+            self.load_attachments(dossier_id)
+
+    def open_attachment(self, item):
+        """Ouvre la pièce jointe dans l'application associée à son type"""
+        piece = self.attachments.get(item.data(Qt.UserRole))
+        if piece is None:
+            return
+        try:
+            path = attachment_file(piece)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            self.show_error_message("Erreur", f"Impossible d'ouvrir la pièce jointe : {e}")
+            return
+        QDesktopServices.openUrl(QUrl.fromLocalFile(path))
+
+    def show_attachment_menu(self, position):
+        item = self.attachments_list.itemAt(position)
+        if item is None:
+            return
+        piece = self.attachments.get(item.data(Qt.UserRole))
+        menu = QMenu()
+        menu.addAction("Ouvrir").triggered.connect(lambda: self.open_attachment(item))
+        menu.addAction("Enregistrer sous...").triggered.connect(lambda: self.save_attachment_as(piece))
+        if self.add_attachment_button.isEnabled():
+            menu.addAction("Supprimer").triggered.connect(lambda: self.confirm_delete_attachment(piece))
+        menu.exec_(self.attachments_list.viewport().mapToGlobal(position))
+
+    def save_attachment_as(self, piece):
+        path, _ = QFileDialog.getSaveFileName(self, "Enregistrer la pièce jointe", piece.nom)
+        if not path:
+            return
+        try:
+            export_attachment(piece, path)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            self.show_error_message("Erreur", f"Impossible d'enregistrer la pièce jointe : {e}")
+
+    def confirm_delete_attachment(self, piece):
+        msg_box = QMessageBox()
+        msg_box.setIcon(QMessageBox.Question)
+        msg_box.setWindowTitle('Confirmation')
+        msg_box.setText(f'Êtes-vous sûr de vouloir supprimer la pièce jointe {piece.nom} ?')
+        msg_box.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+        msg_box.button(QMessageBox.Yes).setText("Oui")
+        msg_box.button(QMessageBox.No).setText("Non")
+        if msg_box.exec_() == QMessageBox.Yes:
+            self.write_bridge.submit(
+                delete_attachment, piece.id,
+                on_done=lambda _, d=piece.dossier_id: self.on_attachments_changed(d)
+            )
+
     def show_context_menu(self, position):
         menu = QMenu()
         delete_action = menu.addAction("Supprimer le dossier")
@@ -1680,9 +1962,7 @@ class MainWindow(QWidget):
     def delete_selected_dossier(self):
         selected_item = self.dossier_list.currentItem()
         if selected_item:
-            dossier_text = selected_item.text().split(" - ")
-            numero_dossier = dossier_text[0]
-            dossier_id = self.get_dossier_id(numero_dossier)
+            dossier_id = selected_item.data(Qt.UserRole)
             if dossier_id:
                 msg_box = QMessageBox()
                 msg_box.setIcon(QMessageBox.Question)
@@ -1695,8 +1975,7 @@ class MainWindow(QWidget):
                 no_button.setText("Non")
                 reply = msg_box.exec_()
                 if reply == QMessageBox.Yes:
-                    delete_dossier(dossier_id)
-                    self.load_dossiers()
+                    self.write_bridge.submit(delete_dossier, dossier_id, on_done=lambda _: self.load_dossiers())
 
     def cancel_editing(self):
         """Cancel the editing and reload the current dossier details."""
@@ -1704,12 +1983,19 @@ class MainWindow(QWidget):
             self.load_dossier_by_id(self.current_dossier_id)
         else:
             # Si c'est un nouveau dossier (pas de current_dossier_id)
+            self.release_reserved_number()
             self.show_select_message()  # Afficher le message "Sélectionnez un dossier"
             self.dossier_list.clearSelection()  # Déselectionner tout dossier dans la liste
         
         self.disable_editing()
         self.clear_focus()
 
+    def release_reserved_number(self):
+        """Rend le numéro réservé par un nouveau dossier abandonné"""
+        if self.reserved_numero:
+            self.write_bridge.submit(release_dossier_number, self.reserved_numero)
+            self.reserved_numero = None
+
     def clear_focus(self):
         """Clear focus from all input fields."""
         self.setFocus()
@@ -1728,23 +2014,23 @@ class MainWindow(QWidget):
         reply = msg_box.exec_()
         if reply == QMessageBox.Yes:
             self.is_editing = False
+            self.release_reserved_number()
             return True
         return reply == QMessageBox.Yes
 
     def closeEvent(self, event):
         """Handle the window close event."""
-        if self.is_editing:
-            if self.show_unsaved_changes_warning():
-                event.accept()
-            else:
-                event.ignore()
-        else:
-            event.accept()
+        if self.is_editing and not self.show_unsaved_changes_warning():
+            event.ignore()
+            return
+        # Terminer les écritures encore en file avant de quitter
+        flush_writes()
+        event.accept()
 
     def show_factures(self):
         if self.is_editing and not self.show_unsaved_changes_warning():
             return
-        self.facture_view.load_factures()
+        self.facture_view.refresh_factures()
         self.stacked_layout.setCurrentWidget(self.facture_view)
         self.dossiers_button.setStyleSheet(self.get_button_style(False))
         self.factures_button.setStyleSheet(self.get_button_style(True))
@@ -1754,7 +2040,7 @@ class MainWindow(QWidget):
     def show_devis(self):
         if self.is_editing and not self.show_unsaved_changes_warning():
             return
-        self.devis_view.load_devis()
+        self.devis_view.refresh_devis()
         self.stacked_layout.setCurrentWidget(self.devis_view)
         self.dossiers_button.setStyleSheet(self.get_button_style(False))
         self.factures_button.setStyleSheet(self.get_button_style(False))
@@ -1764,8 +2050,7 @@ class MainWindow(QWidget):
     def show_dossiers(self):
         if self.is_editing and not self.show_unsaved_changes_warning():
             return
-        self.load_dossiers()
-        self.refresh_addresses()
+        self.refresh_dossier_list()
         self.stacked_layout.setCurrentWidget(self.dossiers_splitter)
         self.dossiers_button.setStyleSheet(self.get_button_style(True))
         self.factures_button.setStyleSheet(self.get_button_style(False))
@@ -1775,7 +2060,7 @@ class MainWindow(QWidget):
     def show_addresses(self):
         if self.is_editing and not self.show_unsaved_changes_warning():
             return
-        self.adresses_view.load_addresses()
+        self.adresses_view.refresh_addresses_table()
         self.stacked_layout.setCurrentWidget(self.adresses_view)
         self.dossiers_button.setStyleSheet(self.get_button_style(False))
         self.factures_button.setStyleSheet(self.get_button_style(False))
@@ -1839,10 +2124,12 @@ class MainWindow(QWidget):
         self.right_stack.setCurrentWidget(self.scroll_area)
 
     def filter_dossier_list(self, query):
-        query = query.lower()
-        for row in range(self.dossier_list.count()):
-            item = self.dossier_list.item(row)
-            item.setHidden(query not in item.text().lower())
+        # Recherche plein texte (numéro, libellé, adresses, description et lignes),
+        # appliquée en SQL pour ne charger que les pages de dossiers correspondants
+        self.dossier_filters = {'search': query} if query.strip() else {}
+        self.dossier_list.clear()
+        self.dossier_page_key = None
+        self.load_next_dossier_page(first=True)
 
     def refresh_addresses(self):
         """Update both address comboboxes when addresses are modified"""
@@ -1859,8 +2146,8 @@ class MainWindow(QWidget):
         
         addresses = get_addresses()
         for addr in addresses:
-            self.adresse_chantier_input.addItem(addr[1])
-            self.adresse_facturation_input.addItem(addr[1])
+            self.adresse_chantier_input.addItem(addr.address)
+            self.adresse_facturation_input.addItem(addr.address)
         
         # Restore previous selections if they still exist
         index_chantier = self.adresse_chantier_input.findText(current_chantier)
@@ -1885,37 +2172,6 @@ class MainWindow(QWidget):
         dialog = BackupDialog(self)
         dialog.exec_()
 
-def get_last_dossier_number():
-    try:
-        dossiers = get_dossiers()
-        current_year = datetime.datetime.now().year
-        year_numbers = []
-        
-        for dossier in dossiers:
-            numero = dossier[1]  # Get dossier number
-            if '/' in numero:
-                year, num = numero.split('/')
-                if int(year) == current_year:
-                    year_numbers.append(int(num))
-        
-        # Sort numbers to find gaps
-        year_numbers.sort()
-        
-        # Find first gap in sequence
-        for i in range(1, max(year_numbers) + 2 if year_numbers else 2):
-            if i not in year_numbers:
-                return i - 1  # Return number before gap
-                
-        return 0
-    except:
-        return 0
-
-def generate_next_dossier_number():
-    current_year = datetime.datetime.now().year
-    last_number = get_last_dossier_number()
-    next_number = last_number + 1
-    return f"{current_year}/{next_number}"
-
 if __name__ == "__main__":
     try:
         # Enable DPI scaling
@@ -0,0 +1,64 @@
+import atexit
+import os
+import shutil
+import tempfile
+from PyQt5.QtCore import QBuffer, QIODevice, Qt
+from PyQt5.QtGui import QImageReader
+from src.database.database import export_attachment, get_thumbnail, save_thumbnail
+
+# Côté de la vignette d'une pièce jointe, en pixels
+THUMBNAIL_SIZE = 96
+
+# Copies des pièces jointes ouvertes dans leur application, supprimées à la fermeture
+_open_dir = None
+
+def _remove_open_dir():
+    if _open_dir:
+        shutil.rmtree(_open_dir, ignore_errors=True)
+
+atexit.register(_remove_open_dir)
+
+def attachment_file(piece):
+    """Chemin d'une copie locale de la pièce jointe, extraite par blocs au premier appel"""
+    global _open_dir
+    if _open_dir is None:
+        _open_dir = tempfile.mkdtemp(prefix='nmg_pieces_jointes_')
+    # Un dossier par contenu : le fichier garde son nom pour l'application qui l'ouvre
+    directory = os.path.join(_open_dir, piece.sha256[:16])
+    path = os.path.join(directory, os.path.basename(piece.nom))
+    if not os.path.isfile(path):
+        os.makedirs(directory, exist_ok=True)
+        # Fichier partiel propre à l'appel : la vignette peut extraire la même pièce en parallèle
+        fd, part = tempfile.mkstemp(dir=directory, suffix='.part')
+        os.close(fd)
+        export_attachment(piece, part)
+        os.replace(part, path)
+    return path
+
+def make_thumbnail(piece, size=THUMBNAIL_SIZE):
+    """Vignette PNG d'une pièce jointe image (None sinon), générée au premier appel puis lue en cache.
+
+    Utilise QImage, utilisable hors du thread de l'interface : à lancer sur
+    le thread d'écriture, qui enregistre aussi la vignette en cache.
+    """
+    cached = get_thumbnail(piece.sha256)
+    if cached is not None:
+        return cached
+    if not (piece.type_mime or '').startswith('image/'):
+        return None
+    reader = QImageReader(attachment_file(piece))
+    reader.setAutoTransform(True)
+    original = reader.size()
+    if original.isValid() and (original.width() > size or original.height() > size):
+        # Décodage directement à la taille de la vignette (JPEG : sans l'image entière en mémoire)
+        reader.setScaledSize(original.scaled(size, size, Qt.KeepAspectRatio))
+    image = reader.read()
+    if image.isNull():
+        print(f"Vignette impossible pour {piece.nom} : {reader.errorString()}")
+        return None
+    buffer = QBuffer()
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, 'PNG')
+    data = bytes(buffer.data())
+    save_thumbnail(piece.sha256, data)
+    return data
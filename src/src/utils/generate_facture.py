@@ -3,9 +3,8 @@ from docx import Document
 from docx.shared import Pt, RGBColor, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from datetime import datetime
-from src.database.database import get_dossiers, get_produits, get_options, get_connection
-import tkinter as tk
-from tkinter import filedialog
+from src.database.database import get_dossier_full
+from src.utils.money import format_cents, percent_cents
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 
@@ -44,6 +43,14 @@ def format_number(number):
         print(f"Erreur dans format_number: {e}")
         return str(number)
 
+def format_quantite(ligne):
+    """Quantité d'une ligne pour l'affichage, suivie de son unité"""
+    if ligne.quantite_num is not None:
+        quantite = format_number(ligne.quantite_num)
+    else:
+        quantite = ligne.quantite or ""  # "Forfait", "Ensemble"...
+    return quantite if ligne.unite is None else f'{quantite} {ligne.unite}'
+
 def set_cell_background_color(cell, color):
     """Applique une couleur de fond à une cellule."""
     tcPr = cell._element.get_or_add_tcPr()
@@ -146,9 +153,9 @@ def add_dossier_info(document, dossier):
     # Ajouter les styles
     lines = [
         ("DATE :", datetime.now().strftime('%d/%m/%Y')),
-        ("FACTURE :", f"Selon devis n° {dossier[1]}"),
-        ("ADRESSE CHANTIER :", dossier[2]),
-        ("LIBELLÉ TRAVAUX :", dossier[3])
+        ("FACTURE :", f"Selon devis n° {dossier.numero_dossier}"),
+        ("ADRESSE CHANTIER :", dossier.adresse_chantier),
+        ("LIBELLÉ TRAVAUX :", dossier.libelle_travaux)
     ]
 
     for idx, (label, value) in enumerate(lines):
@@ -190,13 +197,13 @@ def add_dossier_info(document, dossier):
 
     # Tableau avec les informations supplémentaires
     fields = [
-        ("ADRESSE FACTURATION", str(dossier[4])),  # Convertir en string
+        ("ADRESSE FACTURATION", str(dossier.adresse_facturation)),  # Convertir en string
         ("ACOMPTE DEMANDÉ", "50% à la signature"),
         ("MODALITÉS DE PAIEMENT", "À Réception de la facture"),  # Remplacez par la valeur appropriée
-        ("MOYEN DE PAIEMENT", str(dossier[5]))  # Convertir en string
+        ("MOYEN DE PAIEMENT", str(dossier.moyen_paiement))  # Convertir en string
     ]
 
-    if dossier[6] == 1:
+    if dossier.garantie_decennale == 1:
         fields.insert(1, ("GARANTIE", "Décenale"))
 
     num_cols = len(fields)
@@ -257,7 +264,7 @@ def description_dossier(document, dossier):
     document.add_paragraph("Description :")
     # Ajouter un run vide si la description est vide
     description_paragraph = document.add_paragraph()
-    description_run = description_paragraph.add_run(dossier[7] if dossier[7] else "")
+    description_run = description_paragraph.add_run(dossier.description if dossier.description else "")
 
     # Style de paragraphe
     paragraphs = document.paragraphs[-2:]
@@ -275,13 +282,12 @@ def description_dossier(document, dossier):
         description_run.font.size = Pt(10)
         description_paragraph.paragraph_format.space_after = Pt(12)
 
-def add_produits_table(document, produits, dossier_id):
+def add_produits_table(document, produits, options):
     """Ajoute un tableau des produits et options au document."""
     # Check if any product or option has a discount greater than 0
-    show_remise_column = any(produit[5] > 0 for produit in produits)
-    options = get_options(dossier_id)
+    show_remise_column = any(produit.remise_cents > 0 for produit in produits)
     if options:
-        show_remise_column = show_remise_column or any(option[5] > 0 for option in options)
+        show_remise_column = show_remise_column or any(option.remise_cents > 0 for option in options)
 
     # Determine the number of columns based on whether to show the "Remise" column
     num_cols = 5 if show_remise_column else 4
@@ -317,35 +323,23 @@ def add_produits_table(document, produits, dossier_id):
         set_cell_background_color(hdr_cells[idx], colorBlueBackground)
 
     # Table body
-    total_produits_sans_remise = 0  # Total des produits sans remise
-    total_produits_avec_remise = 0  # Total des produits avec remise
-    
     for produit in produits:
         row_cells = table.add_row().cells
-        row_cells[0].text = produit[2]  # Designation
-        row_cells[1].text = f'{format_number(produit[4])} €'  # Prix Unitaire
-        row_cells[2].text = f'{format_number(produit[3])}' if produit[6] is None else f'{format_number(produit[3])} {produit[6]}'  # Quantité
+        row_cells[0].text = produit.designation  # Designation
+        row_cells[1].text = f'{format_cents(produit.prix_cents)} €'  # Prix Unitaire
+        row_cells[2].text = format_quantite(produit)  # Quantité
         
         # Calculer d'abord le total sans remise
-        try:
-            if produit[3] and produit[3] not in ["Forfait", "Ensemble"]:
-                quantite = float(str(produit[3]).replace(',', '.'))
-                total_sans_remise = quantite * produit[4]
-            else:
-                total_sans_remise = produit[4]
-        except (ValueError, TypeError):
-            total_sans_remise = produit[4]
+        total_sans_remise = produit.montant_brut_cents
         
-        total_avec_remise = total_sans_remise - produit[5]
-        total_produits_sans_remise += total_sans_remise
-        total_produits_avec_remise += total_avec_remise
+        total_avec_remise = total_sans_remise - produit.remise_cents
 
         # Affichage dans le tableau
         if show_remise_column:
-            row_cells[3].text = f'{format_number(produit[5])} €'  # Remise
-            row_cells[4].text = f'{format_number(total_avec_remise)} €'  # Total
+            row_cells[3].text = f'{format_cents(produit.remise_cents)} €'  # Remise
+            row_cells[4].text = f'{format_cents(total_avec_remise)} €'  # Total
         else:
-            row_cells[3].text = f'{format_number(total_avec_remise)} €'  # Total
+            row_cells[3].text = f'{format_cents(total_avec_remise)} €'  # Total
 
         for cell in row_cells:
             cell.paragraphs[0].style.font.name = "Arial"
@@ -365,7 +359,7 @@ def add_produits_table(document, produits, dossier_id):
             row_cells = table.add_row().cells
             option_cell = row_cells[0].paragraphs[0]
             option_cell.text = ""  # Clear default text
-            designation_run = option_cell.add_run(f"{option[2]} (option)")
+            designation_run = option_cell.add_run(f"{option.designation} (option)")
             designation_run.font.color.rgb = colorBlueText
             designation_run.font.name = "Arial"
             designation_run.font.size = Pt(10)
@@ -373,29 +367,15 @@ def add_produits_table(document, produits, dossier_id):
             option_cell.vertical_alignment = WD_ALIGN_PARAGRAPH.CENTER
                         
             # Autres cellules
-            row_cells[1].text = f'{format_number(option[4])} €'
-            row_cells[2].text = f'{format_number(option[3])}' if option[6] is None else f'{format_number(option[3])} {option[6]}'
+            row_cells[1].text = f'{format_cents(option.prix_cents)} €'
+            row_cells[2].text = format_quantite(option)
             if show_remise_column:
-                row_cells[3].text = f'{format_number(option[5])} €'
-                try:
-                    if option[3] and option[3] not in ["Forfait", "Ensemble"]:
-                        quantite = float(str(option[3]).replace(',', '.'))
-                        total = (quantite * option[4]) - option[5]
-                    else:
-                        total = option[4] - option[5]
-                except (ValueError, TypeError):
-                    total = option[4] - option[5]
-                row_cells[4].text = f'{format_number(total)} €'
+                row_cells[3].text = f'{format_cents(option.remise_cents)} €'
+                total = option.montant_brut_cents - option.remise_cents
+                row_cells[4].text = f'{format_cents(total)} €'
             else:
-                try:
-                    if option[3] and option[3] not in ["Forfait", "Ensemble"]:
-                        quantite = float(str(option[3]).replace(',', '.'))
-                        total = quantite * option[4]
-                    else:
-                        total = option[4]
-                except (ValueError, TypeError):
-                    total = option[4]
-                row_cells[3].text = f'{format_number(total)} €'
+                total = option.montant_brut_cents
+                row_cells[3].text = f'{format_cents(total)} €'
 
             # Style des autres cellules
             for cell in row_cells[1:]:
@@ -430,8 +410,6 @@ def add_produits_table(document, produits, dossier_id):
     space = document.add_paragraph(f"")
     space.paragraph_format.space_after = Pt(0)
 
-    return total_produits_sans_remise, total_produits_avec_remise
-
 def add_page_number(paragraph):
     """Ajoute la numérotation des pages au format 'Page X/Y'."""
     run = paragraph.add_run("Page ")
@@ -529,17 +507,9 @@ def add_footer_to_last_page(document, invoice_type):
     run2.font.size = Pt(10)
     run2.font.color.rgb = colorBlackText
 
-def save_document(document, dossier_id, invoice_type):
-    """Ouvre une boîte de dialogue pour sauvegarder le document."""
-    root = tk.Tk()
-    root.withdraw()
-
-    # Get dossier to access numero_dossier
-    dossier = get_dossier(dossier_id)
-    if not dossier:
-        return False
-        
-    numero_dossier = dossier[1].replace('/', '-')  # Remplacer '/' par '-'
+def save_document(document, dossier, invoice_type, output_path=None):
+    """Enregistre le document dans output_path, ou à l'endroit choisi dans une boîte de dialogue."""
+    numero_dossier = dossier.numero_dossier.replace('/', '-')  # Remplacer '/' par '-'
 
     # Determine the file name based on the invoice type
     if invoice_type == "Facture classique":
@@ -553,12 +523,20 @@ def save_document(document, dossier_id, invoice_type):
     else:
         file_name = f'facture_{numero_dossier}.docx'
 
-    document_name = filedialog.asksaveasfilename(
-        defaultextension=".docx",
-        filetypes=[("Document Word", "*.docx")],
-        initialfile=file_name,
-        title="Enregistrer la facture sous..."
-    )
+    if output_path:
+        document_name = output_path
+    else:
+        # tkinter n'est chargé que pour la boîte de dialogue (génération possible sans affichage)
+        import tkinter as tk
+        from tkinter import filedialog
+        root = tk.Tk()
+        root.withdraw()
+        document_name = filedialog.asksaveasfilename(
+            defaultextension=".docx",
+            filetypes=[("Document Word", "*.docx")],
+            initialfile=file_name,
+            title="Enregistrer la facture sous..."
+        )
 
     if document_name:
         try:
@@ -572,7 +550,11 @@ def save_document(document, dossier_id, invoice_type):
         print("Enregistrement annulé")
         return False
 
-def generate_facture(dossier_id, invoice_type):
+def generate_facture(dossier_id, invoice_type, output_path=None):
+    """Génère une facture du type demandé pour le dossier spécifié.
+
+    output_path : fichier de destination ; sans lui, une boîte de dialogue le demande.
+    """
     document = Document()
 
     section = document.sections[0]
@@ -588,47 +570,32 @@ def generate_facture(dossier_id, invoice_type):
     page_number_paragraph.paragraph_format.space_before = Pt(12)
     add_page_number(page_number_paragraph)
 
-    dossier = get_dossier(dossier_id)
-    if not isinstance(dossier, tuple):
-        print(f"Erreur: Le dossier {dossier_id} n'a pas été trouvé ou n'est pas au bon format")
+    # Dossier, produits et options lus en un seul aller-retour
+    snapshot = get_dossier_full(dossier_id)
+    if snapshot is None:
+        print(f"Erreur: Le dossier {dossier_id} n'a pas été trouvé")
         return False
 
-    produits = get_produits(dossier_id)
-    if not produits:
-        produits = []
-    options = get_options(dossier_id)
-    if not options:
-        options = []  
+    dossier = snapshot.dossier
+    produits = snapshot.produits
+    options = snapshot.options
 
     set_document_margins(document, top=0.5, bottom=0.5, left=0.5, right=0.5)
     create_header(document, invoice_type)
     add_dossier_info(document, dossier)
     description_dossier(document, dossier)
-    total_produits_sans_remise, total_produits_avec_remise = add_produits_table(document, produits, dossier_id)
+    add_produits_table(document, produits, options)
     
     # Calculate totals
     acompte_percentage = 50.0
     
-    # Initialiser les totaux des options
-    total_options_sans_remise = 0
-    total_options_avec_remise = 0
+    # Totaux stockés dans le dossier, tenus à jour par la base à chaque modification des lignes
+    total_produits_sans_remise = dossier.total_ht_cents
+    total_produits_avec_remise = dossier.total_ht_cents - dossier.total_remise_cents
+    total_options_sans_remise = dossier.total_options_cents
+    total_options_avec_remise = dossier.total_options_cents - dossier.total_remise_options_cents
     
-    # Calculer séparément les totaux des options
     if options:
-        for option in options:
-            try:
-                if option[3] and option[3] not in ["Forfait", "Ensemble"]:
-                    quantite = float(str(option[3]).replace(',', '.'))
-                    option_sans_remise = quantite * option[4]
-                else:
-                    option_sans_remise = option[4]
-            except (ValueError, TypeError):
-                option_sans_remise = option[4]
-            
-            option_avec_remise = option_sans_remise - option[5]
-            total_options_sans_remise += option_sans_remise
-            total_options_avec_remise += option_avec_remise
-
         # Calculs finaux
         sous_total = total_produits_sans_remise  # Total produits sans remises
         sous_total_avec_options = total_produits_sans_remise + total_options_sans_remise  # Total produits et options sans remises
@@ -636,51 +603,51 @@ def generate_facture(dossier_id, invoice_type):
         total_a_payer_avec_options = total_produits_avec_remise + total_options_avec_remise  # Total produits et options avec remises
         
         # Calcul des acomptes
-        acompte = total_a_payer * (acompte_percentage / 100)
-        acompte_avec_options = total_a_payer_avec_options * (acompte_percentage / 100)
+        acompte = percent_cents(total_a_payer, acompte_percentage)
+        acompte_avec_options = percent_cents(total_a_payer_avec_options, acompte_percentage)
         
         # Ajout des totaux selon le type de facture
         if invoice_type == "Facture d'acompte":
             paragraphs = [
-                f"SOUS TOTAL : {format_number(sous_total)} €",
-                f"ACOMPTE A REGLER : {format_number(acompte)} €",
-                f"SOUS TOTAL AVEC OPTIONS : {format_number(sous_total_avec_options)} €",
-                f"ACOMPTE A REGLER AVEC OPTIONS : {format_number(acompte_avec_options)} €"
+                f"SOUS TOTAL : {format_cents(sous_total)} €",
+                f"ACOMPTE A REGLER : {format_cents(acompte)} €",
+                f"SOUS TOTAL AVEC OPTIONS : {format_cents(sous_total_avec_options)} €",
+                f"ACOMPTE A REGLER AVEC OPTIONS : {format_cents(acompte_avec_options)} €"
             ]
         elif invoice_type == "Facture définitive":
             paragraphs = [
-                f"SOUS TOTAL : {format_number(sous_total_avec_options)} €",
+                f"SOUS TOTAL : {format_cents(sous_total_avec_options)} €",
                 f"ACOMPTE VERSÉ LE : ________________",
-                f"TOTAL À RÉGLER CE JOUR : {format_number(total_a_payer_avec_options / 2)} €"
+                f"TOTAL À RÉGLER CE JOUR : {format_cents(percent_cents(total_a_payer_avec_options, 50))} €"
             ]
         else:
             paragraphs = [
-                f"SOUS TOTAL : {format_number(sous_total)} €",
-                f"TOTAL A PAYER : {format_number(total_a_payer)} €",
-                f"SOUS TOTAL AVEC OPTIONS : {format_number(sous_total_avec_options)} €",
-                f"TOTAL A PAYER AVEC OPTIONS : {format_number(total_a_payer_avec_options)} €"
+                f"SOUS TOTAL : {format_cents(sous_total)} €",
+                f"TOTAL A PAYER : {format_cents(total_a_payer)} €",
+                f"SOUS TOTAL AVEC OPTIONS : {format_cents(sous_total_avec_options)} €",
+                f"TOTAL A PAYER AVEC OPTIONS : {format_cents(total_a_payer_avec_options)} €"
             ]
     else:
         # Sans options, les calculs sont plus simples
         sous_total = total_produits_sans_remise
         total_a_payer = total_produits_avec_remise
-        acompte = total_a_payer * (acompte_percentage / 100)
+        acompte = percent_cents(total_a_payer, acompte_percentage)
         
         if invoice_type == "Facture d'acompte":
             paragraphs = [
-                f"SOUS TOTAL : {format_number(sous_total)} €",
-                f"ACOMPTE A REGLER : {format_number(acompte)} €"
+                f"SOUS TOTAL : {format_cents(sous_total)} €",
+                f"ACOMPTE A REGLER : {format_cents(acompte)} €"
             ]
         elif invoice_type == "Facture définitive":
             paragraphs = [
-                f"SOUS TOTAL : {format_number(sous_total)} €",
+                f"SOUS TOTAL : {format_cents(sous_total)} €",
                 f"ACOMPTE VERSÉ LE : ________________",
-                f"TOTAL À RdfGLER CE JOUR : {format_number(total_a_payer / 2)} €"
+                f"TOTAL À RdfGLER CE JOUR : {format_cents(percent_cents(total_a_payer, 50))} €"
             ]
         else:
             paragraphs = [
-                f"SOUS TOTAL : {format_number(sous_total)} €",
-                f"TOTAL A PAYER : {format_number(total_a_payer)} €"
+                f"SOUS TOTAL : {format_cents(sous_total)} €",
+                f"TOTAL A PAYER : {format_cents(total_a_payer)} €"
             ]
 
     # Ajout des paragraphes au document
@@ -709,20 +676,7 @@ def generate_facture(dossier_id, invoice_type):
     paragraph.alignment = WD_ALIGN_PARAGRAPH.RIGHT
 
     add_footer_to_last_page(document, invoice_type)
-    return save_document(document, dossier_id, invoice_type)
-
-def get_dossier(dossier_id):
-    """Récupère un dossier par son ID"""
-    try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM dossiers WHERE id = ?', (dossier_id,))
-        dossier = cursor.fetchone()
-        conn.close()
-        return dossier
-    except Exception as e:
-        print(f"Erreur lors de la récupération du dossier: {e}")
-        return None
+    return save_document(document, dossier, invoice_type, output_path)
 
 if __name__ == "__main__":
     if len(sys.argv) != 3:
@@ -0,0 +1,62 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Les montants sont stockés et calculés en centimes entiers : aucune somme
+# flottante, les totaux en base sont exactement ceux des documents.
+# Les quantités sont ramenées en millièmes pour que le calcul d'une ligne
+# (prix x quantité) reste lui aussi en arithmétique entière.
+QUANTITE_SCALE = 1000
+
+def _to_decimal(value):
+    """Convertit un nombre ou un texte ("12,50", "1 200") en Decimal"""
+    if isinstance(value, Decimal):
+        amount = value
+    else:
+        # str() d'un float donne sa plus courte représentation : 2.675 -> "2.675"
+        text = str(value).strip().replace(',', '.').replace(' ', '').replace('\u00a0', '')
+        try:
+            amount = Decimal(text)
+        except InvalidOperation:
+            raise ValueError(f"Montant invalide : {value!r}") from None
+    if not amount.is_finite():
+        raise ValueError(f"Montant invalide : {value!r}")
+    return amount
+
+def round_div(numerator, denominator):
+    """Division entière arrondie au plus proche, les demis s'éloignant de zéro"""
+    quotient, remainder = divmod(abs(numerator), denominator)
+    if 2 * remainder >= denominator:
+        quotient += 1
+    return quotient if numerator >= 0 else -quotient
+
+def to_cents(value):
+    """Convertit un montant en euros (nombre, texte ou Decimal) en centimes entiers.
+
+    Les valeurs vides valent 0 ; les demi-centimes sont arrondis au supérieur.
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return 0
+    return int((_to_decimal(value) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def to_milli(quantite):
+    """Convertit une quantité en millièmes ; None (forfait, ensemble...) vaut 1"""
+    if quantite is None:
+        return QUANTITE_SCALE
+    return int((_to_decimal(quantite) * QUANTITE_SCALE).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def line_amount_cents(prix_cents, quantite):
+    """Montant avant remise d'une ligne, en centimes : prix unitaire x quantité, arrondi"""
+    return round_div(prix_cents * to_milli(quantite), QUANTITE_SCALE)
+
+def percent_cents(cents, percent):
+    """Part d'un montant en centimes (acompte de 50 %...), arrondie au centime"""
+    return round_div(cents * to_cents(percent), 100 * 100)
+
+def format_cents(cents, thousands=' '):
+    """Formate des centimes pour l'affichage : 123456 -> "1 234,56" """
+    sign = '-' if cents < 0 else ''
+    euros, centimes = divmod(abs(cents), 100)
+    return f"{sign}{euros:,}".replace(',', thousands) + f",{centimes:02d}"
+
+def cents_to_text(cents):
+    """Montant éditable sans séparateur de milliers : 123456 -> "1234,56" """
+    return format_cents(cents, thousands='')
@@ -0,0 +1,59 @@
+import itertools
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+from src.database.database import submit_write
+
+class WriteBridge(QObject):
+    """Relaie vers le thread Qt la fin des écritures du thread d'écriture.
+
+    submit() met l'écriture en file et rend la main aussitôt ; on_done(result)
+    ou on_error(exception) est appelé plus tard dans le thread de l'interface.
+    """
+    write_finished = pyqtSignal(int, object)  # ticket, résultat
+    write_failed = pyqtSignal(int, object)    # ticket, exception
+    _completed = pyqtSignal(int, object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._tickets = itertools.count(1)
+        self._callbacks = {}
+        # Émis depuis le thread d'écriture : connexion en file vers ce thread
+        self._completed.connect(self._dispatch)
+
+    def submit(self, func, *args, on_done=None, on_error=None, **kwargs):
+        """Met func(*args, **kwargs) en file d'écriture ; retourne un numéro de ticket"""
+        ticket = next(self._tickets)
+        self._callbacks[ticket] = (on_done, on_error)
+        future = submit_write(func, *args, **kwargs)
+        future.add_done_callback(lambda f, t=ticket: self._on_future_done(t, f))
+        return ticket
+
+    def pending(self):
+        """Nombre d'écritures soumises dont la fin n'a pas encore été traitée"""
+        return len(self._callbacks)
+
+    def _on_future_done(self, ticket, future):
+        error = future.exception()
+        self._completed.emit(ticket, None if error else future.result(), error)
+
+    @pyqtSlot(int, object, object)
+    def _dispatch(self, ticket, result, error):
+        on_done, on_error = self._callbacks.pop(ticket, (None, None))
+        if error is not None:
+            self.write_failed.emit(ticket, error)
+            if on_error:
+                on_error(error)
+            else:
+                print(f"Erreur lors d'une écriture en base : {error}")
+        else:
+            self.write_finished.emit(ticket, result)
+            if on_done:
+                on_done(result)
+
+_bridge = None
+
+def get_write_bridge():
+    """Retourne le relais partagé (à créer depuis le thread de l'interface)"""
+    global _bridge
+    if _bridge is None:
+        _bridge = WriteBridge()
+    return _bridge
@@ -2,7 +2,8 @@ import sys
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView, QPushButton, QAbstractItemView, QMessageBox, QLineEdit, QHBoxLayout, QComboBox
 from PyQt5.QtGui import QBrush, QColor
 from PyQt5.QtCore import Qt
-from src.database.database import get_dossiers, get_produits  # Correction de l'import
+from src.database.database import get_document_list, search_dossier_ids, get_change_seq, changes_since, collapse_changes
+from src.utils.money import format_cents
 import subprocess
 
 class ListeDevis(QWidget):
@@ -40,7 +41,7 @@ class ListeDevis(QWidget):
         # Ajout du filtre de statut
         self.status_filter = QComboBox()
         self.status_filter.addItems(["Tous", "Signé", "Non signé"])
-        self.status_filter.currentTextChanged.connect(self.filter_table)
+        self.status_filter.currentTextChanged.connect(lambda _: self.load_devis())
         self.status_filter.setStyleSheet("""
             QComboBox {
                 padding: 8px;
@@ -52,14 +53,22 @@ class ListeDevis(QWidget):
             }
         """)
         
+        # Tri par numéro ou par montant, effectué en SQL sur les totaux stockés
+        self.order_filter = QComboBox()
+        self.order_filter.addItem("Trier par numéro", "numero")
+        self.order_filter.addItem("Trier par montant", "montant")
+        self.order_filter.currentIndexChanged.connect(lambda _: self.load_devis())
+        self.order_filter.setStyleSheet(self.status_filter.styleSheet())
+        
         search_layout.addWidget(self.search_input, stretch=1)  # Give search input more space
         search_layout.addWidget(self.status_filter)
+        search_layout.addWidget(self.order_filter)
         self.main_layout.addLayout(search_layout)
 
         # Tableau des devis
         self.table = QTableWidget()
-        self.table.setColumnCount(6)  # Changed from 5 to 6
-        self.table.setHorizontalHeaderLabels(["Numéro Dossier", "Adresse Chantier", "Adresse Facturation", "Libellé Travaux", "Statut", "Télécharger"])
+        self.table.setColumnCount(7)
+        self.table.setHorizontalHeaderLabels(["Numéro Dossier", "Adresse Chantier", "Adresse Facturation", "Libellé Travaux", "Montant", "Statut", "Télécharger"])
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.table.verticalHeader().setVisible(False)
         self.table.setShowGrid(False)
@@ -93,97 +102,109 @@ class ListeDevis(QWidget):
 
         self.load_devis()
 
+    def selected_status(self):
+        return {"Signé": True, "Non signé": False}.get(self.status_filter.currentText())
+
     def load_devis(self):
-        dossiers = get_dossiers()
-        # Filtrer les dossiers où devis_generated == 1
-        dossiers_avec_devis = [d for d in dossiers if d[10] == 1] 
-
-        self.table.setRowCount(len(dossiers_avec_devis))
-        for row, dossier in enumerate(dossiers_avec_devis):
-            columns = [
-                (1, "numero_dossier"),
-                (2, "adresse_chantier"),
-                (4, "adresse_facturation"),  # Index corrigé de 7 à 4
-                (3, "libelle_travaux")
-            ]
-            
-            for col, (index, _) in enumerate(columns):
-                item = QTableWidgetItem(str(dossier[index]))
-                item.setFlags(Qt.ItemIsEnabled)
-                if row % 2 == 0:
-                    item.setBackground(QColor("#f9f9f9"))
-                else:
-                    item.setBackground(QColor("#e0e0e0"))
-                self.table.setItem(row, col, item)
-
-            # Statut de signature
-            devis_signe = dossier[8]
-            item_signe = QTableWidgetItem("Signé" if devis_signe == 1 else "Non signé")
-            item_signe.setForeground(QBrush(QColor("green") if devis_signe == 1 else QColor("red")))
-            item_signe.setFlags(Qt.ItemIsEnabled)
-            item_signe.setTextAlignment(Qt.AlignCenter)
+        # Numéro de séquence lu avant les données : un changement concurrent sera rejoué
+        self.change_seq = get_change_seq()
+        # Filtre de statut appliqué en SQL, seules les colonnes affichées sont lues
+        dossiers = get_document_list('devis', self.selected_status(), self.order_filter.currentData(), archives=True)
+
+        self.table.setRowCount(len(dossiers))
+        for row, dossier in enumerate(dossiers):
+            self.set_devis_row(row, dossier)
+
+        # Réappliquer la recherche texte sur les lignes rechargées
+        self.filter_table()
+
+    def set_devis_row(self, row, dossier):
+        columns = [
+            dossier.numero_dossier,
+            dossier.adresse_chantier,
+            dossier.adresse_facturation,
+            dossier.libelle_travaux
+        ]
+
+        for col, value in enumerate(columns):
+            item = QTableWidgetItem(str(value))
+            item.setData(Qt.UserRole, dossier.id)
+            item.setFlags(Qt.ItemIsEnabled)
             if row % 2 == 0:
-                item_signe.setBackground(QColor("#f9f9f9"))
+                item.setBackground(QColor("#f9f9f9"))
             else:
-                item_signe.setBackground(QColor("#e0e0e0"))
-            self.table.setItem(row, 4, item_signe)  # Index 4 pour le statut
-
-            # Bouton de téléchargement
-            download_button = QPushButton("Télécharger le devis")
-            download_button.clicked.connect(lambda _, d_id=dossier[0]: self.generate_devis(d_id))
-            self.table.setCellWidget(row, 5, download_button)  # Index 5 pour le bouton
+                item.setBackground(QColor("#e0e0e0"))
+            self.table.setItem(row, col, item)
+
+        # Montant des produits remises déduites, lu dans les totaux du dossier
+        item_montant = QTableWidgetItem(f"{format_cents(dossier.montant_cents)} €")
+        item_montant.setData(Qt.UserRole, dossier.id)
+        item_montant.setFlags(Qt.ItemIsEnabled)
+        item_montant.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+        if row % 2 == 0:
+            item_montant.setBackground(QColor("#f9f9f9"))
+        else:
+            item_montant.setBackground(QColor("#e0e0e0"))
+        self.table.setItem(row, 4, item_montant)
+
+        # Statut de signature
+        devis_signe = dossier.statut
+        item_signe = QTableWidgetItem("Signé" if devis_signe == 1 else "Non signé")
+        item_signe.setForeground(QBrush(QColor("green") if devis_signe == 1 else QColor("red")))
+        item_signe.setFlags(Qt.ItemIsEnabled)
+        item_signe.setTextAlignment(Qt.AlignCenter)
+        if row % 2 == 0:
+            item_signe.setBackground(QColor("#f9f9f9"))
+        else:
+            item_signe.setBackground(QColor("#e0e0e0"))
+        self.table.setItem(row, 5, item_signe)  # Index 5 pour le statut
+
+        # Bouton de téléchargement
+        download_button = QPushButton("Télécharger le devis")
+        download_button.clicked.connect(lambda _, d_id=dossier.id: self.generate_devis(d_id))
+        self.table.setCellWidget(row, 6, download_button)  # Index 6 pour le bouton
+
+    def refresh_devis(self):
+        """Applique les changements de dossiers survenus depuis le dernier chargement.
+
+        Sans changement, une seule requête sur le journal. Les dossiers modifiés
+        qui restent au même rang sont mis à jour sur place ; un ajout, un
+        retrait ou un changement d'ordre recharge la liste.
+        """
+        feed = changes_since(self.change_seq, ('dossiers',))
+        if feed.reset:
+            self.load_devis()
+            return
+        changed = collapse_changes(feed.changes, 'dossiers')
+        if changed:
+            order = self.order_filter.currentData()
+            dossiers = {d.id: d for d in get_document_list('devis', self.selected_status(), order, changed, archives=True)}
+            rows = {self.table.item(row, 0).data(Qt.UserRole): row for row in range(self.table.rowCount())}
+            updates = []
+            for dossier_id in changed:
+                row, dossier = rows.get(dossier_id), dossiers.get(dossier_id)
+                if row is None and dossier is None:
+                    continue  # Dossier absent de la liste avant comme après
+                if (row is None or dossier is None
+                        or self.table.item(row, 0).text() != dossier.numero_dossier
+                        or (order == 'montant' and self.table.item(row, 4).text() != f"{format_cents(dossier.montant_cents)} €")):
+                    self.load_devis()
+                    return
+                updates.append((row, dossier))
+            for row, dossier in updates:
+                self.set_devis_row(row, dossier)
+            self.filter_table()
+        self.change_seq = feed.last_seq
 
     def filter_table(self):
-        search_text = self.search_input.text().lower()
-        status_filter = self.status_filter.currentText()
+        # Le statut est déjà filtré en SQL, seule la recherche plein texte est appliquée ici
+        search_text = self.search_input.text()
+        ids = search_dossier_ids(search_text, archives=True) if search_text.strip() else None
         
         for row in range(self.table.rowCount()):
-            show_row = False
-            match_text = False
-            match_status = False
-            
-            # Vérification du texte de recherche
-            for col in range(self.table.columnCount() - 1):
-                item = self.table.item(row, col)
-                if item and search_text in item.text().lower():
-                    match_text = True
-                    break
-            
-            # Vérification du statut
-            status_item = self.table.item(row, 3)
-            if status_filter == "Tous":
-                match_status = True
-            elif status_filter == "Signé" and status_item.text() == "Signé":
-                match_status = True
-            elif status_filter == "Non signé" and status_item.text() == "Non signé":
-                match_status = True
-                
-            show_row = match_text and match_status
-            self.table.setRowHidden(row, not show_row)
-
-    def calculate_total_devis(self, dossier_id):
-        try:
-            produits = get_produits(dossier_id)
-            total = 0
-            for produit in produits:
-                prix_unitaire = float(produit[4])  # prix unitaire à l'index 4
-                remise = float(produit[5])  # remise à l'index 5
-                quantite = produit[3]  # quantité (TEXT) à l'index 3
-                
-                # Calcul du total selon le type de quantité
-                if quantite and quantite not in ["Forfait", "Ensemble"]:
-                    try:
-                        quantite_num = float(str(quantite).replace(',', '.'))
-                        total += (quantite_num * prix_unitaire) - remise
-                    except (ValueError, TypeError):
-                        total += prix_unitaire - remise
-                else:
-                    total += prix_unitaire - remise
-                    
-            return total
-        except Exception as e:
-            print(f"Erreur dans calculate_total_devis: {e}")
-            return 0
+            item = self.table.item(row, 0)
+            self.table.setRowHidden(row, ids is not None and item.data(Qt.UserRole) not in ids)
+
 
     def generate_devis(self, dossier_id):
         try:
@@ -1,10 +1,15 @@
 import sys
+import sqlite3
 from PyQt5.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
-    QPushButton, QLineEdit, QMessageBox, QWidget, QAbstractItemView
+    QPushButton, QLineEdit, QMessageBox, QWidget, QAbstractItemView, QLabel, QListWidget
 )
 from PyQt5.QtCore import Qt, pyqtSignal
-from src.database.database import get_addresses, get_connection
+from src.database.database import (
+    get_addresses, search_addresses, add_address, update_address, delete_address, get_dossiers_at_address,
+    get_change_seq, changes_since
+)
+from src.utils.write_bridge import get_write_bridge
 
 class ManageAddressesDialog(QWidget):
     addresses_modified = pyqtSignal()  # Signal for address changes
@@ -98,6 +103,11 @@ class ManageAddressesDialog(QWidget):
 
         right_layout.addLayout(buttons_layout)
 
+        # Dossiers liés à l'adresse sélectionnée (chantier ou facturation)
+        right_layout.addWidget(QLabel("Dossiers à cette adresse :"))
+        self.dossiers_list = QListWidget()
+        right_layout.addWidget(self.dossiers_list)
+
         right_widget = QWidget()
         right_widget.setLayout(right_layout)
         main_layout.addWidget(right_widget)
@@ -106,19 +116,32 @@ class ManageAddressesDialog(QWidget):
         self.load_addresses()
 
     def filter_addresses(self, query):
-        # Simple search filtering by text
+        # Recherche plein texte, insensible aux accents
+        ids = {address.id for address in search_addresses(query, None)} if query.strip() else None
         for row in range(self.table.rowCount()):
             item = self.table.item(row, 0)
-            self.table.setRowHidden(row, query.lower() not in item.text().lower())
+            self.table.setRowHidden(row, ids is not None and item.data(Qt.UserRole) not in ids)
 
     def load_addresses(self):
         """Met à jour la table des adresses"""
+        self.change_seq = get_change_seq()
         self.table.setRowCount(0)
+        self.dossiers_list.clear()
         addresses = get_addresses()
         for address in addresses:
             row_position = self.table.rowCount()
             self.table.insertRow(row_position)
-            self.table.setItem(row_position, 0, QTableWidgetItem(address[1]))
+            item = QTableWidgetItem(address.address)
+            item.setData(Qt.UserRole, address.id)
+            self.table.setItem(row_position, 0, item)
+
+    def refresh_addresses_table(self):
+        """Recharge la table seulement si des adresses ont changé depuis son chargement"""
+        feed = changes_since(self.change_seq, ('addresses',))
+        if feed.reset or feed.changes:
+            self.load_addresses()
+        else:
+            self.change_seq = feed.last_seq
 
     def on_address_selected(self):
         selected_items = self.table.selectedItems()
@@ -127,6 +150,12 @@ class ManageAddressesDialog(QWidget):
         row = selected_items[0].row()
         address_text = self.table.item(row, 0).text()
         self.selected_address_input.setText(address_text)
+        self.load_address_dossiers(self.table.item(row, 0).data(Qt.UserRole))
+
+    def load_address_dossiers(self, address_id):
+        self.dossiers_list.clear()
+        for dossier in get_dossiers_at_address(address_id):
+            self.dossiers_list.addItem(f"{dossier.numero_dossier} - {dossier.libelle_travaux}")
 
     def modify_address(self):
         selected_items = self.table.selectedItems()
@@ -135,34 +164,19 @@ class ManageAddressesDialog(QWidget):
             return
             
         row = selected_items[0].row()
-        old_address = self.table.item(row, 0).text()
         new_address = self.selected_address_input.text().strip()
         
         if not new_address:
             QMessageBox.warning(self, "Adresse vide", "Veuillez saisir une nouvelle adresse valide.")
             return
             
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            # Check if new address already exists (excluding current address)
-            cursor.execute("SELECT address FROM addresses WHERE address = ? AND address != ?", 
-                         (new_address, old_address))
-            if cursor.fetchone():
-                QMessageBox.warning(self, "Doublon", "Cette adresse existe déjà dans la base de données.")
-                return
-                
-            cursor.execute("UPDATE addresses SET address = ? WHERE address = ?", 
-                         (new_address, old_address))
-            conn.commit()
-            conn.close()
-            self.load_addresses()
-            self.selected_address_input.clear()
-            self.addresses_modified.emit()  # Emit signal after successful modification
-        except sqlite3.IntegrityError:
-            QMessageBox.warning(self, "Doublon", "Cette adresse existe déjà dans la base de données.")
-        except Exception as e:
-            QMessageBox.critical(self, "Erreur", f"Impossible de modifier l'adresse: {e}")
+        # Écriture en file : le doublon éventuel est signalé par la contrainte UNIQUE
+        address_id = self.table.item(row, 0).data(Qt.UserRole)
+        get_write_bridge().submit(
+            update_address, address_id, new_address,
+            on_done=lambda _: self.on_addresses_written(),
+            on_error=lambda error: self.on_address_write_failed(error, "Impossible de modifier l'adresse")
+        )
 
     def add_new_address(self):
         """Create a new address from the text in the right panel."""
@@ -170,25 +184,11 @@ class ManageAddressesDialog(QWidget):
         if not address_text:
             QMessageBox.warning(self, "Adresse vide", "Veuillez saisir une adresse valide.")
             return
-        try:
-            # Check if address already exists
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT address FROM addresses WHERE address = ?", (address_text,))
-            if cursor.fetchone():
-                QMessageBox.warning(self, "Doublon", "Cette adresse existe déjà dans la base de données.")
-                return
-            
-            cursor.execute("INSERT INTO addresses (address) VALUES (?)", (address_text,))
-            conn.commit()
-            conn.close()
-            self.load_addresses()
-            self.selected_address_input.clear()
-            self.addresses_modified.emit()  # Emit signal after successful addition
-        except sqlite3.IntegrityError:
-            QMessageBox.warning(self, "Doublon", "Cette adresse existe déjà dans la base de données.")
-        except Exception as e:
-            QMessageBox.critical(self, "Erreur", f"Impossible d'ajouter l'adresse: {e}")
+        get_write_bridge().submit(
+            add_address, address_text,
+            on_done=lambda _: self.on_addresses_written(),
+            on_error=lambda error: self.on_address_write_failed(error, "Impossible d'ajouter l'adresse")
+        )
 
     def remove_selected_address(self):
         selected_items = self.table.selectedItems()
@@ -204,15 +204,21 @@ class ManageAddressesDialog(QWidget):
             QMessageBox.Yes | QMessageBox.No
         )
         if confirm == QMessageBox.Yes:
-            try:
-                conn = get_connection()
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM addresses WHERE address = ?", (address_text,))
-                conn.commit()
-                conn.close()
-                self.load_addresses()
-                # Clear the selected address input field
-                self.selected_address_input.clear()
-                self.addresses_modified.emit()  # Emit signal after successful deletion
-            except Exception as e:
-                QMessageBox.critical(self, "Erreur", f"Impossible de supprimer l'adresse: {e}")
\ No newline at end of file
+            address_id = self.table.item(row, 0).data(Qt.UserRole)
+            get_write_bridge().submit(
+                delete_address, address_id,
+                on_done=lambda _: self.on_addresses_written(),
+                on_error=lambda error: self.on_address_write_failed(error, "Impossible de supprimer l'adresse")
+            )
+
+    def on_addresses_written(self):
+        """Fin d'une écriture d'adresse : recharger la table et prévenir la fenêtre principale"""
+        self.load_addresses()
+        self.selected_address_input.clear()
+        self.addresses_modified.emit()
+
+    def on_address_write_failed(self, error, message):
+        if isinstance(error, sqlite3.IntegrityError):
+            QMessageBox.warning(self, "Doublon", "Cette adresse existe déjà dans la base de données.")
+        else:
+            QMessageBox.critical(self, "Erreur", f"{message}: {error}")
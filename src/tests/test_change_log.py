@@ -0,0 +1,33 @@
+import pytest
+
+from src.database import database as db
+
+# Journal des modifications : une entrée par dossier et par enregistrement,
+# quel que soit le nombre de lignes, et toujours visible des vues qui suivent.
+
+EMPTY = db.LinesDelta([], [], [])
+FIELDS = ("2024/1", "1 rue des Lilas", "Réfection", "1 rue des Lilas", "Virement", 0, "", 0, 0)
+
+@pytest.fixture
+def dossier_id():
+    db.configure_database(':memory:')
+    db.create_tables()
+    yield db.save_dossier_changes(None, FIELDS, (0, 0), EMPTY, EMPTY)
+    db.configure_database()
+
+def dossier_changes(seq=0):
+    return [(c.row_id, c.op) for c in db.changes_since(seq, tables=('dossiers',)).changes]
+
+def test_one_entry_for_a_bulk_line_save(dossier_id):
+    seq = db.get_change_seq()
+    lines = [(f"Ligne {n}", "1", 100, 0, "ml") for n in range(500)]
+    db.save_dossier_changes(dossier_id, FIELDS, (0, 0), db.LinesDelta(lines, [], []), db.LinesDelta(lines, [], []))
+    assert dossier_changes(seq) == [(dossier_id, 'update')]
+    assert dossier_changes() == [(dossier_id, 'insert'), (dossier_id, 'update')]
+
+def test_update_after_read_is_seen(dossier_id):
+    db.update_document_generated(dossier_id, 'devis', True)
+    seq = db.get_change_seq()
+    assert dossier_changes(seq) == []
+    db.update_document_generated(dossier_id, 'facture', True)
+    assert dossier_changes(seq) == [(dossier_id, 'update')]
@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+from src.database import database as db
+
+# Lectures du thread principal pendant une écriture du thread d'écriture :
+# elles voient la dernière version validée, sans erreur ni attente, y compris
+# sur une base ':memory:'.
+
+EMPTY = db.LinesDelta([], [], [])
+
+@pytest.fixture(params=[':memory:', ':temp:'])
+def dossier_id(request):
+    db.configure_database(request.param)
+    db.create_tables()
+    yield db.save_dossier_changes(
+        None, ("2024/1", "1 rue des Lilas", "Réfection", "1 rue des Lilas", "Virement", 0, "", 0, 0), (0, 0),
+        EMPTY, EMPTY
+    )
+    db.configure_database()
+
+def test_reads_during_background_write(dossier_id):
+    written = threading.Event()
+    release = threading.Event()
+
+    def write():
+        # Transaction gardée ouverte tant que le test lit
+        with db.transaction(immediate=True):
+            lines = [(f"Ligne {n}", "1", 100, 0, "ml") for n in range(1500)]
+            db.apply_lines_delta(dossier_id, db.LinesDelta(lines, [], []), EMPTY)
+            written.set()
+            release.wait(10)
+
+    future = db.submit_write(write)
+    try:
+        assert written.wait(10)
+        snapshot = db.get_dossier_full(dossier_id)
+        page = db.list_dossiers_page()
+    finally:
+        release.set()
+    future.result(10)
+
+    # Pas encore validé : le dossier est lu sans ses nouvelles lignes
+    assert snapshot is not None and snapshot.produits == ()
+    assert [dossier.id for dossier in page.items] == [dossier_id]
+    assert len(db.get_dossier_full(dossier_id).produits) == 1500
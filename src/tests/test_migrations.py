@@ -0,0 +1,32 @@
+import sqlite3
+
+from src.database.migrations import MIGRATIONS, SCHEMA_VERSION, migrate
+
+# Mise à niveau d'une base existante, arrêtée à une version donnée.
+
+def database_at(version):
+    conn = sqlite3.connect(':memory:', isolation_level=None)
+    for target, migration in MIGRATIONS:
+        if target > version:
+            break
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')
+        migration(cursor)
+        cursor.execute(f'PRAGMA user_version = {target}')
+        cursor.execute('COMMIT')
+    return conn
+
+def test_addresses_trimmed_in_dossiers():
+    conn = database_at(10)
+    conn.execute('''
+        INSERT INTO dossiers (numero_dossier, adresse_chantier, adresse_facturation)
+        VALUES ('2024/1', ' 5 place X ', '5 place X'), ('2024/2', NULL, '  ')
+    ''')
+    migrate(conn)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+    rows = conn.execute('''
+        SELECT d.adresse_chantier, d.adresse_facturation, a.address
+        FROM dossiers d LEFT JOIN addresses a ON a.id = d.adresse_chantier_id
+        ORDER BY d.id
+    ''').fetchall()
+    assert rows == [('5 place X', '5 place X', '5 place X'), (None, '', None)]
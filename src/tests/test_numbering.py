@@ -0,0 +1,37 @@
+import pytest
+
+from src.database import database as db
+from src.database.numbering import MAX_NUMBER_GAP
+
+# Numéros saisis trop loin du dernier attribué : refusés à la création comme
+# à la modification, sans rien écrire.
+
+EMPTY = db.LinesDelta([], [], [])
+
+def fields(numero):
+    return (numero, "1 rue des Lilas", "Réfection", "1 rue des Lilas", "Virement", 0, "", 0, 0)
+
+@pytest.fixture
+def dossier_id():
+    db.configure_database(':memory:')
+    db.create_tables()
+    yield db.save_dossier_changes(None, fields("2024/3"), (0, 0), EMPTY, EMPTY)
+    db.configure_database()
+
+def free_numbers():
+    return db.get_connection().execute('SELECT count(*) FROM numeros_libres').fetchone()[0]
+
+def test_new_dossier_far_above_last_number(dossier_id):
+    with pytest.raises(ValueError, match="2024/3"):
+        db.save_dossier_changes(None, fields(f"2024/{4 + MAX_NUMBER_GAP}"), (0, 0), EMPTY, EMPTY)
+    assert free_numbers() == 2
+
+def test_renumbered_dossier_far_above_last_number(dossier_id):
+    with pytest.raises(ValueError, match="2024/3"):
+        db.save_dossier_changes(dossier_id, fields("2024/1500"), (0, 0), EMPTY, EMPTY)
+    assert db.get_dossier(dossier_id).numero_dossier == "2024/3"
+    assert free_numbers() == 2
+
+def test_gap_within_limit_frees_skipped_numbers(dossier_id):
+    db.save_dossier_changes(dossier_id, fields(f"2024/{3 + MAX_NUMBER_GAP}"), (0, 0), EMPTY, EMPTY)
+    assert free_numbers() == MAX_NUMBER_GAP + 2
@@ -0,0 +1,82 @@
+import pytest
+
+from src.database import database as db
+from src.database.numbering import rebuild_numbering, release_number
+
+# Plans des requêtes fréquentes (liste, recherche, numérotation), lus par
+# EXPLAIN QUERY PLAN sur les requêtes réellement exécutées : chacune doit
+# passer par un index, jamais par un parcours complet de dossiers.
+
+@pytest.fixture(scope='module')
+def conn():
+    db.configure_database(':memory:')
+    db.create_tables()
+    for numero in range(1, 6):
+        db.add_dossier(f"2024/{numero}", "1 rue des Lilas", "Réfection toiture", "1 rue des Lilas",
+                       "Virement", 0, "", 0, 0)
+    yield db.get_connection()
+    db.configure_database()
+
+def executed(conn, func, *args, table='dossiers', **kwargs):
+    """Requêtes de func portant sur table (hors requêtes internes de FTS5)"""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        func(*args, **kwargs)
+    finally:
+        conn.set_trace_callback(None)
+    return [sql for sql in statements if not sql.lstrip().startswith('--') and table in sql]
+
+def plan(conn, sql):
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+
+def assert_indexed(conn, statements, index=None):
+    """Aucun parcours complet de dossiers ; index (idx_...) utilisé si précisé"""
+    assert statements
+    for sql in statements:
+        details = plan(conn, sql)
+        # "SCAN main.dossiers" ou "SCAN d" (alias) sans "USING ... INDEX"
+        scans = [d for d in details
+                 if d.startswith('SCAN ') and 'USING' not in d and d.split()[1].split('.')[-1] in ('dossiers', 'd')]
+        assert not scans, (sql, details)
+        if index:
+            assert any(f'INDEX {index}' in d for d in details), (sql, details)
+
+def test_list_first_page(conn):
+    assert_indexed(conn, executed(conn, db.list_dossiers_page, limit=2), 'idx_dossiers_annee_numero')
+
+def test_list_next_page(conn):
+    page = db.list_dossiers_page(limit=2)
+    statements = executed(conn, db.list_dossiers_page, page.next_key, limit=2)
+    assert_indexed(conn, statements, 'idx_dossiers_annee_numero')
+
+def test_list_year_filter(conn):
+    statements = executed(conn, db.list_dossiers_page, limit=2, filters={'annee': 2024})
+    assert_indexed(conn, statements, 'idx_dossiers_annee_numero')
+
+def test_list_search_filter(conn):
+    statements = executed(conn, db.list_dossiers_page, limit=2, filters={'search': 'toiture'})
+    assert_indexed(conn, statements)
+
+def test_search(conn):
+    assert_indexed(conn, executed(conn, db.search, 'toiture'))
+
+def test_lookup_by_numero(conn):
+    statements = executed(conn, db.get_dossier_id_by_numero, '2024/3')
+    assert_indexed(conn, statements, 'idx_dossiers_numero')
+
+def test_lines_by_dossier(conn):
+    for table, index in (('produits', 'idx_produits_dossier_id'), ('options', 'idx_options_dossier_id')):
+        statements = executed(conn, db.get_dossier_full, 1, table=f'.{table}')
+        assert len(statements) == 1, statements
+        assert_indexed(conn, statements, index)
+
+def test_release_number(conn):
+    with db.transaction() as cursor:
+        statements = executed(conn, release_number, cursor, '2024/3')
+    assert_indexed(conn, statements, 'idx_dossiers_annee_numero')
+
+def test_rebuild_numbering(conn):
+    with db.transaction() as cursor:
+        statements = executed(conn, rebuild_numbering, cursor)
+    assert_indexed(conn, statements, 'idx_dossiers_annee_numero')
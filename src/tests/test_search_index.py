@@ -0,0 +1,37 @@
+import pytest
+
+from src.database import database as db
+
+# Désignations des lignes dans l'index plein texte : réindexées à chaque
+# écriture de lignes, sans trigger par ligne.
+
+EMPTY = db.LinesDelta([], [], [])
+
+@pytest.fixture
+def dossier_id():
+    db.configure_database(':memory:')
+    db.create_tables()
+    yield db.save_dossier_changes(
+        None, ("2024/1", "1 rue des Lilas", "Réfection", "1 rue des Lilas", "Virement", 0, "", 0, 0), (0, 0),
+        db.LinesDelta([("Gouttière zinc", "2", 1500, 0, "ml")], [], []), EMPTY
+    )
+    db.configure_database()
+
+def test_inserted_lines_indexed(dossier_id):
+    assert db.search_dossier_ids('zinc') == {dossier_id}
+
+def test_updated_and_deleted_lines_reindexed(dossier_id):
+    produit = db.get_produits(dossier_id)[0]
+    db.apply_lines_delta(dossier_id, db.LinesDelta([], [(produit.id, ("Gouttière cuivre", "2", 1500, 0, "ml"))], []), EMPTY)
+    assert db.search_dossier_ids('zinc') == set()
+    assert db.search_dossier_ids('cuivre') == {dossier_id}
+
+    db.apply_lines_delta(dossier_id, EMPTY, db.LinesDelta([("Option ardoise", "1", 900, 0, "aucune")], [], []))
+    db.apply_lines_delta(dossier_id, db.LinesDelta([], [], [produit.id]), EMPTY)
+    assert db.search_dossier_ids('cuivre') == set()
+    assert db.search_dossier_ids('ardoise') == {dossier_id}
+
+def test_line_save_does_not_trigger_reindex_per_line(dossier_id):
+    conn = db.get_connection()
+    triggers = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    assert not {name for name in triggers if name.startswith(('produits_fts', 'options_fts'))}
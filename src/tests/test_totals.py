@@ -0,0 +1,45 @@
+import pytest
+
+from src.database import database as db
+
+# Totaux des dossiers tenus par différence : toujours égaux à la somme des lignes.
+
+EMPTY = db.LinesDelta([], [], [])
+
+@pytest.fixture
+def dossier_id():
+    db.configure_database(':memory:')
+    db.create_tables()
+    lines = [(f"Ligne {n}", "2", 1250 + n, 10, "ml") for n in range(20)]
+    yield db.save_dossier_changes(
+        None, ("2024/1", "1 rue des Lilas", "Réfection", "1 rue des Lilas", "Virement", 0, "", 0, 0), (0, 0),
+        db.LinesDelta(lines, [], []), db.LinesDelta(lines[:3], [], [])
+    )
+    db.configure_database()
+
+def assert_totals(dossier_id):
+    snapshot = db.get_dossier_full(dossier_id)
+    dossier = snapshot.dossier
+    assert dossier.total_ht_cents == sum(p.montant_brut_cents for p in snapshot.produits)
+    assert dossier.total_remise_cents == sum(p.remise_cents for p in snapshot.produits)
+    assert dossier.total_options_cents == sum(o.montant_brut_cents for o in snapshot.options)
+    assert dossier.total_remise_options_cents == sum(o.remise_cents for o in snapshot.options)
+
+def test_totals_after_insert(dossier_id):
+    assert_totals(dossier_id)
+    assert db.get_dossier_full(dossier_id).dossier.total_ht_cents > 0
+
+def test_totals_after_update_and_delete(dossier_id):
+    produits = db.get_produits(dossier_id)
+    options = db.get_options(dossier_id)
+    db.apply_lines_delta(
+        dossier_id,
+        db.LinesDelta([("Nouvelle", "1,5", 999, 0, "aucune")], [(produits[0].id, ("Modifiée", "3", 2000, 250, "ml"))],
+                      [produits[1].id, produits[2].id]),
+        db.LinesDelta([], [], [options[0].id])
+    )
+    assert_totals(dossier_id)
+
+    db.replace_dossier_lines(dossier_id, [], [])
+    assert_totals(dossier_id)
+    assert db.get_dossier_full(dossier_id).dossier.total_ht_cents == 0